@@ -317,6 +317,9 @@ bullet("""defaultPageSize: set this to one of the values defined in reportlab/li
 it is set to pagesizes.A4; other values are pagesizes.letter etc.""")
 bullet("""defaultImageCaching: set to zero to inhibit the creation of .a85 files on your
 hard-drive. The default is to create these preprocessed PDF compatible image files for faster loading""")
+bullet("""imageXObjectCacheDir: set to a directory to keep encoded images there between runs, keyed on
+image content, instead of in .a85 files; the directory may be shared by several processes.
+imageXObjectCacheSize limits the bytes it may hold.""")
 bullet("""T1SearchPath: this is a python list of strings representing directories that
 may be queried for information on Type 1 fonts""")
 bullet("""TTFSearchPath: this is a python list of strings representing directories that
@@ -42,17 +42,17 @@ from reportlab.lib import normalDate
 from reportlab.graphics.shapes import Drawing, Line, PolyLine, Group, STATE_DEFAULTS, _textBoxLimits, _rotatedBoxLimits
 from reportlab.graphics.widgetbase import Widget, TypedPropertyCollection
 from reportlab.graphics.charts.textlabels import Label
-from reportlab.graphics.charts.utils import nextRoundNumber
+from reportlab.graphics.charts.utils import nextRoundNumber, scaleLinear, dataColumn, isNumpyArray
 
 # Helpers.
 def _findMinMaxValue(V, x, default, func, special=None):
-    if isinstance(V[0][0],_SequenceTypes):
+    if isinstance(V[0][0],_SequenceTypes) or isNumpyArray(V[0][0]):
         if special:
             f=lambda T,x=x,special=special,func=func: special(T,x,func)
+            V=map(lambda e,f=f: map(f,e),V)
         else:
-            f=lambda T,x=x: T[x]
-        V=map(lambda e,f=f: map(f,e),V)
-    V = filter(len,map(lambda x: filter(lambda x: x is not None,x),V))
+            V=[dataColumn(e,x) for e in V]
+    V = filter(len,[[v for v in e if v is not None] for e in V])
     if len(V)==0: return default
     return func(map(func,V))
 
@@ -270,6 +270,24 @@ class CategoryAxis(_AxisG):
         if self.reverseDirection: idx = self._catCount-idx-1
         return idx
 
+    def _scaleIndices(self,indices):
+        "_scale for a whole sequence (or numpy array) of indices"
+        if self.reverseDirection:
+            n = self._catCount-1
+            if isNumpyArray(indices): return n-indices
+            return [n-idx for idx in indices]
+        return indices
+
+    def scaleIndices(self,indices):
+        """The positions of a whole sequence of category indices at once.
+
+        The same as [self.scale(i)[0] for i in indices] (every category has
+        the same width), but for the standard axes one batched transform.
+        """
+        scale = self.scale
+        if getattr(scale,'im_func',None) not in _categoryScales: return [scale(i)[0] for i in indices]
+        return scaleLinear(self._scaleIndices(indices),(self._x,self._y)[self._dataIndex],self._barWidth,0)
+
 def _assertYAxis(axis):
     assert axis.isYAxis, "Cannot connect to other axes (%s), but Y- ones." % axis.__class__.__name__
 def _assertXAxis(axis):
@@ -680,6 +698,18 @@ class ValueAxis(_AxisG):
         self._calcScaleFactor()
         self._configured = 1
 
+    def scaleValues(self, values):
+        """Scale a whole sequence of values at once.
+
+        The same as map(self.scale, values), but for the standard linear
+        axes it is one batched transform; a numpy array gives back a
+        numpy array. Axes which override scale are called per value.
+        """
+        scale = self.scale
+        if getattr(scale,'im_func',None) not in _linearScales: return map(scale,values)
+        assert self._configured, "Axis cannot scale numbers before it is configured"
+        return scaleLinear(values,(self._x,self._y)[self._dataIndex],self._scaleFactor,self._valueMin)
+
     def _getValueStepAndTicks(self, valueMin, valueMax,cache={}):
         try:
             K = (valueMin,valueMax)
@@ -1439,6 +1469,9 @@ class YValueAxis(_YTicks,ValueAxis):
         g.add(axis)
         return g
 
+_linearScales = (XValueAxis.scale.im_func, YValueAxis.scale.im_func)
+_categoryScales = (XCategoryAxis.scale.im_func, YCategoryAxis.scale.im_func)
+
 class AdjYValueAxis(YValueAxis):
     """A Y-axis applying additional rules.
 
@@ -261,7 +261,10 @@ class BarChart(PlotArea):
 
         COLUMNS = range(max(map(len,data)))
         if useAbsolute:
-            _cScale = cA._scale
+            catPos = [groupWidth*idx+org for idx in cA._scaleIndices(COLUMNS)]
+        else:
+            catPos = cA.scaleIndices(COLUMNS)
+        parallel = style in ('parallel','parallel_3d')
 
         self._normFactor = normFactor
         width = self.barWidth*normFactor
@@ -274,28 +277,28 @@ class BarChart(PlotArea):
             else:
                 xVal = rowNo
             xVal = 0.5*groupSpacing+xVal*bGap
+            if not useAbsolute: xVal = normFactor*xVal
+            row = data[rowNo]
+            if parallel:
+                #scale the whole row in one go
+                YV = vA.scaleValues(row)
             for colNo in COLUMNS:
-                datum = data[rowNo][colNo]
-
-                # Ufff...
-                if useAbsolute:
-                    x = groupWidth*_cScale(colNo) + xVal + org
-                else:
-                    (g, gW) = cScale(colNo)
-                    x = g + normFactor*xVal
+                datum = row[colNo]
+                x = catPos[colNo] + xVal
 
                 if datum is None:
                     height = None
                     y = baseLine
                 else:
-                    if style not in ('parallel','parallel_3d'):
+                    if parallel:
+                        y = baseLine
+                        height = YV[colNo] - y
+                    else:
                         y = vScale(accum[colNo])
                         if y<baseLine: y = baseLine
                         accum[colNo] = accum[colNo] + datum
                         datum = accum[colNo]
-                    else:
-                        y = baseLine
-                    height = vScale(datum) - y
+                        height = vScale(datum) - y
                     if -1e-8<height<=1e-8:
                         height = 1e-8
                         if datum<-1e-8: height = -1e-8
@@ -218,18 +218,16 @@ class HorizontalLineChart(LineChart):
             availWidth = self.categoryAxis.scale(0)[1]
             normFactor = availWidth / normWidth
 
+        #the category positions are shared by all rows, each row's values are scaled in one batch
+        catPos = self.categoryAxis.scaleIndices(range(self._rowLength))
+        xOffset = 0.5 * self.groupSpacing * normFactor
+        vA = self.valueAxis
+        y = vA.scale(0)
         self._positions = []
-        for rowNo in range(len(self.data)):
-            lineRow = []
-            for colNo in range(len(self.data[rowNo])):
-                datum = self.data[rowNo][colNo]
-                if datum is not None:
-                    (groupX, groupWidth) = self.categoryAxis.scale(colNo)
-                    x = groupX + (0.5 * self.groupSpacing * normFactor)
-                    y = self.valueAxis.scale(0)
-                    height = self.valueAxis.scale(datum) - y
-                    lineRow.append((x, y+height))
-            self._positions.append(lineRow)
+        for row in self.data:
+            C = [colNo for colNo in xrange(len(row)) if row[colNo] is not None]
+            Y = vA.scaleValues([row[colNo] for colNo in C])
+            self._positions.append([(catPos[colNo]+xOffset, y+(v-y)) for colNo, v in zip(C,Y)])
 
 
     def _innerDrawLabel(self, rowNo, colNo, x, y):
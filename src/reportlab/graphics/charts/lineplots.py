@@ -94,6 +94,8 @@ class LinePlot(AbstractLineChart):
         annotations = AttrMapValue(None, desc='list of callables, will be called with self, xscale, yscale.'),
         behindAxes = AttrMapValue(isBoolean, desc='If true use separate line group.'),
         gridFirst = AttrMapValue(isBoolean, desc='If true use draw grids before axes.'),
+        decimate = AttrMapValue(OneOf(None,'minmax','douglas-peucker'), desc='If set thin out the drawn lines and symbols; minmax keeps the first, last, lowest and highest points in each decimateTolerance wide column, douglas-peucker drops points within decimateTolerance of the simplified line.'),
+        decimateTolerance = AttrMapValue(isNumber, desc='Decimation resolution in points; symbols and labels are drawn once per square of this size.'),
         )
 
     def __init__(self):
@@ -136,6 +138,8 @@ class LinePlot(AbstractLineChart):
         self.annotations = []
         self.behindAxes = 0
         self.gridFirst = 0
+        self.decimate = None
+        self.decimateTolerance = 0.5
 
     def demo(self):
         """Shows basic use of a line chart."""
@@ -186,18 +190,26 @@ class LinePlot(AbstractLineChart):
         self._seriesCount = len(self.data)
         self._rowLength = max(map(len,self.data))
 
+        #each series is scaled in one batch per axis
         self._positions = []
-        for rowNo in range(len(self.data)):
-            line = []
-            for colNo in range(len(self.data[rowNo])):
-                datum = self.data[rowNo][colNo] # x,y value
-                if type(datum[0]) == type(''):
-                    x = self.xValueAxis.scale(mktime(mkTimeTuple(datum[0])))
-                else:
-                    x = self.xValueAxis.scale(datum[0])
-                y = self.yValueAxis.scale(datum[1])
-                line.append((x, y))
-            self._positions.append(line)
+        for row in self.data:
+            self._positions.append(zip(self._scaleX(dataColumn(row,0)),self._scaleY(dataColumn(row,1))))
+
+    def _scaleX(self,X):
+        "the x positions of a column of x values (which may be date strings)"
+        if not isNumpyArray(X) and StringType in map(type,X):
+            X = list(X)
+            for i in xrange(len(X)):
+                if type(X[i]) is StringType: X[i] = mktime(mkTimeTuple(X[i]))
+        X = self.xValueAxis.scaleValues(X)
+        if isNumpyArray(X): X = X.tolist()
+        return X
+
+    def _scaleY(self,Y):
+        "the y positions of a column of y values"
+        Y = self.yValueAxis.scaleValues(Y)
+        if isNumpyArray(Y): Y = Y.tolist()
+        return Y
 
     def _innerDrawLabel(self, rowNo, colNo, x, y):
         "Draw a label for a given item in the list."
@@ -258,9 +270,19 @@ class LinePlot(AbstractLineChart):
             inFillX1 = inFillX0 + self.xValueAxis._length
             inFillG = getattr(self,'_inFillG',g)
         lG = getattr(self,'_lineG',g)
+        decimate = getattr(self,'decimate',None)
+        if decimate:
+            tolerance = self.decimateTolerance
+            decimate = decimate=='minmax' and decimateMinMax or decimateDouglasPeucker
         # Iterate over data rows.
         for rowNo in P:
             row = self._positions[rowNo]
+            if decimate:
+                lineRow = [row[i] for i in decimate(row,tolerance)]
+                C = decimateCells(row,tolerance)
+            else:
+                lineRow = row
+                C = xrange(len(row))
             rowStyle = self.lines[rowNo % styleCount]
             rowColor = rowStyle.strokeColor
             dash = getattr(rowStyle, 'strokeDashArray', None)
@@ -275,8 +297,9 @@ class LinePlot(AbstractLineChart):
             # Iterate over data columns.
             if self.joinedLines:
                 points = []
-                for xy in row:
-                    points = points + [xy[0], xy[1]]
+                for xy in lineRow:
+                    points.append(xy[0])
+                    points.append(xy[1])
                 if inFill or getattr(rowStyle,'inFill',False):
                     fpoints = [inFillX0,inFillY] + points + [inFillX1,inFillY]
                     filler = getattr(rowStyle, 'filler', None)
@@ -300,10 +323,9 @@ class LinePlot(AbstractLineChart):
                 uSymbol = None
 
             if uSymbol:
-                j = -1
                 if bubblePlot: drow = self.data[rowNo]
-                for xy in row:
-                    j += 1
+                for j in C:
+                    xy = row[j]
                     symbol = uSymbol2Symbol(uSymbol,xy[0],xy[1],rowColor)
                     if symbol:
                         if bubblePlot:
@@ -311,7 +333,7 @@ class LinePlot(AbstractLineChart):
                         g.add(symbol)
 
             # Draw data labels.
-            for colNo in range(len(row)):
+            for colNo in C:
                 x1, y1 = row[colNo]
                 self.drawLabel(g, rowNo, colNo, x1, y1)
 
@@ -738,19 +760,33 @@ class AreaLinePlot(LinePlot):
     def draw(self):
         try:
             odata = self.data
-            n = len(odata)
-            m = len(odata[0])
-            S = n*[0]
-            self.data = []
-            for i in xrange(1,m):
-                D = []
-                for j in xrange(n):
-                    S[j] = S[j] + odata[j][i]
-                    D.append((odata[j][0],S[j]))
-                self.data.append(D)
+            #stack the columns a whole column at a time
+            X = dataColumn(odata,0)
+            S = None
+            stacked = []
+            for i in xrange(1,len(odata[0])):
+                Y = dataColumn(odata,i)
+                if S is None:
+                    S = Y
+                elif isNumpyArray(S):
+                    S = S+Y
+                else:
+                    S = [s+y for s,y in zip(S,Y)]
+                stacked.append(S)
+            self._stacked = X, stacked
+            self.data = [zip(X,S) for S in stacked]
             return LinePlot.draw(self)
         finally:
             self.data = odata
+            self.__dict__.pop('_stacked',None)
+
+    def calcPositions(self):
+        "as LinePlot.calcPositions, but the x values shared by every stacked series are scaled once"
+        self._seriesCount = len(self.data)
+        self._rowLength = max(map(len,self.data))
+        X, stacked = self._stacked
+        X = self._scaleX(X)
+        self._positions = [zip(X,self._scaleY(S)) for S in stacked]
 
 class SplitLinePlot(AreaLinePlot):
     def __init__(self):
@@ -225,3 +225,97 @@ def maverage(data,n=6):
 
 def pairMaverage(data,n=6):
     return [(x[0],s) for x,s in zip(data, maverage([x[1] for x in data],n))]
+
+def decimateMinMax(P,width):
+    '''return the indices of the points of polyline P (a sequence of (x,y))
+    needed to draw it at resolution width. For each run of consecutive points
+    falling in the same width wide column the first, last, lowest and highest
+    are kept so the drawn envelope is unchanged.'''
+    n = len(P)
+    if n<5 or width<=0: return range(n)
+    R = []
+    i = 0
+    while i<n:
+        c = floor(P[i][0]/width)
+        lo = hi = i
+        ylo = yhi = P[i][1]
+        j = i+1
+        while j<n:
+            x, y = P[j]
+            if floor(x/width)!=c: break
+            if y<ylo: ylo, lo = y, j
+            elif y>yhi: yhi, hi = y, j
+            j += 1
+        K = {i:1, lo:1, hi:1, j-1:1}.keys()
+        K.sort()
+        R.extend(K)
+        i = j
+    return R
+
+def decimateDouglasPeucker(P,tolerance):
+    '''return the indices of the points of polyline P (a sequence of (x,y))
+    kept by Douglas-Peucker simplification; no dropped point is further
+    than tolerance from the simplified line.'''
+    n = len(P)
+    if n<3 or tolerance<=0: return range(n)
+    keep = [0]*n
+    keep[0] = keep[-1] = 1
+    t2 = tolerance*tolerance
+    S = [(0,n-1)]
+    while S:
+        a, b = S.pop()
+        xa, ya = P[a]
+        dx = P[b][0]-xa
+        dy = P[b][1]-ya
+        d2 = dx*dx+dy*dy
+        m = 0
+        k = a
+        for i in xrange(a+1,b):
+            x, y = P[i]
+            x -= xa
+            y -= ya
+            if d2:
+                e = x*dy-y*dx
+                e = e*e/d2
+            else:
+                e = x*x+y*y
+            if e>m: m, k = e, i
+        if m>t2:
+            keep[k] = 1
+            if k-a>1: S.append((a,k))
+            if b-k>1: S.append((k,b))
+    return [i for i in xrange(n) if keep[i]]
+
+def decimateCells(P,size):
+    '''return the indices of the first of the points P (a sequence of (x,y))
+    in each size x size cell; used to thin overlapping markers'''
+    if size<=0: return range(len(P))
+    seen = {}
+    R = []
+    for i in xrange(len(P)):
+        x, y = P[i]
+        k = floor(x/size), floor(y/size)
+        if k not in seen:
+            seen[k] = 1
+            R.append(i)
+    return R
+
+def isNumpyArray(v):
+    "true if v is a numpy array; numpy is only imported once something from it turns up"
+    if string.split(getattr(type(v),'__module__',''),'.')[0]!='numpy': return False
+    import numpy
+    return isinstance(v,numpy.ndarray)
+
+def scaleLinear(values,origin,factor,valueMin):
+    '''return origin+factor*(v-valueMin) for each of values in one batch;
+    None counts as 0. A numpy array gives a numpy array back, anything
+    else (eg a list or array.array) gives a list.'''
+    if isNumpyArray(values):
+        return origin+factor*(values-valueMin)
+    return [origin+factor*((v or 0)-valueMin) for v in values]
+
+def dataColumn(series,i):
+    "return the i'th value of each point in series as a list (or numpy array)"
+    if isNumpyArray(series) and len(series.shape)==2:
+        return series[:,i]
+    return [p[i] for p in series]
@@ -16,17 +16,79 @@ changed
 """
 
 from reportlab.graphics.shapes import *
+from reportlab.graphics.shapes import _PATH_OP_ARG_COUNT
 from reportlab.pdfgen.canvas import Canvas
 from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.lib.utils import getStringIO
 from reportlab import rl_config
-from renderbase import Renderer, StateTracker, getStateDelta, renderScaledDrawing
+from renderbase import Renderer, StateTracker, getStateDelta, renderScaledDrawing, _expandUserNode
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5
+_PATH_OPS = 'mlch'   #pdf path operators for shapes' _MOVETO, _LINETO, _CURVETO & _CLOSEPATH
 
 # the main entry point for users...
 def draw(drawing, canvas, x, y, showBoundary=rl_config._unset_):
     """As it says"""
-    R = _PDFRenderer()
-    R.draw(renderScaledDrawing(drawing), canvas, x, y, showBoundary=showBoundary)
+    formCache = getattr(drawing,'formCache',0)
+    if formCache and hasattr(canvas,'beginForm'):
+        drawCachedForm(drawing, canvas, x, y, showBoundary=showBoundary, key=formCache)
+    else:
+        R = _PDFRenderer()
+        R.draw(renderScaledDrawing(drawing), canvas, x, y, showBoundary=showBoundary)
+
+def drawingKey(drawing, canvas=None):
+    """Structural hash of the shape tree of a drawing.
+    Widgets are expanded as they would be when rendering so two drawings
+    with the same key produce the same PDF operators."""
+    h = md5()
+    drawing = renderScaledDrawing(drawing)
+    if canvas is not None: canvas.__dict__['_drawing'] = drawing
+    try:
+        P = [drawing]
+        while P:
+            node = _expandUserNode(P.pop(),canvas)
+            h.update(node.__class__.__name__)
+            items = node.__dict__.items()
+            items.sort()
+            for k, v in items:
+                if k[0]=='_' or k=='contents' or isinstance(v,(Shape,UserNode)): continue
+                h.update('%s=%r;' % (k,v))
+            if isinstance(node,Group):
+                #visit the children in drawing order; widgets may depend on that
+                C = list(node.getContents())
+                h.update('[%d]' % len(C))
+                C.reverse()
+                P.extend(C)
+    finally:
+        if canvas is not None: del canvas._drawing
+    return h.hexdigest()
+
+def drawCachedForm(drawing, canvas, x, y, showBoundary=rl_config._unset_, key=1):
+    """Draw a drawing via a form XObject which is rendered only once per
+    document.  key may be a string identifying the drawing's content,
+    otherwise the structural hash from drawingKey is used."""
+    d = renderScaledDrawing(drawing)
+    if not isinstance(key,basestring): key = drawingKey(d,canvas)
+    name = 'Drawing.'+md5(key).hexdigest()
+    if not canvas.hasForm(name):
+        bounds = [0, 0, d.width, d.height]
+        try:
+            b = d.getBounds()
+        except:
+            b = None
+        if b:
+            bounds = [min(bounds[0],b[0]),min(bounds[1],b[1]),max(bounds[2],b[2]),max(bounds[3],b[3])]
+        canvas.beginForm(name,*bounds)
+        _PDFRenderer().draw(d, canvas, 0, 0, showBoundary=0)
+        canvas.endForm()
+    if showBoundary is rl_config._unset_: showBoundary=rl_config.showBoundary
+    if showBoundary: canvas.rect(x, y, d.width, d.height)
+    canvas.saveState()
+    canvas.translate(x, y)
+    canvas.doForm(name)
+    canvas.restoreState()
 
 class _PDFRenderer(Renderer):
     """This draws onto a PDF document.  It needs to be a class
@@ -47,16 +109,20 @@ class _PDFRenderer(Renderer):
             self._canvas.saveState()
 
         #apply state changes
-        deltas = getStateDelta(node)
-        self._tracker.push(deltas)
-        self.applyStateChanges(deltas, {})
+        deltas = self._tracker.push(getStateDelta(node))
+        if deltas: self.applyStateChanges(deltas, {})
 
         #draw the object, or recurse
         self.drawNodeDispatcher(node)
 
-        self._tracker.pop()
+        rDeltas = self._tracker.pop()
         if not (isinstance(node, Path) and node.isClipPath):
             self._canvas.restoreState()
+            #Q restores the canvas, but not our stroke/fill flags
+            if rDeltas.has_key('strokeColor'): self._stroke = rDeltas['strokeColor'] is not None
+            if rDeltas.has_key('fillColor'): self._fill = rDeltas['fillColor'] is not None
+        elif rDeltas:
+            self.applyStateChanges(rDeltas, {})
 
     def drawRect(self, rect):
         if rect.rx == rect.ry == 0:
@@ -77,13 +143,31 @@ class _PDFRenderer(Renderer):
                     stroke=self._stroke
                     )
 
+    def drawRectBatch(self, batch):
+        #one path for the lot
+        if self._stroke or self._fill:
+            path = self._canvas.beginPath()
+            rect = path.rect
+            for x, y, width, height in batch.getRects():
+                rect(x, y, width, height)
+            self._canvas.drawPath(path, stroke=self._stroke, fill=self._fill)
+
+    def drawCircleBatch(self, batch):
+        if self._stroke or self._fill:
+            path = self._canvas.beginPath()
+            circle = path.circle
+            for cx, cy, r in batch.getCircles():
+                circle(cx, cy, r)
+            self._canvas.drawPath(path, stroke=self._stroke, fill=self._fill)
+
     def drawImage(self, image):
         # currently not implemented in other renderers
         if image.path and os.path.exists(image.path):
             self._canvas.drawInlineImage(
                     image.path,
                     image.x, image.y,
-                    image.width, image.height
+                    image.width, image.height,
+                    maxDPI=getattr(image,'maxDPI',None),
                     )
 
     def drawLine(self, line):
@@ -100,11 +184,8 @@ class _PDFRenderer(Renderer):
     def drawPolyLine(self, polyline):
         if self._stroke:
             assert len(polyline.points) >= 2, 'Polyline must have 2 or more points'
-            head, tail = polyline.points[0:2], polyline.points[2:],
             path = self._canvas.beginPath()
-            path.moveTo(head[0], head[1])
-            for i in range(0, len(tail), 2):
-                path.lineTo(tail[i], tail[i+1])
+            path.addPoints(polyline.points)
             self._canvas.drawPath(path)
 
     def drawWedge(self, wedge):
@@ -138,11 +219,8 @@ class _PDFRenderer(Renderer):
 
     def drawPolygon(self, polygon):
         assert len(polygon.points) >= 2, 'Polyline must have 2 or more points'
-        head, tail = polygon.points[0:2], polygon.points[2:],
         path = self._canvas.beginPath()
-        path.moveTo(head[0], head[1])
-        for i in range(0, len(tail), 2):
-            path.lineTo(tail[i], tail[i+1])
+        path.addPoints(polygon.points)
         path.close()
         self._canvas.drawPath(
                             path,
@@ -168,10 +246,16 @@ class _PDFRenderer(Renderer):
             self._canvas.drawText(t)
 
     def drawPath(self, path):
-        from reportlab.graphics.shapes import _renderPath
         pdfPath = self._canvas.beginPath()
-        drawFuncs = (pdfPath.moveTo, pdfPath.lineTo, pdfPath.curveTo, pdfPath.close)
-        isClosed = _renderPath(path, drawFuncs)
+        #the operator codes are the indices of _PATH_OPS
+        ops = ''.join(map(_PATH_OPS.__getitem__, path.operators))
+        if ops:
+            #any points beyond those the operators use are ignored
+            points = path.points
+            n = sum(map(_PATH_OP_ARG_COUNT.__getitem__, path.operators))
+            if n<len(points): points = points[:n]
+            pdfPath.addPoints(points, ops)
+        isClosed = ops.count('m')==ops.count('h')
         if isClosed:
             fill = self._fill
         else:
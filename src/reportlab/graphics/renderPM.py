@@ -16,13 +16,13 @@ from reportlab.graphics.shapes import *
 from reportlab.graphics.renderbase import StateTracker, getStateDelta, renderScaledDrawing
 from reportlab.pdfbase.pdfmetrics import getFont, unicode2T1
 from math import sin, cos, pi, ceil
-from reportlab.lib.utils import getStringIO, open_and_read
+from reportlab.lib.utils import getStringIO, open_and_read, getRGBImageData
 from reportlab import rl_config
 
 class RenderPMError(Exception):
     pass
 
-import string, os, sys
+import string, os, sys, struct
 
 try:
     import _renderPM
@@ -62,30 +62,35 @@ class _PMRenderer(Renderer):
         self._tracker = StateTracker()
 
     def pop(self):
-        self._tracker.pop()
-        self.applyState()
+        self.applyState(self._tracker.pop())
 
     def push(self,node):
-        deltas = getStateDelta(node)
-        self._tracker.push(deltas)
-        self.applyState()
+        self.applyState(self._tracker.push(getStateDelta(node)))
 
-    def applyState(self):
+    def applyState(self,delta=None):
+        """copy the tracked state into the gstate; when delta is given
+        only the properties it names are copied"""
         s = self._tracker.getState()
-        self._canvas.ctm = s['ctm']
-        self._canvas.strokeWidth = s['strokeWidth']
-        self._canvas.strokeColor = Color2Hex(s['strokeColor'])
-        self._canvas.lineCap = s['strokeLineCap']
-        self._canvas.lineJoin = s['strokeLineJoin']
-        da = s['strokeDashArray']
-        da = da and (0,da) or None
-        self._canvas.dashArray = da
-        self._canvas.fillColor = Color2Hex(s['fillColor'])
-        self._canvas.setFont(s['fontName'], s['fontSize'])
+        if delta is None: delta = s
+        elif not delta: return
+        has = delta.has_key
+        c = self._canvas
+        if has('transform'): c.ctm = s['ctm']
+        if has('strokeWidth'): c.strokeWidth = s['strokeWidth']
+        if has('strokeColor'): c.strokeColor = Color2Hex(s['strokeColor'])
+        if has('strokeLineCap'): c.lineCap = s['strokeLineCap']
+        if has('strokeLineJoin'): c.lineJoin = s['strokeLineJoin']
+        if has('strokeDashArray'):
+            da = s['strokeDashArray']
+            da = da and (0,da) or None
+            c.dashArray = da
+        if has('fillColor'): c.fillColor = Color2Hex(s['fillColor'])
+        if has('fontName') or has('fontSize'): c.setFont(s['fontName'], s['fontSize'])
 
     def initState(self,x,y):
         deltas = STATE_DEFAULTS.copy()
-        deltas['transform'] = self._canvas._baseCTM[0:4]+(x,y)
+        a, b, c, d, e, f = self._canvas._baseCTM
+        deltas['transform'] = (a,b,c,d,e+x,f+y)
         self._tracker.push(deltas)
         self.applyState()
 
@@ -110,29 +115,40 @@ class _PMRenderer(Renderer):
         else:
             c.roundRect(rect.x,rect.y, rect.width, rect.height, rect.rx, rect.ry)
 
+    def drawRectBatch(self, batch):
+        rect = self._canvas.rect
+        for x, y, width, height in batch.getRects():
+            rect(x, y, width, height)
+
     def drawLine(self, line):
         self._canvas.line(line.x1,line.y1,line.x2,line.y2)
 
     def drawImage(self, image):
-        if image.path and os.path.exists(image.path):
-            if type(image.path) is type(''):
-                im = _getImage().open(image.path).convert('RGB')
-            else:
-                im = image.path.convert('RGB')
-            srcW, srcH = im.size
-            dstW, dstH = image.width, image.height
-            if dstW is None: dstW = srcW
-            if dstH is None: dstH = srcH
-            self._canvas._aapixbuf(
-                    image.x, image.y, dstW, dstH,
-                    im.tostring(), srcW, srcH, 3,
-                    )
+        path = image.path
+        if isinstance(path,basestring):
+            if not os.path.exists(path): return
+        elif not path: return
+        #decoded pixels are shared through lib.utils.decodedImageCache
+        srcW, srcH, data = getRGBImageData(path)
+        dstW, dstH = image.width, image.height
+        if dstW is None: dstW = srcW
+        if dstH is None: dstH = srcH
+        self._canvas._aapixbuf(
+                image.x, image.y, dstW, dstH,
+                data, srcW, srcH, 3,
+                )
 
     def drawCircle(self, circle):
         c = self._canvas
         c.circle(circle.cx,circle.cy, circle.r)
         c.fillstrokepath()
 
+    def drawCircleBatch(self, batch):
+        c = self._canvas
+        for cx, cy, r in batch.getCircles():
+            c.circle(cx, cy, r)
+            c.fillstrokepath()
+
     def drawPolyLine(self, polyline, _doClose=0):
         P = polyline.points
         assert len(P) >= 2, 'Polyline must have 1 or more points'
@@ -239,13 +255,17 @@ def _saveAsPICT(im,fn,fmt,transparent=None):
     else:
         fn.write(s)
 
+def _pixelSize(w,h,dpi):
+    "the pixel width and height of a w x h point canvas at dpi"
+    scale = dpi/72.0
+    return int(w*scale+0.5), int(h*scale+0.5)
+
 BEZIER_ARC_MAGIC = 0.5522847498     #constant for drawing circular arcs w/ Beziers
 class PMCanvas:
     def __init__(self,w,h,dpi=72,bg=0xffffff,configPIL=None):
         '''configPIL dict is passed to image save method'''
         scale = dpi/72.0
-        w = int(w*scale+0.5)
-        h = int(h*scale+0.5)
+        w, h = _pixelSize(w,h,dpi)
         self.__dict__['_gs'] = _renderPM.gstate(w,h,bg=bg)
         self.__dict__['_bg'] = bg
         self.__dict__['_baseCTM'] = (scale,0,0,scale,0,0)
@@ -254,6 +274,21 @@ class PMCanvas:
         self.__dict__['_dpi'] = dpi
         self.ctm = self._baseCTM
 
+    def clear(self,bg=None,configPIL=None):
+        """prepare the canvas for drawing again: fill it with bg (default the
+        creation background) and reset the ctm, clip path, colours and dash.
+        The pixel buffer is reused if the extension allows it."""
+        if bg is None: bg = self._bg
+        gs = self._gs
+        if hasattr(gs,'clear'):
+            gs.clear(bg)
+        else:
+            self.__dict__['_gs'] = _renderPM.gstate(gs.width,gs.height,bg=bg)
+        self.__dict__['_bg'] = bg
+        self.__dict__['_clipPaths'] = []
+        self.__dict__['configPIL'] = configPIL
+        self.ctm = self._baseCTM
+
     def _drawTimeResize(self,w,h,bg=None):
         if bg is None: bg = self._bg
         self._drawing.width, self._drawing.height = w, h
@@ -268,10 +303,22 @@ class PMCanvas:
             setattr(self,k,A[k])
         gs.setFont(fN,fS)
 
+    def toBuffer(self):
+        """return a read only buffer over the pixels with rows stored bottom up;
+        with _renderPM 1.07 or later this is the gstate memory itself so eg
+        numpy.frombuffer(c.toBuffer(),'B').reshape((h,w,3))[::-1] copies nothing"""
+        gs = self._gs
+        try:
+            return buffer(gs)
+        except TypeError:
+            #older _renderPM; flip the top down copy
+            pix, rowb = gs.pixBuf, gs.width*gs.depth
+            return buffer(string.join([pix[o-rowb:o] for o in xrange(len(pix),0,-rowb)],''))
+
     def toPIL(self):
-        im = _getImage().new('RGB', size=(self._gs.width, self._gs.height))
-        im.fromstring(self._gs.pixBuf)
-        return im
+        gs = self._gs
+        #RGB images are never mapped so the result does not share our memory
+        return _getImage().frombuffer('RGB', (gs.width, gs.height), self.toBuffer(), 'raw', 'RGB', 0, -1)
 
     def saveToFile(self,fn,fmt=None):
         im = self.toPIL()
@@ -352,11 +399,10 @@ class PMCanvas:
         '''
         import struct
         gs = self._gs
-        pix, width, height = gs.pixBuf, gs.width, gs.height
+        pix, width, height = self.toBuffer(), gs.width, gs.height
         f.write(struct.pack('=2sLLLLLLhh24x','BM',len(pix)+54,0,54,40,width,height,1,24))
-        rowb = width * 3
-        for o in range(len(pix),0,-rowb):
-            f.write(pix[o-rowb:o])
+        #BMP rows are bottom up too
+        f.write(pix)
         f.write( '\0' * 14 )
 
     def setFont(self,fontName,fontSize,leading=None):
@@ -618,9 +664,15 @@ class PMCanvas:
     def setLineWidth(self,width):
         self.strokeWidth = width
 
-def drawToPMCanvas(d, dpi=72, bg=0xffffff, configPIL=None, showBoundary=rl_config._unset_):
+def drawToPMCanvas(d, dpi=72, bg=0xffffff, configPIL=None, showBoundary=rl_config._unset_, canvas=None):
+    '''draw d onto a PMCanvas; if canvas is a PMCanvas of the right size and
+    resolution it is cleared and reused rather than allocating a new one'''
     d = renderScaledDrawing(d)
-    c = PMCanvas(d.width, d.height, dpi=dpi, bg=bg, configPIL=configPIL)
+    c = canvas
+    if c is not None and c._dpi==dpi and (c.width,c.height)==_pixelSize(d.width,d.height,dpi):
+        c.clear(bg,configPIL)
+    else:
+        c = PMCanvas(d.width, d.height, dpi=dpi, bg=bg, configPIL=configPIL)
     draw(d, c, 0, 0, showBoundary=showBoundary)
     return c
 
@@ -643,6 +695,116 @@ def drawToString(d,fmt='GIF', dpi=72, bg=0xffffff, configPIL=None, showBoundary=
     drawToFile(d,s,fmt=fmt, dpi=dpi, bg=bg, configPIL=configPIL)
     return s.getvalue()
 
+def drawToStrings(drawings, fmt='PNG', dpi=72, bg=0xffffff, configPIL=None, showBoundary=rl_config._unset_):
+    '''return a list of fmt image strings, one for each of drawings;
+    consecutive drawings of the same size share one pixel buffer'''
+    c = None
+    R = []
+    for d in drawings:
+        c = drawToPMCanvas(d, dpi=dpi, bg=bg, configPIL=configPIL and configPIL.copy(), showBoundary=showBoundary, canvas=c)
+        R.append(c.saveToString(fmt))
+    return R
+
+class _PNGRowWriter:
+    "write 8 bit RGB rows (top down) to a PNG file as they arrive"
+    def __init__(self,f,w,h,dpi=72):
+        import zlib
+        self._f = f
+        self._crc32 = zlib.crc32
+        self._z = zlib.compressobj(6)
+        self._rowb = w*3
+        f.write('\x89PNG\r\n\x1a\n')
+        self._chunk('IHDR',struct.pack('>IIBBBBB',w,h,8,2,0,0,0))
+        ppm = int(dpi/0.0254+0.5)
+        self._chunk('pHYs',struct.pack('>IIB',ppm,ppm,1))
+
+    def _chunk(self,tag,data):
+        crc = self._crc32(data,self._crc32(tag))&0xffffffffL
+        self._f.write(struct.pack('>I',len(data))+tag)
+        self._f.write(data)
+        self._f.write(struct.pack('>I',crc))
+
+    def writeRows(self,pix):
+        rowb = self._rowb
+        data = self._z.compress(string.join(['\0'+pix[i:i+rowb] for i in xrange(0,len(pix),rowb)],''))
+        if data: self._chunk('IDAT',data)
+
+    def close(self):
+        self._chunk('IDAT',self._z.flush())
+        self._chunk('IEND','')
+
+class _TIFFRowWriter:
+    "write 8 bit RGB rows (top down) to an uncompressed single strip TIFF file"
+    def __init__(self,f,w,h,dpi=72):
+        self._f = f
+        n = 11
+        ifd = 8
+        bps = ifd+2+n*12+4      #BitsPerSample values
+        res = bps+6             #X & Y resolution rationals
+        data = res+16
+        E = [(256,4,1,w),(257,4,1,h),(258,3,3,bps),(259,3,1,1),(262,3,1,2),(273,4,1,data),
+            (277,3,1,3),(278,4,1,h),(279,4,1,w*h*3),(282,5,1,res),(283,5,1,res+8)]
+        dpi = int(dpi+0.5)
+        f.write(string.join(['II*\0',struct.pack('<IH',ifd,n)]+
+                [t==3 and c==1 and struct.pack('<HHIHH',tag,t,c,v,0) or struct.pack('<HHII',tag,t,c,v) for tag,t,c,v in E]+
+                [struct.pack('<I3H4I',0,8,8,8,dpi,1,dpi,1)],''))
+
+    def writeRows(self,pix):
+        self._f.write(pix)
+
+    def close(self):
+        pass
+
+def drawToFileInBands(d, fn, fmt='PNG', dpi=72, bg=0xffffff, bandHeight=256, threads=0, showBoundary=rl_config._unset_):
+    '''draw d in horizontal bands of bandHeight pixels and stream the rows to
+    fn (a file name or writable file) as a PNG or uncompressed TIFF; only band
+    sized pixel buffers are allocated so very large images can be produced.
+    With threads>1 that many bands are rendered concurrently, each into
+    its own buffer from its own deep copy of d.'''
+    fmt = string.upper(fmt)
+    if fmt not in ('PNG','TIF','TIFF'):
+        raise RenderPMError, "drawToFileInBands can't write %s files" % fmt
+    d = renderScaledDrawing(d)
+    W, H = _pixelSize(d.width,d.height,dpi)
+    bandHeight = max(1,min(int(bandHeight),H))
+    nBands = (H+bandHeight-1)//bandHeight
+    scale = dpi/72.0
+    C = [PMCanvas(d.width,bandHeight/scale,dpi=dpi,bg=bg) for i in xrange(max(1,min(threads,nBands)))]
+    if len(C)>1:
+        #rendering annotates the nodes so concurrent bands need separate trees
+        from copy import deepcopy
+        D = [d]+[deepcopy(d) for c in C[1:]]
+    else:
+        D = [d]
+    def drawBand(c,d,k,R,i):
+        try:
+            top = H-k*bandHeight    #bottom up pixel row above the band
+            c.__dict__['_baseCTM'] = (scale,0,0,scale,0,bandHeight-top)
+            c.clear(bg)
+            draw(d, c, 0, 0, showBoundary=showBoundary)
+            R[i] = c._gs.pixBuf[:min(bandHeight,top)*W*3]
+        except:
+            R[i] = sys.exc_info()
+    if hasattr(fn,'write'): f = fn
+    else: f = open(fn,'wb')
+    try:
+        w = (fmt=='PNG' and _PNGRowWriter or _TIFFRowWriter)(f,W,H,dpi)
+        for k in xrange(0,nBands,len(C)):
+            R = [None]*min(len(C),nBands-k)
+            if len(R)>1:
+                import threading
+                T = [threading.Thread(target=drawBand,args=(C[i],D[i],k+i,R,i)) for i in xrange(len(R))]
+                for t in T: t.start()
+                for t in T: t.join()
+            else:
+                drawBand(C[0],d,k,R,0)
+            for pix in R:
+                if type(pix) is TupleType: raise pix[0], pix[1], pix[2]
+                w.writeRows(pix)
+        w.close()
+    finally:
+        if f is not fn: f.close()
+
 save = drawToFile
 
 def test():
@@ -710,9 +710,8 @@ class _PSRenderer(Renderer):
             self._canvas.saveState()
 
         #apply state changes
-        deltas = getStateDelta(node)
-        self._tracker.push(deltas)
-        self.applyStateChanges(deltas, {})
+        deltas = self._tracker.push(getStateDelta(node))
+        if deltas: self.applyStateChanges(deltas, {})
 
         #draw the object, or recurse
         self.drawNodeDispatcher(node)
@@ -720,13 +719,17 @@ class _PSRenderer(Renderer):
         rDeltas = self._tracker.pop()
         if not (isinstance(node, Path) and node.isClipPath):
             self._canvas.restoreState()
-        self._canvas.comment('end node %s'%`node`)
-        self._canvas._color = color
+            self._canvas.comment('end node %s'%`node`)
+            self._canvas._color = color
 
-        #restore things we might have lost (without actually doing anything).
-        for k, v in rDeltas.items():
-            if self._restores.has_key(k):
-                setattr(self._canvas,self._restores[k],v)
+            #restore things we might have lost (without actually doing anything).
+            for k, v in rDeltas.items():
+                if self._restores.has_key(k):
+                    setattr(self._canvas,self._restores[k],v)
+        else:
+            self._canvas.comment('end node %s'%`node`)
+            self._canvas._color = color
+            if rDeltas: self.applyStateChanges(rDeltas, {})
 
 ##  _restores = {'stroke':'_stroke','stroke_width': '_lineWidth','stroke_linecap':'_lineCap',
 ##              'stroke_linejoin':'_lineJoin','fill':'_fill','font_family':'_font',
@@ -756,6 +759,16 @@ class _PSRenderer(Renderer):
     def drawCircle(self, circle):
         self._canvas.circle( circle.cx, circle.cy, circle.r)
 
+    def drawCircleBatch(self, batch):
+        circle = self._canvas.circle
+        for cx, cy, r in batch.getCircles():
+            circle(cx, cy, r)
+
+    def drawRectBatch(self, batch):
+        rect = self._canvas.rect
+        for x, y, width, height in batch.getRects():
+            rect(x, y, x+width, y+height)
+
     def drawWedge(self, wedge):
         yradius, radius1, yradius1 = wedge._xtraRadii()
         if (radius1==0 or radius1 is None) and (yradius1==0 or yradius1 is None):
@@ -806,8 +819,14 @@ class _PSRenderer(Renderer):
         drawFuncs = (c.moveTo, c.lineTo, c.curveTo, c.closePath)
         isClosed = _renderPath(path, drawFuncs)
         if not isClosed:
+            fillColor = c._fillColor
             c._fillColor = None
-        c._fillAndStroke([], clip=path.isClipPath)
+            try:
+                c._fillAndStroke([], clip=path.isClipPath)
+            finally:
+                c._fillColor = fillColor
+        else:
+            c._fillAndStroke([], clip=path.isClipPath)
 
     def applyStateChanges(self, delta, newState):
         """This takes a set of states, and outputs the operators
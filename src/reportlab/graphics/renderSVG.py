@@ -20,8 +20,6 @@ from reportlab.graphics.shapes import * # (only for test0)
 from reportlab import rl_config
 from reportlab.lib.utils import getStringIO
 
-from xml.dom import getDOMImplementation
-
 
 ### some constants ###
 
@@ -35,17 +33,20 @@ TEXT_STYLES = 'font-family font-size'
 
 ### top-level user function ###
 
-def drawToString(d, showBoundary=rl_config.showBoundary):
+def drawToString(d, showBoundary=rl_config.showBoundary, compact=0):
     "Returns a SVG as a string in memory, without touching the disk"
     s = getStringIO()
-    drawToFile(d, s, showBoundary=showBoundary)
+    drawToFile(d, s, showBoundary=showBoundary, compact=compact)
     return s.getvalue()
 
-def drawToFile(d, fn, showBoundary=rl_config.showBoundary):
+def drawToFile(d, fn, showBoundary=rl_config.showBoundary, compact=0):
+    """Write d as SVG to fn (a file name or object with a write method);
+    elements are streamed out as they are drawn.  compact=1 omits the
+    indentation."""
     d = renderScaledDrawing(d)
-    c = SVGCanvas((d.width, d.height))
+    c = SVGCanvas((d.width, d.height), out=fn, compact=compact)
     draw(d, c, 0, 0, showBoundary=showBoundary)
-    c.save(fn)
+    c.save()
 
 
 def draw(drawing, canvas, x=0, y=0, showBoundary=rl_config.showBoundary):
@@ -103,39 +104,62 @@ def transformNode(doc, newTag, node=None, **attrDict):
 
 ### classes ###
 
+def _escapeText(s):
+    "escape the XML special characters in character data"
+    if type(s) is types.UnicodeType: s = s.encode('utf8')
+    else: s = str(s)
+    return string.replace(string.replace(string.replace(s,'&','&amp;'),'<','&lt;'),'>','&gt;')
+
+def _escapeAttr(s):
+    "escape the XML special characters in an attribute value"
+    return string.replace(_escapeText(s),'"','&quot;')
+
 class SVGCanvas:
-    def __init__(self, size=(300,300)):
+    """Writes SVG elements as they are drawn.
+
+    If out (a file name or object with a write method) is given the
+    document is streamed to it and save() just finishes it off, otherwise
+    the text is collected in memory until save(f) is called.  Groups are
+    kept on a small stack and written when their first child arrives, so
+    a group's transform may be set at any time before it has content.
+    With compact=1 no indentation or line breaks are written."""
+    def __init__(self, size=(300,300), out=None, compact=0):
         self.verbose = 0
         self.width, self.height = self.size = size
         # self.height = size[1]
         self.code = []
         self.style = {}
-        self.path = ''
+        self.path = []
         self._strokeColor = self._fillColor = self._lineWidth = \
             self._font = self._fontSize = self._lineCap = \
             self._lineJoin = self._color = None
 
-        implementation = getDOMImplementation('minidom')
-        self.doc = implementation.createDocument(None, "svg", None)
-        self.svg = self.doc.documentElement
-        self.svg.setAttribute("width", str(size[0]))
-        self.svg.setAttribute("height", str(self.height))
+        self.compact = compact
+        self._file = None
+        if out is None:
+            self._chunks = []
+            self._write = self._chunks.append
+        else:
+            self._chunks = None
+            if type(out) is StringType:
+                out = self._file = open(out, 'w')
+            self._write = out.write
+        self._depth = 0
+        self._groups = []   #[tag, attrs, opened] for each unfinished group
+
+        self._write("""\
+<?xml version="1.0" encoding="iso-8859-1"?>
+<!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 20000303 Stylable//EN" "http://www.w3.org/TR/2000/03/WD-SVG-20000303/DTD/svg-20000303-stylable.dtd" >""")
+        if compact: self._write('\n')
 
         #these suggested by Tim Roberts
-        self.svg.setAttribute("xmlns", "http://www.w3.org/2000/svg")
-        self.svg.setAttribute("xmlns:link", "http://www.w3.org/1999/xlink")
-        self.svg.setAttribute("version", "1.0")
-        self.svg.setAttribute("baseProfile", "full")
-
-        title = self.doc.createElement('title')
-        text = self.doc.createTextNode('...')
-        title.appendChild(text)
-        self.svg.appendChild(title)
-
-        desc = self.doc.createElement('desc')
-        text = self.doc.createTextNode('...')
-        desc.appendChild(text)
-        self.svg.appendChild(desc)
+        self._startGroup('svg',
+            (('width', size[0]), ('height', self.height),
+            ('xmlns', "http://www.w3.org/2000/svg"),
+            ('xmlns:link', "http://www.w3.org/1999/xlink"),
+            ('version', "1.0"), ('baseProfile', "full")))
+        self._element('title', (), '...')
+        self._element('desc', (), '...')
 
         self.setFont(STATE_DEFAULTS['fontName'], STATE_DEFAULTS['fontSize'])
         self.setStrokeColor(STATE_DEFAULTS['strokeColor'])
@@ -144,40 +168,80 @@ class SVGCanvas:
         self.setLineWidth(1)
 
         # Add a rectangular clipping path identical to view area.
-        clipPath = transformNode(self.doc, "clipPath", id="clip")
-        clipRect = transformNode(self.doc, "rect", x=0, y=0,
-            width=self.width, height=self.height)
-        clipPath.appendChild(clipRect)
-        self.svg.appendChild(clipPath)
+        self._startGroup('clipPath', (('id', 'clip'),))
+        self._element('rect', (('x', 0), ('y', 0), ('width', self.width), ('height', self.height)))
+        self._endGroup()
 
-        self.groupTree = transformNode(self.doc, "g",
-            id="group",
-            transform="scale(1,-1) translate(0,-%d)" % self.height,
-            style="clip-path: url(#clip)")
-        self.svg.appendChild(self.groupTree)
-        self.currGroup = self.groupTree
+        self._startGroup('g',
+            (('id', 'group'),
+            ('transform', "scale(1,-1) translate(0,-%d)" % self.height),
+            ('style', "clip-path: url(#clip)")))
+        self.currGroup = len(self._groups)
 
 
     def save(self, f=None):
-        if type(f) is StringType:
-            file = open(f, 'w')
+        "finish the document and write it to f (unless it was streamed)"
+        while self._groups:
+            self._endGroup()
+        if self._chunks is not None:
+            if type(f) is StringType:
+                file = open(f, 'w')
+            else:
+                file = f
+            file.write(string.join(self._chunks, ''))
+            self._chunks = []
+            if file is not f:
+                file.close()
+        elif self._file:
+            self._file.close()
+            self._file = None
+
+
+    ### output ###
+
+    def _indent(self):
+        if not self.compact:
+            self._write('\n'+'    '*self._depth)
+
+    def _openGroups(self):
+        "write the start tags of groups which have not yet been started"
+        for g in self._groups:
+            if not g[2]:
+                self._indent()
+                self._write('<%s%s>' % (g[0], self._formatAttrs(g[1])))
+                g[2] = 1
+                self._depth = self._depth+1
+
+    def _formatAttrs(self, attrs):
+        A = []
+        for k, v in attrs:
+            if v!='': A.append(' %s="%s"' % (k, _escapeAttr(v)))
+        return string.join(A, '')
+
+    def _element(self, tag, attrs, text=None):
+        "write a complete element with the given attribute pairs"
+        self._openGroups()
+        self._indent()
+        if text is None:
+            self._write('<%s%s/>' % (tag, self._formatAttrs(attrs)))
         else:
-            file = f
-
-        file.write("""\
-<?xml version="1.0" encoding="iso-8859-1"?>
-<!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 20000303 Stylable//EN" "http://www.w3.org/TR/2000/03/WD-SVG-20000303/DTD/svg-20000303-stylable.dtd" >\n""")
+            self._write('<%s%s>%s</%s>' % (tag, self._formatAttrs(attrs), _escapeText(text), tag))
 
-        # use = self.doc.createElement('use')
-        # use.setAttribute("xlink:href", "#group")
-        # use.setAttribute("transform", "scale(1, -1)")
-        # self.svg.appendChild(use)
+    def _startGroup(self, tag, attrs):
+        self._groups.append([tag, list(attrs), 0])
 
-        result = self.svg.toprettyxml(indent="    ")
-        file.write(result)
-
-        if file is not f:
-            file.close()
+    def _endGroup(self):
+        tag, attrs, opened = self._groups.pop()
+        if opened:
+            self._depth = self._depth-1
+            self._indent()
+            self._write('</%s>' % tag)
+        else:
+            self._openGroups()
+            self._indent()
+            self._write('<%s%s/>' % (tag, self._formatAttrs(attrs)))
+        if not self._groups and not self.compact:
+            self._write('\n')
 
 
     ### helpers ###
@@ -253,10 +317,9 @@ class SVGCanvas:
 
 
     def _fillAndStroke(self, code, clip=0):
-        path = transformNode(self.doc, "path",
-            d=self.path, style=self._formatStyle(LINE_STYLES))
-        self.currGroup.appendChild(path)
-        self.path = ''
+        self._element("path", (("d", string.join(self.path, '')),
+            ("style", self._formatStyle(LINE_STYLES))))
+        self.path = []
 
         return
 
@@ -301,7 +364,9 @@ class SVGCanvas:
         """Two notations. Pass two numbers, or an array and phase."""
 
         join = string.join
-        if type(array) in (types.IntType, types.FloatType):
+        if not array:
+            if self.style.has_key('stroke-dasharray'): del self.style['stroke-dasharray']
+        elif type(array) in (types.IntType, types.FloatType):
             self.style['stroke-dasharray'] = join(map(str, ([array, phase])), ', ')
         elif type(array) in (types.ListType, types.TupleType) and len(array) > 0:
             assert phase >= 0, "phase is a length in user space"
@@ -353,11 +418,8 @@ class SVGCanvas:
 
         if self.verbose: print "+++ SVGCanvas.rect"
 
-        rect = transformNode(self.doc, "rect",
-            x=x1, y=y1, width=x2-x1, height=y2-y1,
-            style=self._formatStyle(LINE_STYLES))
-
-        self.currGroup.appendChild(rect)
+        self._element("rect", (("x", x1), ("y", y1), ("width", x2-x1), ("height", y2-y1),
+            ("style", self._formatStyle(LINE_STYLES))))
 
 
     def roundRect(self, x1,y1, x2,y2, rx=8, ry=8):
@@ -367,11 +429,8 @@ class SVGCanvas:
         These should have x1<x2, y1<y2, rx>0, and ry>0.
         """
 
-        rect = transformNode(self.doc, "rect",
-            x=x1, y=y1, width=x2-x1, height=y2-y1, rx=rx, ry=ry,
-            style=self._formatStyle(LINE_STYLES))
-
-        self.currGroup.appendChild(rect)
+        self._element("rect", (("x", x1), ("y", y1), ("width", x2-x1), ("height", y2-y1),
+            ("rx", rx), ("ry", ry), ("style", self._formatStyle(LINE_STYLES))))
 
 
     def drawString(self, s, x, y, angle=0):
@@ -384,13 +443,8 @@ class SVGCanvas:
             if angle != 0:
                st = st + " rotate(%f %f %f);" % (angle, x, y)
             st = st + " fill: %s;" % self.style['fill']
-            text = transformNode(self.doc, "text",
-                x=x, y=y, style=st,
-                transform="translate(0,%d) scale(1,-1)" % (2*y))
-            content = self.doc.createTextNode(s)
-            text.appendChild(content)
-
-            self.currGroup.appendChild(text)
+            self._element("text", (("x", x), ("y", y), ("style", st),
+                ("transform", "translate(0,%d) scale(1,-1)" % (2*y))), s)
 
     def drawCentredString(self, s, x, y, angle=0,text_anchor='middle'):
         if self.verbose: print "+++ SVGCanvas.drawCentredString"
@@ -412,8 +466,7 @@ class SVGCanvas:
     def comment(self, data):
         "Add a comment."
 
-        comment = self.doc.createComment(data)
-        # self.currGroup.appendChild(comment)
+        pass
 
 
     def drawImage(self, image, x1, y1, x2=None, y2=None):
@@ -422,15 +475,9 @@ class SVGCanvas:
 
     def line(self, x1, y1, x2, y2):
         if self._strokeColor != None:
-            if 0: # something is wrong with line in my SVG viewer...
-                line = transformNode(self.doc, "line",
-                    x=x1, y=y1, x2=x2, y2=y2,
-                    style=self._formatStyle(LINE_STYLES))
-                self.currGroup.appendChild(line)
-            path = transformNode(self.doc, "path",
-                d="M %f,%f L %f,%f Z" % (x1,y1,x2,y2),
-                style=self._formatStyle(LINE_STYLES))
-            self.currGroup.appendChild(path)
+            # something is wrong with line in my SVG viewer so use a path
+            self._element("path", (("d", "M %f,%f L %f,%f Z" % (x1,y1,x2,y2)),
+                ("style", self._formatStyle(LINE_STYLES))))
 
 
     def ellipse(self, x1, y1, x2, y2):
@@ -439,19 +486,14 @@ class SVGCanvas:
         These should have x1<x2 and y1<y2.
         """
 
-        ellipse = transformNode(self.doc, "ellipse",
-            cx=(x1+x2)/2.0, cy=(y1+y2)/2.0, rx=(x2-x1)/2.0, ry=(y2-y1)/2.0,
-            style=self._formatStyle(LINE_STYLES))
-
-        self.currGroup.appendChild(ellipse)
+        self._element("ellipse", (("cx", (x1+x2)/2.0), ("cy", (y1+y2)/2.0),
+            ("rx", (x2-x1)/2.0), ("ry", (y2-y1)/2.0),
+            ("style", self._formatStyle(LINE_STYLES))))
 
 
     def circle(self, xc, yc, r):
-        circle = transformNode(self.doc, "circle",
-            cx=xc, cy=yc, r=r,
-            style=self._formatStyle(LINE_STYLES))
-
-        self.currGroup.appendChild(circle)
+        self._element("circle", (("cx", xc), ("cy", yc), ("r", r),
+            ("style", self._formatStyle(LINE_STYLES))))
 
 
     def drawCurve(self, x1, y1, x2, y2, x3, y3, x4, y4, closed=0):
@@ -499,9 +541,7 @@ class SVGCanvas:
         if fromcenter:
             str = str + "L %f, %f Z " % (cx, cy)
 
-        path = transformNode(self.doc, "path",
-            d=str, style=self._formatStyle())
-        self.currGroup.appendChild(path)
+        self._element("path", (("d", str), ("style", self._formatStyle())))
 
 
     def polygon(self, points, closed=0):
@@ -513,9 +553,8 @@ class SVGCanvas:
             for i in xrange(len(points)):
                 pairs.append("%f %f" % (points[i]))
             pts = string.join(pairs, ', ')
-            polyline = transformNode(self.doc, "polygon",
-                points=pts, style=self._formatStyle(LINE_STYLES))
-            self.currGroup.appendChild(polyline)
+            self._element("polygon", (("points", pts),
+                ("style", self._formatStyle(LINE_STYLES))))
 
         # self._fillAndStroke(polyCode)
 
@@ -540,33 +579,41 @@ class SVGCanvas:
             for i in xrange(len(points)):
                 pairs.append("%f %f" % (points[i]))
             pts = string.join(pairs, ', ')
-            polyline = transformNode(self.doc, "polyline",
-                points=pts, style=self._formatStyle(LINE_STYLES))
-            self.currGroup.appendChild(polyline)
+            self._element("polyline", (("points", pts),
+                ("style", self._formatStyle(LINE_STYLES))))
 
 
     ### groups ###
 
     def startGroup(self):
         if self.verbose: print "+++ begin SVGCanvas.startGroup"
-        currGroup, group = self.currGroup, transformNode(self.doc, "g", transform="")
-        currGroup.appendChild(group)
-        self.currGroup = group
+        currGroup = self.currGroup
+        self._startGroup("g", (("transform", ""),))
+        self.currGroup = len(self._groups)
         if self.verbose: print "+++ end SVGCanvas.startGroup"
         return currGroup
 
     def endGroup(self,currGroup):
         if self.verbose: print "+++ begin SVGCanvas.endGroup"
+        while len(self._groups)>currGroup:
+            self._endGroup()
         self.currGroup = currGroup
         if self.verbose: print "+++ end SVGCanvas.endGroup"
 
 
+    def _currentGroupAttrs(self):
+        "the attribute pairs of the current group which must not yet be written"
+        g = self._groups[-1]
+        if g[2]: raise ValueError, "SVGCanvas group already has content"
+        return g[1]
+
     def transform(self, a, b, c, d, e, f):
         if self.verbose: print "!!! begin SVGCanvas.transform", a, b, c, d, e, f
-        tr = self.currGroup.getAttribute("transform")
-        t = 'matrix(%f, %f, %f, %f, %f, %f)' % (a,b,c,d,e,f)
         if (a, b, c, d, e, f) != (1, 0, 0, 1, 0, 0):
-            self.currGroup.setAttribute("transform", "%s %s" % (tr, t))
+            attrs = self._currentGroupAttrs()
+            tr = attrs[0][1]
+            t = 'matrix(%f, %f, %f, %f, %f, %f)' % (a,b,c,d,e,f)
+            attrs[0] = ("transform", string.strip("%s %s" % (tr, t)))
 
 
     def translate(self, x, y):
@@ -574,9 +621,9 @@ class SVGCanvas:
         print "!!! begin SVGCanvas.translate"
         return
 
-        tr = self.currGroup.getAttribute("transform")
+        attrs = self._currentGroupAttrs()
         t = 'translate(%f, %f)' % (x, y)
-        self.currGroup.setAttribute("transform", "%s %s" % (tr, t))
+        attrs[0] = ("transform", string.strip("%s %s" % (attrs[0][1], t)))
 
 
     def scale(self, x, y):
@@ -584,27 +631,27 @@ class SVGCanvas:
         print "!!! begin SVGCanvas.scale"
         return
 
-        tr = self.groups[-1].getAttribute("transform")
+        attrs = self._currentGroupAttrs()
         t = 'scale(%f, %f)' % (x, y)
-        self.currGroup.setAttribute("transform", "%s %s" % (tr, t))
+        attrs[0] = ("transform", string.strip("%s %s" % (attrs[0][1], t)))
 
 
     ### paths ###
 
     def moveTo(self, x, y):
-        self.path = self.path + 'M %f %f ' % (x, y)
+        self.path.append('M %f %f ' % (x, y))
 
 
     def lineTo(self, x, y):
-        self.path = self.path + 'L %f %f ' % (x, y)
+        self.path.append('L %f %f ' % (x, y))
 
 
     def curveTo(self, x1, y1, x2, y2, x3, y3):
-        self.path = self.path + 'C %f %f %f %f %f %f ' % (x1, y1, x2, y2, x3, y3)
+        self.path.append('C %f %f %f %f %f %f ' % (x1, y1, x2, y2, x3, y3))
 
 
     def closePath(self):
-        self.path = self.path + 'Z '
+        self.path.append('Z ')
 
     def saveState(self):
         pass
@@ -626,15 +673,13 @@ class _SVGRenderer(Renderer):
 
         if self.verbose: print "### begin _SVGRenderer.drawNode"
 
-        self._canvas.comment('begin node %s'%`node`)
         color = self._canvas._color
         if not (isinstance(node, Path) and node.isClipPath):
             pass # self._canvas.saveState()
 
         #apply state changes
-        deltas = getStateDelta(node)
-        self._tracker.push(deltas)
-        self.applyStateChanges(deltas, {})
+        deltas = self._tracker.push(getStateDelta(node))
+        if deltas: self.applyStateChanges(deltas, {})
 
         #draw the object, or recurse
         self.drawNodeDispatcher(node)
@@ -642,33 +687,27 @@ class _SVGRenderer(Renderer):
         rDeltas = self._tracker.pop()
         if not (isinstance(node, Path) and node.isClipPath):
             pass # self._canvas.restoreState()
-        self._canvas.comment('end node %s'%`node`)
         self._canvas._color = color
 
-        #restore things we might have lost (without actually doing anything).
-        for k, v in rDeltas.items():
-            if self._restores.has_key(k):
-                setattr(self._canvas,self._restores[k],v)
+        #there is no graphics state to pop so put the style back as it was
+        if rDeltas: self.applyStateChanges(rDeltas, {})
 
         if self.verbose: print "### end _SVGRenderer.drawNode"
 
-    _restores = {'strokeColor':'_strokeColor','strokeWidth': '_lineWidth','strokeLineCap':'_lineCap',
-                'strokeLineJoin':'_lineJoin','fillColor':'_fillColor','fontName':'_font',
-                'fontSize':'_fontSize'}
-
 
     def drawGroup(self, group):
         if self.verbose: print "### begin _SVGRenderer.drawGroup"
 
         currGroup = self._canvas.startGroup()
         a, b, c, d, e, f = self._tracker.getState()['transform']
+        #the group's start tag is written with its first child
+        self._canvas.transform(a, b, c, d, e, f)
         for childNode in group.getContents():
             if isinstance(childNode, UserNode):
                 node2 = childNode.provideNode()
             else:
                 node2 = childNode
             self.drawNode(node2)
-        self._canvas.transform(a, b, c, d, e, f)
         self._canvas.endGroup(currGroup)
 
         if self.verbose: print "### end _SVGRenderer.drawGroup"
@@ -714,6 +753,16 @@ class _SVGRenderer(Renderer):
     def drawCircle(self, circle):
         self._canvas.circle( circle.cx, circle.cy, circle.r)
 
+    def drawCircleBatch(self, batch):
+        circle = self._canvas.circle
+        for cx, cy, r in batch.getCircles():
+            circle(cx, cy, r)
+
+    def drawRectBatch(self, batch):
+        rect = self._canvas.rect
+        for x, y, width, height in batch.getRects():
+            rect(x, y, x+width, y+height)
+
 
     def drawWedge(self, wedge):
         centerx, centery, radius, startangledegrees, endangledegrees = \
@@ -750,8 +799,14 @@ class _SVGRenderer(Renderer):
         drawFuncs = (c.moveTo, c.lineTo, c.curveTo, c.closePath)
         isClosed = _renderPath(path, drawFuncs)
         if not isClosed:
+            fillColor = c._fillColor
             c._fillColor = None
-        c._fillAndStroke([], clip=path.isClipPath)
+            try:
+                c._fillAndStroke([], clip=path.isClipPath)
+            finally:
+                c._fillColor = fillColor
+        else:
+            c._fillAndStroke([], clip=path.isClipPath)
 
 
     def applyStateChanges(self, delta, newState):
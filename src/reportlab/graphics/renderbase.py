@@ -7,6 +7,7 @@ __doc__='''Superclass for renderers to factor out common functionality and defau
 
 from reportlab.graphics.shapes import *
 from reportlab.lib.validators import DerivedValue
+from reportlab.lib.colors import Color
 from reportlab import rl_config
 
 def inverse(A):
@@ -31,17 +32,51 @@ def mmult(A, B):
             A[1]*B[4] + A[3]*B[5] + A[5])
 
 
+_IDENTITY = (1,0,0,1,0,0)
+_missing = []
+_stateKeys = {}
+def _getStateKeys(klass):
+    """Return the state attribute names a node class can carry, or None if
+    the class has no attribute map to tell us."""
+    try:
+        return _stateKeys[klass]
+    except KeyError:
+        attrMap = getattr(klass,'_attrMap',None)
+        if attrMap is None:
+            keys = None
+        else:
+            keys = tuple([k for k in STATE_DEFAULTS.keys() if attrMap.has_key(k)])
+        _stateKeys[klass] = keys
+        return keys
+
 def getStateDelta(shape):
     """Used to compute when we need to change the graphics state.
     For example, if we have two adjacent red shapes we don't need
     to set the pen color to red in between. Returns the effect
     the given shape would have on the graphics state"""
     delta = {}
-    for (prop, value) in shape.getProperties().items():
-        if STATE_DEFAULTS.has_key(prop):
-            delta[prop] = value
+    keys = _getStateKeys(shape.__class__)
+    if keys is None:
+        for (prop, value) in shape.getProperties().items():
+            if STATE_DEFAULTS.has_key(prop):
+                delta[prop] = value
+    else:
+        d = shape.__dict__
+        for prop in keys:
+            if d.has_key(prop):
+                delta[prop] = d[prop]
     return delta
 
+def _sameValue(a,b):
+    "true if a state value b needs no operator when a is current"
+    if a is b: return 1
+    if isinstance(a,Color) or isinstance(b,Color):
+        #Color.__cmp__ is a partial ordering; distinct colours can compare equal
+        return a.__class__ is b.__class__ and a.__dict__==b.__dict__
+    try:
+        return a==b
+    except:
+        return 0
 
 class StateTracker:
     """Keeps a stack of transforms and state
@@ -50,79 +85,87 @@ class StateTracker:
     special meanings.  The getCTM()
     method returns the current transformation
     matrix at any point, without needing to
-    invert matrixes when you pop."""
+    invert matrixes when you pop.
+
+    Only one state dictionary is kept; each push records
+    the values it overwrote so pop can put them back.  Both
+    push and pop return just the properties which really
+    changed so backends need not reapply the whole state."""
     def __init__(self, defaults=None):
-        # one stack to keep track of what changes...
+        # one stack of (changes, undo) pairs
         self._deltas = []
 
-        # and another to keep track of cumulative effects.  Last one in
-        # list is the current graphics state.  We put one in to simplify
-        # loops below.
-        self._combined = []
+        # and the current graphics state
         if defaults is None:
             defaults = STATE_DEFAULTS.copy()
         #ensure  that if we have a transform, we have a CTM
         if defaults.has_key('transform'):
             defaults['ctm'] = defaults['transform']
-        self._combined.append(defaults)
+        self._state = defaults
 
     def push(self,delta):
         """Take a new state dictionary of changes and push it onto
         the stack.  After doing this, the combined state is accessible
-        through getState()"""
-
-        newstate = self._combined[-1].copy()
-        for (key, value) in delta.items():
+        through getState().  Returns the dictionary of properties
+        whose values actually changed."""
+        state = self._state
+        changes = {}
+        undo = []
+        for key, value in delta.items():
+            if state.has_key(key):
+                prevValue = state[key]
+            else:
+                prevValue = _missing
             if key == 'transform':  #do cumulative matrix
-                newstate['transform'] = delta['transform']
-                newstate['ctm'] = mmult(self._combined[-1]['ctm'], delta['transform'])
-                #print 'statetracker transform = (%0.2f, %0.2f, %0.2f, %0.2f, %0.2f, %0.2f)' % tuple(newstate['transform'])
-                #print 'statetracker ctm = (%0.2f, %0.2f, %0.2f, %0.2f, %0.2f, %0.2f)' % tuple(newstate['ctm'])
-
-            else:  #just overwrite it
-                newstate[key] = value
-
-        self._combined.append(newstate)
-        self._deltas.append(delta)
+                undo.append((key,prevValue))
+                state[key] = value
+                if tuple(value)!=_IDENTITY:
+                    undo.append(('ctm',state['ctm']))
+                    state['ctm'] = mmult(state['ctm'], value)
+                    changes[key] = value
+            elif prevValue is _missing or not _sameValue(prevValue,value):
+                undo.append((key,prevValue))
+                state[key] = value
+                changes[key] = value
+        self._deltas.append((changes,undo))
+        return changes
 
     def pop(self):
         """steps back one, and returns a state dictionary with the
         deltas to reverse out of wherever you are.  Depending
         on your back end, you may not need the return value,
         since you can get the complete state afterwards with getState()"""
-        del self._combined[-1]
-        newState = self._combined[-1]
-        lastDelta = self._deltas[-1]
-        del  self._deltas[-1]
-        #need to diff this against the last one in the state
+        changes, undo = self._deltas.pop()
+        state = self._state
+        undo.reverse()
+        for key, prevValue in undo:
+            if prevValue is _missing:
+                del state[key]
+            else:
+                state[key] = prevValue
         reverseDelta = {}
-        #print 'pop()...'
-        for key, curValue in lastDelta.items():
-            #print '   key=%s, value=%s' % (key, curValue)
-            prevValue = newState[key]
-            if prevValue <> curValue:
-                #print '    state popping "%s"="%s"' % (key, curValue)
-                if key == 'transform':
-                    reverseDelta[key] = inverse(lastDelta['transform'])
-                else:  #just return to previous state
-                    reverseDelta[key] = prevValue
+        for key, curValue in changes.items():
+            if key == 'transform':
+                reverseDelta[key] = inverse(curValue)
+            elif state.has_key(key):
+                reverseDelta[key] = state[key]
         return reverseDelta
 
     def getState(self):
         "returns the complete graphics state at this point"
-        return self._combined[-1]
+        return self._state
 
     def getCTM(self):
         "returns the current transformation matrix at this point"""
-        return self._combined[-1]['ctm']
+        return self._state['ctm']
 
     def __getitem__(self,key):
         "returns the complete graphics state value of key at this point"
-        return self._combined[-1][key]
+        return self._state[key]
 
     def __setitem__(self,key,value):
         "sets the complete graphics state value of key to value"
-        self._combined[-1][key] = value
+        self._state[key] = value
 
 def testStateTracker():
     print 'Testing state tracker'
@@ -219,8 +262,7 @@ class Renderer:
 
     def getStateValue(self, key):
         """Return current state parameter for given key"""
-        currentState = self._tracker._combined[-1]
-        return currentState[key]
+        return self._tracker[key]
     
     def fillDerivedValues(self, node):
         """Examine a node for any values which are Derived,
@@ -275,6 +317,10 @@ class Renderer:
                 self.drawGroup(node)
             elif isinstance(node, Wedge):
                 self.drawWedge(node)
+            elif isinstance(node, RectBatch):
+                self.drawRectBatch(node)
+            elif isinstance(node, CircleBatch):
+                self.drawCircleBatch(node)
             else:
                 print 'DrawingError','Unexpected element %s in drawing!' % str(node)
         finally:
@@ -320,6 +366,15 @@ class Renderer:
         # could be implemented in terms of polygon
         self.undefined("drawRect")
 
+    def drawRectBatch(self, batch):
+        # by default draw the rectangles one at a time; the state is shared
+        for x, y, width, height in batch.getRects():
+            self.drawRect(Rect(x,y,width,height))
+
+    def drawCircleBatch(self, batch):
+        for cx, cy, r in batch.getCircles():
+            self.drawCircle(Circle(cx,cy,r))
+
     def drawLine(self, line):
         self.undefined("drawLine")
 
@@ -5,8 +5,10 @@
 __version__=''' $Id$ '''
 __doc__='''Core of the graphics library - defines Drawing and Shapes'''
 
-import string, os, sys
+import string, os, sys, operator
 from math import pi, cos, sin, tan
+from array import array
+from itertools import izip, repeat
 from types import FloatType, IntType, ListType, TupleType, StringType, InstanceType
 from pprint import pprint
 
@@ -578,6 +580,7 @@ class Drawing(Group, Flowable):
         #AR temporary hack to track back up.
         #fontName = AttrMapValue(isStringOrNone),
         renderScale = AttrMapValue(isNumber,desc="Global scaling for rendering"),
+        formCache = AttrMapValue(EitherOr((isBoolean,isString)),desc="If true (or a content key string) render once per PDF document into a shared form"),
         )
 
     _attrMap = AttrMap(BASE=Group)
@@ -591,6 +594,7 @@ class Drawing(Group, Flowable):
         self.hAlign = 'LEFT'
         self.vAlign = 'BOTTOM'
         self.renderScale = 1.0
+        self.formCache = 0
 
     def _renderPy(self):
         I = {'reportlab.graphics.shapes': ['_DrawingEditorMixin','Drawing','Group']}
@@ -1011,9 +1015,11 @@ class Image(SolidShape):
         width = AttrMapValue(isNumberOrNone),
         height = AttrMapValue(isNumberOrNone),
         path = AttrMapValue(None),
+        maxDPI = AttrMapValue(isNumberOrNone,desc="if set, the most pixels per inch to embed"),
         )
 
     def __init__(self, x, y, width, height, path, **kw):
+        self.maxDPI = None
         SolidShape.__init__(self, kw)
         self.x = x
         self.y = y
@@ -1051,6 +1057,102 @@ class Circle(SolidShape):
     def getBounds(self):
         return (self.cx - self.r, self.cy - self.r, self.cx + self.r, self.cy + self.r)
 
+def _numberColumn(v):
+    "return a number unchanged, otherwise a new array of doubles"
+    if type(v) in (FloatType,IntType): return v
+    return array('d',v)
+
+def _iterColumn(v):
+    "iterate over a column; a single number is repeated indefinitely"
+    if type(v) in (FloatType,IntType): return repeat(v)
+    return iter(v)
+
+def _columnBounds(lo,size):
+    "return min and max of lo and lo+size where size may be a single number"
+    if not len(lo): return None
+    if type(size) in (FloatType,IntType):
+        a, b = min(lo), max(lo)
+        return min(a,a+size), max(b,b+size)
+    hi = [l+s for l,s in izip(lo,size)]
+    return min(min(lo),min(hi)), max(max(lo),max(hi))
+
+class _ShapeBatch(SolidShape):
+    """Base for columnar nodes which hold many primitives sharing one stroke
+    and fill style.  Coordinates live in arrays so each item costs a few
+    bytes instead of a full shape instance, and renderers draw the batch in
+    a single loop.  Overlapping items may be stroked above their neighbours'
+    fills as renderers are free to combine the batch into one path."""
+
+    def _columns(self):
+        return [getattr(self,k) for k in self._columnNames]
+
+    def copy(self):
+        new = apply(self.__class__,self._columns())
+        P = self.getProperties()
+        for k in self._columnNames: del P[k]
+        new.setProperties(P)
+        return new
+
+class RectBatch(_ShapeBatch):
+    """Many plain rectangles; x and y are columns of lower left corners,
+    width and height are single numbers or columns of the same length."""
+    _columnNames = ('x','y','width','height')
+
+    _attrMap = AttrMap(BASE=SolidShape,
+        x = AttrMapValue(isNumberArray,desc="x coordinates of the lower left corners"),
+        y = AttrMapValue(isNumberArray,desc="y coordinates of the lower left corners"),
+        width = AttrMapValue(isNumberOrNumberArray,desc="width or column of widths"),
+        height = AttrMapValue(isNumberOrNumberArray,desc="height or column of heights"),
+        )
+
+    def __init__(self, x, y, width, height, **kw):
+        SolidShape.__init__(self, kw)
+        self.x = _numberColumn(x)
+        self.y = _numberColumn(y)
+        self.width = _numberColumn(width)
+        self.height = _numberColumn(height)
+
+    def getRects(self):
+        "iterate over (x, y, width, height) for each rectangle"
+        return izip(self.x,self.y,_iterColumn(self.width),_iterColumn(self.height))
+
+    def getBounds(self):
+        bx = _columnBounds(self.x,self.width)
+        if bx is None: return None
+        by = _columnBounds(self.y,self.height)
+        return (bx[0], by[0], bx[1], by[1])
+
+class CircleBatch(_ShapeBatch):
+    """Many circles; cx and cy are columns of centres, r is a single
+    radius or a column of radii."""
+    _columnNames = ('cx','cy','r')
+
+    _attrMap = AttrMap(BASE=SolidShape,
+        cx = AttrMapValue(isNumberArray,desc="x coordinates of the centres"),
+        cy = AttrMapValue(isNumberArray,desc="y coordinates of the centres"),
+        r = AttrMapValue(isNumberOrNumberArray,desc="radius or column of radii"),
+        )
+
+    def __init__(self, cx, cy, r, **kw):
+        SolidShape.__init__(self, kw)
+        self.cx = _numberColumn(cx)
+        self.cy = _numberColumn(cy)
+        self.r = _numberColumn(r)
+
+    def getCircles(self):
+        "iterate over (cx, cy, r) for each circle"
+        return izip(self.cx,self.cy,_iterColumn(self.r))
+
+    def getBounds(self):
+        cx, cy, r = self.cx, self.cy, self.r
+        if not len(cx): return None
+        if type(r) in (FloatType,IntType):
+            r = abs(r)
+            return (min(cx)-r, min(cy)-r, max(cx)+r, max(cy)+r)
+        r = map(abs,r)
+        return (min(map(operator.sub,cx,r)), min(map(operator.sub,cy,r)),
+                max(map(operator.add,cx,r)), max(map(operator.add,cy,r)))
+
 class Ellipse(SolidShape):
     _attrMap = AttrMap(BASE=SolidShape,
         cx = AttrMapValue(isNumber),
@@ -5,6 +5,14 @@ Arciv Stream  ciphering
 '''
 __version__=''' $Id$ '''
 from types import StringType
+try:
+	from _rl_accel import arciv as _arciv
+except ImportError:
+	try:
+		from reportlab.lib._rl_accel import arciv as _arciv
+	except ImportError:
+		_arciv = None
+
 class ArcIV:
 	'''
 	performs 'ArcIV' Stream Encryption of S using key
@@ -45,17 +53,17 @@ class ArcIV:
 		sbox, i, j = self._sbox, self._i, self._j
 
 		C = type(B) is StringType and map(ord,B) or B[:]
-		n = len(C)
-		p = 0
-		while p<n:
+		for p in xrange(len(C)):
 			#update the variables i, j.
-			self._i = i = (i + 1) % 256
-			self._j = j = (j + sbox[i]) % 256
+			i = (i + 1) & 255
+			si = sbox[i]
+			j = (j + si) & 255
 			#swap sbox[i] and sbox[j]
-			sbox[i], sbox[j] = sbox[j], sbox[i]
+			sbox[i] = sj = sbox[j]
+			sbox[j] = si
 			#overwrite the plaintext with the ciphered byte
-			C[p] = C[p] ^ sbox[(sbox[i] + sbox[j]) % 256]
-			p = p + 1
+			C[p] ^= sbox[(si + sj) & 255]
+		self._i, self._j = i, j
 		return C
 
 	def encode(self,S):
@@ -196,13 +204,14 @@ _TESTS=[{
 	]
 
 def encode(text, key):
-	"One-line shortcut for making an encoder object"
+	"One-line shortcut for making an encoder object (uses _rl_accel if available)"
+	if _arciv: return _arciv(key,text)
 	return ArcIV(key).encode(text)
 
 def decode(text, key):
 	"One-line shortcut for decoding"
 	# yes, encode and decode are symmetric - see docstring
-	return ArcIV(key).encode(text)
+	return encode(text, key)
 
 if __name__=='__main__':
 	i = 0
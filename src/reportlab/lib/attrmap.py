@@ -95,23 +95,45 @@ class AttrMap(UserDict):
         c.update(kw)
         return c
 
+try:
+    from threading import local as _local
+except ImportError:
+    class _local:
+        pass
+
+class _ShapeCheckingState(_local):
+    on = 1
+_shapeCheckingState = _ShapeCheckingState()
+
+def setShapeChecking(on):
+    '''turn attribute validation on or off for the current thread only;
+    returns the previous setting.  rl_config.shapeChecking must also be
+    true for checking to happen.'''
+    old = _shapeCheckingState.on
+    _shapeCheckingState.on = on and 1 or 0
+    return old
+
+def getShapeChecking():
+    '''true if attribute assignments are being validated in this thread'''
+    return rl_config.shapeChecking and _shapeCheckingState.on
+
 def validateSetattr(obj,name,value):
     '''validate setattr(obj,name,value)'''
-    if rl_config.shapeChecking:
+    if rl_config.shapeChecking and _shapeCheckingState.on:
         map = obj._attrMap
-        if map and name[0]!= '_':
+        if map is not None and name[0]!= '_':
+            #look in the underlying dictionary directly; this is called
+            #for every assignment to every shape
+            map = map.data
             #we always allow the inherited values; they cannot
             #be checked until draw time.
-            if isinstance(value, DerivedValue):
-                #let it through
-                pass
-            else:            
+            if map and not isinstance(value, DerivedValue):
                 try:
                     validate = map[name].validate
-                    if not validate(value):
-                        raise AttributeError, "Illegal assignment of '%s' to '%s' in class %s" % (value, name, obj.__class__.__name__)
                 except KeyError:
                     raise AttributeError, "Illegal attribute '%s' in class %s" % (name, obj.__class__.__name__)
+                if not validate(value):
+                    raise AttributeError, "Illegal assignment of '%s' to '%s' in class %s" % (value, name, obj.__class__.__name__)
     obj.__dict__[name] = value
 
 def _privateAttrMap(obj,ret=0):
@@ -14,9 +14,11 @@ These can be constructed from several popular formats.  We also include
 - various conversion and construction functions
 '''
 import string, math
-from types import StringType, ListType, TupleType
+from types import StringType, ListType, TupleType, IntType
 from reportlab.lib.utils import fp_str
 _SeqTypes = (ListType,TupleType)
+_CacheTypes = (StringType,TupleType,IntType)
+_colorCacheSize = 1024
 
 class Color:
     """This class is used to represent color.  Components red, green, blue
@@ -26,6 +28,17 @@ class Color:
         "Initialize with red, green, blue in range [0-1]."
         self.red, self.green, self.blue = red,green,blue
 
+    def __setattr__(self, name, value):
+        if self.__dict__.has_key('_shared'):
+            raise AttributeError('%r is shared and may not be changed, copy it first' % self)
+        self.__dict__[name] = value
+
+    def __getstate__(self):
+        "copies and unpickled colors are not shared"
+        state = self.__dict__.copy()
+        if state.has_key('_shared'): del state['_shared']
+        return state
+
     def __repr__(self):
         return "Color(%s)" % string.replace(fp_str(self.red, self.green, self.blue),' ',',')
 
@@ -165,6 +178,15 @@ def rgb2cmyk(r,g,b):
     k = min(1,max(0,k))
     return (c,m,y,k)
 
+def _intern(c):
+    "mark a color as shared; from then on its attributes may not be changed"
+    c.__dict__['_shared'] = 1
+    return c
+
+def isInterned(c):
+    "true if c is a shared color instance which may not be changed"
+    return c.__dict__.has_key('_shared')
+
 def color2bw(colorRGB):
     "Transform an RGB color to a black and white equivalent."
 
@@ -209,6 +231,19 @@ def HexColor(val, htmlOnly=False):
 
     """ #" for emacs
 
+    key = val, htmlOnly
+    try:
+        return _hexColorCache[key]
+    except (KeyError, TypeError):
+        pass
+    c = _HexColor(val, htmlOnly)
+    if type(val) in _CacheTypes:
+        if len(_hexColorCache)>=_colorCacheSize: _hexColorCache.clear()
+        _hexColorCache[key] = _intern(c)
+    return c
+_hexColorCache = {}
+
+def _HexColor(val, htmlOnly=False):
     if type(val) == StringType:
         b = 10
         if val[:1] == '#':
@@ -532,9 +567,33 @@ def describe(aColor,mode=0):
         raise ValueError, "Illegal value for mode "+str(mode)
 
 def toColor(arg,default=None):
-    '''try to map an arbitrary arg to a color instance'''
+    '''try to map an arbitrary arg to a color instance
+
+    Colors made from strings, tuples and integers are remembered and
+    shared, so they may not be changed; copy them if necessary.'''
     if isinstance(arg,Color): return arg
     tArg = type(arg)
+    if tArg in _CacheTypes:
+        try:
+            return _toColorCache[arg]
+        except (KeyError, TypeError):
+            pass
+    c = _toColor(arg,tArg,_toColorFail)
+    if c is _toColorFail:
+        if default is None:
+            raise ValueError('Invalid color value %r' % arg)
+        return default
+    if tArg in _CacheTypes:
+        try:
+            if len(_toColorCache)>=_colorCacheSize: _toColorCache.clear()
+            _toColorCache[arg] = _intern(c)
+        except TypeError:
+            pass
+    return c
+_toColorCache = {}
+_toColorFail = []
+
+def _toColor(arg,tArg,default):
     if tArg in _SeqTypes:
         assert 3<=len(arg)<=4, 'Can only convert 3 and 4 sequences to color'
         assert 0<=min(arg) and max(arg)<=1
@@ -551,8 +610,6 @@ def toColor(arg,default=None):
     try:
         return HexColor(arg)
     except:
-        if default is None:
-            raise ValueError('Invalid color value %r' % arg)
         return default
 
 def toColorOrNone(arg,default=None):
@@ -585,7 +642,8 @@ def setColors(**kw):
     getAllNamedColors()
     for k, c in assigned.items():
         globals()[k] = c
-        if isinstance(c,Color): _namedColors[k] = c
+        if isinstance(c,Color): _namedColors[k] = _intern(c)
+    _toColorCache.clear()
 
 def Whiter(c,f):
     '''given a color combine with white as c*f w*(1-f) 0<=f<=1'''
@@ -10,7 +10,9 @@ try:
 except ImportError:
     from md5 import md5
 
+from struct import pack
 from reportlab.lib.utils import getStringIO
+from reportlab.lib import arciv
 import tempfile
 
 from reportlab.pdfgen.canvas import Canvas
@@ -80,7 +82,11 @@ class StandardEncryption:
             raise ValueError, "encryption not prepared!"
         if self.objnum is None:
             raise ValueError, "not registered in PDF object"
-        return encodePDF(self.key, self.objnum, self.version, t, revision=self.revision)
+        key = self._objectKey
+        if key is None:
+            #an object's strings and stream all use the same key
+            key = self._objectKey = objectKey(self.key, self.objnum, self.version, self.revision)
+        return arciv.encode(t, key)
     def prepare(self, document, overrideID=None):
         # get ready to do encryption
         if DEBUG: print 'StandardEncryption.prepare(...) - revision %d' % self.revision
@@ -117,7 +123,7 @@ class StandardEncryption:
         self.U = computeU(self.key, revision=self.revision, documentId=internalID)
         if DEBUG:
             print "self.U (as hex) = %s" % hexText(self.U)
-        self.objnum = self.version = None
+        self.objnum = self.version = self._objectKey = None
         self.prepared = 1
     def register(self, objnum, version):
         # enter a new direct object
@@ -125,6 +131,7 @@ class StandardEncryption:
             raise ValueError, "encryption not prepared!"
         self.objnum = objnum
         self.version = version
+        self._objectKey = None
     def info(self):
         # the representation of self in file if any (should be None or PDFDict)
         if not self.prepared:
@@ -284,27 +291,22 @@ def checkU(encryptionkey, U):
             raise ValueError, "lengths don't match! (password failed)"
         raise ValueError, "decode of U doesn't match fixed padstring (password failed)"
 
-def encodePDF(key, objectNumber, generationNumber, string, revision=2):
-    "Encodes a string or stream"
-    #print 'encodePDF (%s, %d, %d, %s)' % (hexText(key), objectNumber, generationNumber, string)
+def objectKey(key, objectNumber, generationNumber, revision=2):
+    "the key used to encode the strings and streams of one object"
     # extend 3 bytes of the object Number, low byte first
-    newkey = key
-    n = objectNumber
-    for i in range(3):
-        newkey = newkey + chr(n & 0xff)
-        n = n>>8
-    # extend 2 bytes of the generationNumber
-    n = generationNumber
-    for i in range(2):
-        newkey = newkey + chr(n & 0xff)
-        n = n>>8
+    # and 2 bytes of the generationNumber
+    newkey = key + pack('<i',objectNumber)[:3] + pack('<i',generationNumber)[:2]
     md5output = md5(newkey).digest()
     if revision == 2:
-        key = md5output[:10]
+        return md5output[:10]
     elif revision == 3:
-        key = md5output #all 16 bytes
-    from reportlab.lib.arciv import ArcIV
-    encrypted = ArcIV(key).encode(string)
+        return md5output #all 16 bytes
+
+def encodePDF(key, objectNumber, generationNumber, string, revision=2):
+    "Encodes a string or stream"
+    #print 'encodePDF (%s, %d, %d, %s)' % (hexText(key), objectNumber, generationNumber, string)
+    key = objectKey(key, objectNumber, generationNumber, revision)
+    encrypted = arciv.encode(string, key)
     #print 'encrypted=', hexText(encrypted)
     if DEBUG: print 'encodePDF(%s,%s,%s,%s,%s)==>%s' % tuple(map(lambda x: hexText(str(x)),(key, objectNumber, generationNumber, string, revision,encrypted)))
     return encrypted
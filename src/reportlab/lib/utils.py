@@ -259,6 +259,34 @@ if ',' in fp_str(0.25):
     def fp_str(*a):
         return string.replace(apply(_FP_STR,a),',','.')
 
+try:
+    try:
+        from _rl_accel import fp_path
+    except ImportError:
+        from reportlab.lib._rl_accel import fp_path
+except ImportError:
+    _fp_path_nargs = {'m':2, 'l':2, 'c':6, 'v':4, 'y':4, 'h':0}
+    def fp_path(points,ops=None):
+        """return PDF path code for the coordinates in points using the
+        single character operators in ops (m l c v y h); by default a
+        moveto followed by linetos"""
+        V = fp_str(list(points)).split()
+        n = len(V)
+        if ops is None:
+            if n<2 or n&1: raise ValueError('fp_path: need an even number of at least 2 coordinates')
+            ops = 'm'+'l'*(n/2-1)
+        R = []
+        j = 0
+        for op in ops:
+            try:
+                i, j = j, j+_fp_path_nargs[op]
+            except KeyError:
+                raise ValueError("fp_path: unknown path operator %r" % op)
+            if j>n: raise ValueError('fp_path: not enough coordinates')
+            R.append(string.join(V[i:j]+[op]))
+        if j!=n: raise ValueError('fp_path: too many coordinates')
+        return string.join(R)
+
 def recursiveImport(modulename, baseDir=None, noCWD=0, debug=0):
     """Dynamically imports possible packagized module, or raises ImportError"""
     normalize = lambda x: os.path.normcase(os.path.abspath(os.path.normpath(x)))
@@ -521,6 +549,85 @@ def rl_get_module(name,dir):
         del om
         if f: f.close()
 
+class DecodedImageCache:
+    """Bounded LRU cache of decoded image pixel data.
+
+    Entries are keyed on a file's absolute path, size and modification time
+    or on a digest of in memory image data, so changed files are decoded
+    again. The cached data is kept below maxSize bytes (None means use
+    rl_config.decodedImageCacheSize) by evicting the least recently used
+    entries; hits, misses and evictions are counted for getStats.
+    """
+    def __init__(self,maxSize=None):
+        self.maxSize = maxSize
+        self.clear()
+
+    def clear(self):
+        self._entries = {}
+        self._tick = 0
+        self.size = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def getMaxSize(self):
+        maxSize = self.maxSize
+        if maxSize is None:
+            from reportlab.rl_config import decodedImageCacheSize as maxSize
+        return maxSize
+
+    def get(self,key):
+        "return the value cached for key or None"
+        e = key is not None and self._entries.get(key,None)
+        if not e:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._tick += 1
+        e[0] = self._tick
+        return e[1]
+
+    def put(self,key,value,size):
+        "cache value (taking size bytes) under key; returns value"
+        maxSize = self.getMaxSize()
+        if key is None or size>maxSize: return value
+        if not self._entries:
+            from reportlab.rl_config import register_reset
+            register_reset(_resetDecodedImageCache)
+        self.remove(key)
+        self._tick += 1
+        self._entries[key] = [self._tick,value,size]
+        self.size += size
+        if self.size>maxSize:
+            L = [(e[0],k) for k,e in self._entries.items()]
+            L.sort()
+            for t,k in L:
+                if self.size<=maxSize: break
+                self.remove(k)
+                self.evictions += 1
+        return value
+
+    def remove(self,key):
+        e = self._entries.pop(key,None)
+        if e: self.size -= e[2]
+
+    def getStats(self):
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                    entries=len(self._entries), size=self.size, maxSize=self.getMaxSize())
+
+decodedImageCache = DecodedImageCache()
+def _resetDecodedImageCache():
+    decodedImageCache.clear()
+
+def _imageFileKey(fileName):
+    "cache key for an image file or None if it isn't a local file"
+    try:
+        st = os.stat(fileName)
+    except:
+        return None
+    return (os.path.abspath(fileName),st.st_size,st.st_mtime)
+
 def _isPILImage(im):
     try:
         from PIL.Image import Image
@@ -543,8 +650,11 @@ class ImageReader(object):
         self._height = None
         self._transparent = None
         self._data = None
+        self._cacheKey = None
+        self._format = None
         if _isPILImage(fileName):
             self._image = fileName
+            self._format = getattr(fileName,'format',None)
             self.fp = getattr(fileName,'fp',None)
             try:
                 self.fileName = self._image.fileName
@@ -573,11 +683,22 @@ class ImageReader(object):
                     self.fp.close()
                     del self.fp #will become a property in the next statement
                     self.__class__=LazyImageReader
+                if isinstance(fileName,basestring): self._cacheKey = _imageFileKey(fileName)
+                if not self._cacheKey and isinstance(self.__dict__.get('fp',None),_StringIOKlass):
+                    self._cacheKey = (md5(self.fp.getvalue()).digest(),)
                 if haveImages:
-                    #detect which library we are using and open the image
-                    if not self._image:
-                        self._image = self._read_image(self.fp)
-                    if getattr(self._image,'format',None)=='JPEG': self.jpeg_fh = self._jpeg_fh
+                    info = self._readInfo()
+                    if info:
+                        #the header gave format and size, leave opening the image
+                        #until the pixels are wanted (see __getattr__)
+                        self._format, self._width, self._height = info
+                        del self.__dict__['_image']
+                    else:
+                        #detect which library we are using and open the image
+                        if not self._image:
+                            self._image = self._read_image(self.fp)
+                        self._format = getattr(self._image,'format',None)
+                    if self._format=='JPEG': self.jpeg_fh = self._jpeg_fh
                 else:
                     from reportlab.pdfbase.pdfutils import readJPEGInfo
                     try:
@@ -585,6 +706,7 @@ class ImageReader(object):
                     except:
                         raise RuntimeError('Imaging Library not available, unable to import bitmaps only jpegs')
                     self.jpeg_fh = self._jpeg_fh
+                    self._format = 'JPEG'
                     self._data = self.fp.read()
                     self._dataA=None
                     self.fp.seek(0)
@@ -597,6 +719,26 @@ class ImageReader(object):
                 else:
                     raise
 
+    def __getattr__(self,a):
+        if a=='_image':
+            fp = self.fp
+            fp.seek(0)
+            im = self._image = self._read_image(fp)
+            return im
+        raise AttributeError(a)
+
+    def _readInfo(self):
+        "return (format, width, height) from the file header or None"
+        from reportlab.pdfbase.pdfutils import readImageInfo
+        fp = self.fp
+        try:
+            try:
+                return readImageInfo(fp)
+            finally:
+                fp.seek(0)
+        except:
+            return None
+
     def _read_image(self,fp):
         if sys.platform[0:4] == 'java':
             from javax.imageio import ImageIO
@@ -613,6 +755,18 @@ class ImageReader(object):
     def jpeg_fh(self):
         return None
 
+    def png_data(self):
+        "Return the contents of the underlying PNG file (None for other images)"
+        if self._format!='PNG': return None
+        try:
+            fp = self.fp
+            fp.seek(0)
+            data = fp.read()
+        except:
+            return None
+        if data[:8]!='\211PNG\r\n\032\n': return None
+        return data
+
     def getSize(self):
         if (self._width is None or self._height is None):
             if sys.platform[0:4] == 'java':
@@ -645,6 +799,10 @@ class ImageReader(object):
                 self._data = ''.join(pixels)
                 self.mode = 'RGB'
             else:
+                r = self._cacheKey and decodedImageCache.get(self._cacheKey)
+                if r:
+                    self.mode, self._data, self._dataA = r
+                    return self._data
                 im = self._image
                 mode = self.mode = im.mode
                 if mode=='RGBA':
@@ -655,6 +813,9 @@ class ImageReader(object):
                     im = im.convert('RGB')
                     self.mode = 'RGB'
                 self._data = im.tostring()
+                size = len(self._data)
+                if self._dataA: size += size//3
+                decodedImageCache.put(self._cacheKey,(self.mode,self._data,self._dataA),size)
         return self._data
 
     def getImageData(self):
@@ -685,6 +846,22 @@ class LazyImageReader(ImageReader):
         return self._read_image(self.fp)
     _image=property(_image) 
 
+def getRGBImageData(image):
+    """Return (width, height, RGB pixel string) for an image file name,
+    ImageReader or PIL image using decodedImageCache where possible"""
+    if isinstance(image,ImageReader): key = image._cacheKey
+    elif isinstance(image,basestring): key = _imageFileKey(image)
+    else: key = None
+    if key:
+        key += ('RGB',)
+        r = decodedImageCache.get(key)
+        if r: return r
+    if not isinstance(image,ImageReader): image = ImageReader(image)
+    im = image._image
+    if im.mode!='RGB': im = im.convert('RGB')
+    r = im.size+(im.tostring(),)
+    return decodedImageCache.put(key,r,len(r[2]))
+
 def getImageData(imageFileName):
     "Get width, height and RGB pixels from image file.  Wraps Java/PIL"
     try:
@@ -6,6 +6,7 @@ __doc__="""Standard verifying functions used by attrmap."""
 
 import string, sys, codecs
 from types import *
+from array import ArrayType
 _SequenceTypes = (ListType,TupleType)
 _NumberTypes = (FloatType,IntType)
 from reportlab.lib import colors
@@ -140,6 +141,18 @@ class _isTransform(Validator):
         else:
             return False
 
+class _isNumberArray(Validator):
+    "Validator for a column of numbers; an array.array or a sequence."
+    def test(self, x):
+        if isinstance(x,ArrayType):
+            return x.typecode in 'bBhHiIlLfd'
+        if type(x) in _SequenceTypes:
+            for element in x:
+                if not isNumber(element):
+                    return False
+            return True
+        return False
+
 class _isColor(Validator):
     "Color validator class."
     def test(self, x):
@@ -302,6 +315,8 @@ isListOfShapes = _isListOfShapes()
 isListOfStrings = SequenceOf(isString,'isListOfStrings')
 isListOfStringsOrNone = _isListOfStringsOrNone()
 isTransform = _isTransform()
+isNumberArray = _isNumberArray()
+isNumberOrNumberArray = EitherOr((isNumber,isNumberArray),'isNumberOrNumberArray')
 isColor = _isColor()
 isListOfColors = SequenceOf(isColor,'isListOfColors')
 isColorOrNone = _isColorOrNone()
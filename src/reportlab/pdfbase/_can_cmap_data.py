@@ -36,9 +36,8 @@ def run():
         font = UnicodeCIDFont(fontName)
 
         widthsByCID = font.face._explicitWidths
-        cmap = font.encoding._cmap
         nonStandardWidthsByUnichar = {}
-        for (codePoint, cid) in cmap.items():
+        for (codePoint, cid) in font.encoding.items():
             width = widthsByCID.get(cid, 1000)
             if width <> 1000:
                 nonStandardWidthsByUnichar[unichr(codePoint)] = width
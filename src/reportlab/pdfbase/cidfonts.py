@@ -13,12 +13,15 @@ from types import ListType, TupleType, DictType
 from string import find, split, strip
 import marshal
 import time
+from array import array
+from bisect import bisect_right
 try:
     from hashlib import md5
 except ImportError:
     from md5 import md5
 
 import reportlab
+from reportlab import rl_config
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase._cidfontdata import allowedTypeFaces, allowedEncodings, CIDFontInfo, \
      defaultUnicodeEncodings, widthsByUnichar
@@ -57,6 +60,59 @@ def structToPDF(structure):
     else:
         return structure
 
+#bumped whenever the layout of .fastmap files changes
+_fastmapFormat = 2
+
+def _rangeTable(ranges, merge=0):
+    """Turn a list of (start, end, value) code ranges into three sorted
+    arrays (starts, ends, values) of disjoint ranges suitable for bisection.
+
+    Where ranges overlap the later one wins, as if each range had been
+    expanded into a dictionary in order; a split range keeps its value
+    offsets.  With merge set, overlapping or adjacent ranges are simply
+    joined and the values ignored."""
+    R = ranges[:]
+    R.sort()
+    disjoint = 1
+    for i in xrange(1, len(R)):
+        if R[i][0] <= R[i-1][1]:
+            disjoint = 0
+            break
+    if merge:
+        table = []
+        for start, end, value in R:
+            if table and start <= table[-1][1] + 1:
+                if end > table[-1][1]:
+                    table[-1][1] = end
+            else:
+                table.append([start, end, 0])
+        R = table
+    elif not disjoint:
+        #rare; usually a CMAP overriding parts of one it uses
+        starts = []
+        ends = []
+        table = []
+        for start, end, value in ranges:
+            i = bisect_right(ends, start - 1)
+            j = i
+            while j < len(starts) and starts[j] <= end:
+                j = j + 1
+            new = [(start, end, value)]
+            if i < j:
+                s, e, v = table[i]
+                if s < start:
+                    new.insert(0, (s, start - 1, v))
+                s, e, v = table[j-1]
+                if e > end:
+                    new.append((end + 1, e, v + end + 1 - s))
+            table[i:j] = new
+            starts[i:j] = [r[0] for r in new]
+            ends[i:j] = [r[1] for r in new]
+        R = table
+    return (array('l', [r[0] for r in R]),
+            array('l', [r[1] for r in R]),
+            array('l', [r[2] for r in R]))
+
 class CIDEncoding(pdfmetrics.Encoding):
     """Multi-byte encoding.  These are loaded from CMAP files.
 
@@ -74,16 +130,30 @@ class CIDEncoding(pdfmetrics.Encoding):
         self._mapFileHash = None
         self._codeSpaceRanges = []
         self._notDefRanges = []
-        self._cmap = {}
+        self._cidRanges = _rangeTable([])
+        self._setupTables()
         self.source = None
         if not DISABLE_CMAP:
-            if useCache:
+            store = stored = None
+            if rl_config.fontMetricStore:
+                from reportlab.pdfbase.metricstore import getMetricStore
+                store = getMetricStore()
+                stored = store and store.getCMap(name)
+            if stored:
+                self._mapFileHash, self._codeSpaceRanges, self._notDefRanges, self._cidRanges = stored
+                self._setupTables()
+                self.source = store.fileName
+            elif useCache:
                 from reportlab.lib.utils import get_rl_tempdir
                 fontmapdir = get_rl_tempdir('FastCMAPS')
                 if os.path.isfile(fontmapdir + os.sep + name + '.fastmap'):
-                    self.fastLoad(fontmapdir)
-                    self.source = fontmapdir + os.sep + name + '.fastmap'
-                else:
+                    try:
+                        self.fastLoad(fontmapdir)
+                        self.source = fontmapdir + os.sep + name + '.fastmap'
+                    except ValueError:
+                        #written by an older version
+                        pass
+                if self.source is None:
                     self.parseCMAPFile(name)
                     self.source = 'CMAP: ' + name
                     self.fastSave(fontmapdir)
@@ -100,8 +170,17 @@ class CIDEncoding(pdfmetrics.Encoding):
         ones.  Some refer to others with a 'usecmap'
         command"""
         #started = time.clock()
+        cidRanges = []
+        self._readCMAPFile(name, cidRanges)
+        self._cidRanges = _rangeTable(cidRanges)
+        self._setupTables()
+        #finished = time.clock()
+        #print 'parsed CMAP %s in %0.4f seconds' % (self.name, finished - started)
+
+    def _readCMAPFile(self, name, cidRanges):
+        """Collect the ranges of one CMAP file (and any it uses) in
+        file order; later ranges override earlier ones."""
         cmapfile = findCMapFile(name)
-        # this will CRAWL with the unicode encodings...
         rawdata = open(cmapfile, 'r').read()
 
         self._mapFileHash = self._hash(rawdata)
@@ -112,58 +191,95 @@ class CIDEncoding(pdfmetrics.Encoding):
             #they tell us to look in another file
             #for the code space ranges. The one
             # to use will be the previous word.
-            chunk = rawdata[0:usecmap_pos]
-            words = split(chunk)
-            otherCMAPName = words[-1]
+            otherCMAPName = split(rawdata[0:usecmap_pos])[-1]
+            if otherCMAPName[:1] == '/':
+                otherCMAPName = otherCMAPName[1:]
             #print 'referred to another CMAP %s' % otherCMAPName
-            self.parseCMAPFile(otherCMAPName)
+            self._readCMAPFile(otherCMAPName, cidRanges)
             # now continue parsing this, as it may
             # override some settings
 
-
+        # a single pass over the tokens; each begin... section is
+        # consumed by an index rather than by reslicing the word list
         words = split(rawdata)
-        while words <> []:
-            if words[0] == 'begincodespacerange':
-                words = words[1:]
-                while words[0] <> 'endcodespacerange':
-                    strStart, strEnd, words = words[0], words[1], words[2:]
-                    start = int(strStart[1:-1], 16)
-                    end = int(strEnd[1:-1], 16)
-                    self._codeSpaceRanges.append((start, end),)
-            elif words[0] == 'beginnotdefrange':
-                words = words[1:]
-                while words[0] <> 'endnotdefrange':
-                    strStart, strEnd, strValue = words[0:3]
-                    start = int(strStart[1:-1], 16)
-                    end = int(strEnd[1:-1], 16)
-                    value = int(strValue)
-                    self._notDefRanges.append((start, end, value),)
-                    words = words[3:]
-            elif words[0] == 'begincidrange':
-                words = words[1:]
-                while words[0] <> 'endcidrange':
-                    strStart, strEnd, strValue = words[0:3]
-                    start = int(strStart[1:-1], 16)
-                    end = int(strEnd[1:-1], 16)
-                    value = int(strValue)
-                    # this means that 'start' corresponds to 'value',
-                    # start+1 corresponds to value+1 and so on up
-                    # to end
-                    offset = 0
-                    while start + offset <= end:
-                        self._cmap[start + offset] = value + offset
-                        offset = offset + 1
-                    words = words[3:]
-
+        n = len(words)
+        i = 0
+        while i < n:
+            word = words[i]
+            i = i + 1
+            if word == 'begincodespacerange':
+                while words[i] <> 'endcodespacerange':
+                    self._codeSpaceRanges.append((int(words[i][1:-1], 16), int(words[i+1][1:-1], 16)))
+                    i = i + 2
+            elif word == 'beginnotdefrange':
+                while words[i] <> 'endnotdefrange':
+                    self._notDefRanges.append((int(words[i][1:-1], 16), int(words[i+1][1:-1], 16), int(words[i+2])))
+                    i = i + 3
+            elif word == 'begincidrange':
+                # this means that 'start' corresponds to 'value',
+                # start+1 corresponds to value+1 and so on up
+                # to end
+                while words[i] <> 'endcidrange':
+                    cidRanges.append((int(words[i][1:-1], 16), int(words[i+1][1:-1], 16), int(words[i+2])))
+                    i = i + 3
+            elif word == 'begincidchar':
+                while words[i] <> 'endcidchar':
+                    code = int(words[i][1:-1], 16)
+                    cidRanges.append((code, code, int(words[i+1])))
+                    i = i + 2
+
+    def _setupTables(self):
+        "build the bisection tables used by translate"
+        self._codeSpaceTable = _rangeTable([(low, high, 0) for low, high in self._codeSpaceRanges], merge=1)[:2]
+        # the first notdef range containing a code is the one used
+        notDefRanges = self._notDefRanges[:]
+        notDefRanges.reverse()
+        self._notDefTable = _rangeTable(notDefRanges)
+        self._translated = {}
+
+    def lookup(self, num, default=None):
+        "return the CID mapped to code num"
+        starts, ends, values = self._cidRanges
+        i = bisect_right(starts, num) - 1
+        if i >= 0 and num <= ends[i]:
+            return values[i] + num - starts[i]
+        return default
+
+    def items(self):
+        "return a list of (code, CID) pairs for all mapped codes"
+        starts, ends, values = self._cidRanges
+        R = []
+        for i in xrange(len(starts)):
+            start = starts[i]
+            value = values[i] - start
+            R.extend([(code, value + code) for code in xrange(start, ends[i]+1)])
+        return R
+
+    def _translateCode(self, num):
+        "return the CID for code num, or None if it is not in a code space"
+        starts, ends = self._codeSpaceTable
+        i = bisect_right(starts, num) - 1
+        if i < 0 or num > ends[i]:
+            return None
+        cid = self.lookup(num)
+        if cid is None:
+            #not defined.  Try to find the appropriate
+            # notdef character, or failing that return
+            # zero
+            starts, ends, values = self._notDefTable
+            i = bisect_right(starts, num) - 1
+            if i >= 0 and num <= ends[i]:
+                cid = values[i]
             else:
-                words = words[1:]
-        #finished = time.clock()
-        #print 'parsed CMAP %s in %0.4f seconds' % (self.name, finished - started)
+                cid = 0
+        return cid
 
     def translate(self, text):
         "Convert a string into a list of CIDs"
         output = []
-        cmap = self._cmap
+        # codes seen before are remembered, so a text costs a
+        # dictionary lookup per character rather than a bisection
+        seen = self._translated
         lastChar = ''
         for char in text:
             if lastChar <> '':
@@ -172,26 +288,12 @@ class CIDEncoding(pdfmetrics.Encoding):
             else:
                 #print 'convert character "%s"' % char
                 num = ord(char)
-            lastChar = char
-            found = 0
-            for low, high in self._codeSpaceRanges:
-                if low < num < high:
-                    try:
-                        cid = cmap[num]
-                        #print '%d -> %d' % (num, cid)
-                    except KeyError:
-                        #not defined.  Try to find the appropriate
-                        # notdef character, or failing that return
-                        # zero
-                        cid = 0
-                        for low2, high2, notdef in self._notDefRanges:
-                            if low2 < num < high2:
-                                cid = notdef
-                                break
-                    output.append(cid)
-                    found = 1
-                    break
-            if found:
+            try:
+                cid = seen[num]
+            except KeyError:
+                cid = seen[num] = self._translateCode(num)
+            if cid is not None:
+                output.append(cid)
                 lastChar = ''
             else:
                 lastChar = char
@@ -199,20 +301,27 @@ class CIDEncoding(pdfmetrics.Encoding):
 
     def fastSave(self, directory):
         f = open(os.path.join(directory, self.name + '.fastmap'), 'wb')
+        marshal.dump(_fastmapFormat, f)
         marshal.dump(self._mapFileHash, f)
         marshal.dump(self._codeSpaceRanges, f)
         marshal.dump(self._notDefRanges, f)
-        marshal.dump(self._cmap, f)
+        for a in self._cidRanges:
+            marshal.dump(a.tostring(), f)
         f.close()
 
     def fastLoad(self, directory):
         started = time.clock()
         f = open(os.path.join(directory, self.name + '.fastmap'), 'rb')
-        self._mapFileHash = marshal.load(f)
-        self._codeSpaceRanges = marshal.load(f)
-        self._notDefRanges = marshal.load(f)
-        self._cmap = marshal.load(f)
-        f.close()
+        try:
+            if marshal.load(f) != _fastmapFormat:
+                raise ValueError('%s.fastmap has an unknown format' % self.name)
+            self._mapFileHash = marshal.load(f)
+            self._codeSpaceRanges = marshal.load(f)
+            self._notDefRanges = marshal.load(f)
+            self._cidRanges = tuple([array('l', marshal.load(f)) for i in (0, 1, 2)])
+        finally:
+            f.close()
+        self._setupTables()
         finished = time.clock()
         #print 'loaded %s in %0.4f seconds' % (self.name, finished - started)
 
@@ -222,7 +331,7 @@ class CIDEncoding(pdfmetrics.Encoding):
             'mapFileHash': self._mapFileHash,
             'codeSpaceRanges': self._codeSpaceRanges,
             'notDefRanges': self._notDefRanges,
-            'cmap': self._cmap,
+            'cidRanges': [list(a) for a in self._cidRanges],
             }
 
 class CIDTypeFace(pdfmetrics.TypeFace):
@@ -248,7 +357,11 @@ class CIDTypeFace(pdfmetrics.TypeFace):
         self.ascent = descFont['FontDescriptor']['Ascent']
         self.descent = descFont['FontDescriptor']['Descent']
         self._defaultWidth = descFont['DW']
-        self._explicitWidths = self._expandWidths(descFont['W'])
+        store = None
+        if rl_config.fontMetricStore:
+            from reportlab.pdfbase.metricstore import getMetricStore
+            store = getMetricStore()
+        self._explicitWidths = (store and store.getCIDWidths(name)) or self._expandWidths(descFont['W'])
 
         # should really support self.glyphWidths, self.glyphNames
         # but not done yet.
@@ -505,7 +618,7 @@ def test():
 ##        print 'encoding %s:' % encName
 ##        print '    codeSpaceRanges = %s' % enc._codeSpaceRanges
 ##        print '    notDefRanges = %s' % enc._notDefRanges
-##        print '    mapping size = %d' % len(enc._cmap)
+##        print '    mapping size = %d' % len(enc.items())
 ##    finished = time.time()
 ##    print 'constructed all encodings in %0.2f seconds' % (finished - started)
 
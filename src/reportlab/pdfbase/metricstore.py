@@ -0,0 +1,282 @@
+#Copyright ReportLab Europe Ltd. 2000-2004
+#see license.txt for license details
+__version__=''' $Id$ '''
+__doc__="""Read only font metric tables held in one memory mapped file.
+
+A metric store is compiled once (see compileMetricStore) from TrueType
+files, CID typefaces and CMAP files.  Processes then map the file instead
+of each building the same dictionaries, so the operating system shares
+the pages holding the tables between them.  Set rl_config.fontMetricStore
+to the file name and ttfonts and cidfonts will look there first; anything
+not in the store is loaded as before.
+
+The file is a small header, a number of little endian arrays and a
+marshalled directory of them.  It depends on the platform's marshal
+format, so compile it with the Python which will read it."""
+
+import os, marshal, struct
+from bisect import bisect_left
+
+_magic = 'RLMS'
+_version = 1
+_header = '<4sIII'   #magic, version, directory offset, directory length
+_headerSize = struct.calcsize(_header)
+
+class StoreArray:
+    """A read only sequence of numbers inside a metric store.
+
+    It supports len and indexing, which is all bisect needs."""
+    def __init__(self, data, typecode, offset, count):
+        self._data = data
+        self._format = '<'+typecode
+        self._itemSize = struct.calcsize(typecode)
+        self._typecode = typecode
+        self._offset = offset
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        count = self._count
+        if i < 0: i = i + count
+        if not 0 <= i < count:
+            raise IndexError('StoreArray index out of range')
+        start = self._offset + i*self._itemSize
+        return struct.unpack(self._format, self._data[start:start+self._itemSize])[0]
+
+    def tolist(self):
+        start = self._offset
+        return list(struct.unpack('<%d%s' % (self._count, self._typecode), self._data[start:start+self._count*self._itemSize]))
+
+_missing = []
+
+class StoreMapping:
+    """A read only mapping of integer keys to numbers inside a metric store.
+
+    Keys are found by bisection; found and missing keys are remembered
+    locally since a document uses few distinct characters."""
+    def __init__(self, keys, values):
+        self._keys = keys
+        self._values = values
+        self._seen = {}
+
+    def get(self, key, default=None):
+        try:
+            value = self._seen[key]
+        except KeyError:
+            keys = self._keys
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                value = self._values[i]
+            else:
+                value = _missing
+            self._seen[key] = value
+        if value is _missing:
+            return default
+        return value
+
+    def getValues(self, keys, default=None):
+        "return a list of the values of keys, default for those missing"
+        try:
+            R = map(self._seen.__getitem__, keys)
+        except KeyError:
+            get = self.get
+            R = [get(k, _missing) for k in keys]
+        if _missing in R:
+            R = [(v, default)[v is _missing] for v in R]
+        return R
+
+    def __getitem__(self, key):
+        value = self.get(key, _missing)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def has_key(self, key):
+        return self.get(key, _missing) is not _missing
+    __contains__ = has_key
+
+    def __len__(self):
+        return len(self._keys)
+
+    def keys(self):
+        return self._keys.tolist()
+
+    def values(self):
+        return self._values.tolist()
+
+    def items(self):
+        return zip(self._keys.tolist(), self._values.tolist())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+def _ttfName(fileName, subfontNameX=''):
+    return 'ttf:%s%s' % (os.path.abspath(fileName), subfontNameX)
+
+def _fileStamp(fileName):
+    st = os.stat(fileName)
+    return st.st_size, int(st.st_mtime)
+
+class MetricStore:
+    "A compiled metric store file, mapped read only"
+    def __init__(self, fileName):
+        import mmap
+        self.fileName = fileName
+        f = open(fileName, 'rb')
+        try:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+        if len(self._data)<_headerSize:
+            raise ValueError('"%s" is not a font metric store' % fileName)
+        magic, version, dirOffset, dirLength = struct.unpack(_header, self._data[:_headerSize])
+        if magic!=_magic or version!=_version:
+            raise ValueError('"%s" is not a version %d font metric store' % (fileName, _version))
+        self._sections = marshal.loads(self._data[dirOffset:dirOffset+dirLength])
+
+    def has_key(self, name):
+        return self._sections.has_key(name)
+
+    def names(self):
+        return self._sections.keys()
+
+    def getArray(self, name):
+        typecode, offset, count = self._sections[name]
+        return StoreArray(self._data, typecode, offset, count)
+
+    def getMapping(self, name):
+        return StoreMapping(self.getArray(name+'.keys'), self.getArray(name+'.values'))
+
+    def getInfo(self, name):
+        offset, length = self._sections[name+'.info'][1:]
+        return marshal.loads(self._data[offset:offset+length])
+
+    def getTTFCharInfo(self, fileName, subfontNameX=''):
+        """return (charToGlyph, charWidths) for a TrueType file or None
+        if it is not in the store or has changed since"""
+        name = _ttfName(fileName, subfontNameX)
+        if not self._sections.has_key(name+'.info'): return None
+        try:
+            if _fileStamp(fileName)!=self.getInfo(name): return None
+        except OSError:
+            return None
+        return self.getMapping(name+'.charToGlyph'), self.getMapping(name+'.charWidths')
+
+    def getCIDWidths(self, faceName):
+        "return the CID to width mapping of a CID typeface or None"
+        name = 'cidwidths:'+faceName
+        if not self._sections.has_key(name+'.keys'): return None
+        return self.getMapping(name)
+
+    def getCMap(self, encodingName):
+        """return (mapFileHash, codeSpaceRanges, notDefRanges, cidRanges)
+        for a CMAP or None"""
+        name = 'cmap:'+encodingName
+        if not self._sections.has_key(name+'.info'): return None
+        mapFileHash, codeSpaceRanges, notDefRanges = self.getInfo(name)
+        return mapFileHash, codeSpaceRanges, notDefRanges, tuple([self.getArray(name+x) for x in ('.starts','.ends','.values')])
+
+class MetricStoreWriter:
+    "Collects metric tables and writes them as a store file"
+    def __init__(self):
+        self._sections = []
+
+    def addArray(self, name, typecode, values):
+        self._sections.append((name, typecode, len(values), struct.pack('<%d%s' % (len(values), typecode), *values)))
+
+    def addInfo(self, name, value):
+        data = marshal.dumps(value)
+        self._sections.append((name+'.info', 'm', len(data), data))
+
+    def addMapping(self, name, mapping, typecode):
+        items = mapping.items()
+        items.sort()
+        self.addArray(name+'.keys', 'I', [k for k,v in items])
+        self.addArray(name+'.values', typecode, [v for k,v in items])
+
+    def addTTF(self, fileName, subfontIndex=0):
+        "add the character tables of a TrueType file"
+        from reportlab.pdfbase.ttfonts import TTFontFile
+        face = TTFontFile(fileName, subfontIndex=subfontIndex)
+        name = _ttfName(face.filename, face.subfontNameX)
+        self.addMapping(name+'.charToGlyph', face.charToGlyph, 'I')
+        self.addMapping(name+'.charWidths', face.charWidths, 'd')
+        self.addInfo(name, _fileStamp(face.filename))
+
+    def addCIDWidths(self, faceName):
+        "add the widths of one of the built in CID typefaces"
+        from reportlab.pdfbase.cidfonts import CIDTypeFace
+        self.addMapping('cidwidths:'+faceName, CIDTypeFace(faceName)._explicitWidths, 'i')
+
+    def addCMap(self, encodingName):
+        "add a CMAP, parsed from its file"
+        from reportlab.pdfbase.cidfonts import CIDEncoding
+        enc = CIDEncoding(encodingName, useCache=0)
+        enc.parseCMAPFile(encodingName)
+        name = 'cmap:'+encodingName
+        for x, a in zip(('.starts','.ends','.values'), enc._cidRanges):
+            self.addArray(name+x, 'i', a)
+        self.addInfo(name, (enc._mapFileHash, enc._codeSpaceRanges, enc._notDefRanges))
+
+    def save(self, fileName):
+        """write the store; it is written to a temporary file and renamed
+        so processes already mapping fileName are not disturbed"""
+        pos = _headerSize
+        directory = {}
+        chunks = []
+        for name, typecode, count, data in self._sections:
+            pad = -pos % 8
+            chunks.append('\0'*pad)
+            pos = pos + pad
+            directory[name] = (typecode, pos, count)
+            chunks.append(data)
+            pos = pos + len(data)
+        dirData = marshal.dumps(directory)
+        tmpName = '%s.%d.tmp' % (fileName, os.getpid())
+        f = open(tmpName, 'wb')
+        try:
+            f.write(struct.pack(_header, _magic, _version, pos, len(dirData)))
+            f.write(''.join(chunks))
+            f.write(dirData)
+        finally:
+            f.close()
+        if os.name!='posix' and os.path.exists(fileName):
+            os.remove(fileName)
+        os.rename(tmpName, fileName)
+
+def compileMetricStore(fileName, ttfFiles=(), cidFaces=None, cmaps=()):
+    """Write a metric store to fileName.
+
+    ttfFiles are TrueType file names or (fileName, subfontIndex) pairs,
+    cidFaces the CID typeface names (None means all the built in ones)
+    and cmaps the names of CMAP files to parse."""
+    w = MetricStoreWriter()
+    for fn in ttfFiles:
+        if type(fn) is type(()):
+            w.addTTF(*fn)
+        else:
+            w.addTTF(fn)
+    if cidFaces is None:
+        from reportlab.pdfbase._cidfontdata import allowedTypeFaces as cidFaces
+    for faceName in cidFaces:
+        w.addCIDWidths(faceName)
+    for encodingName in cmaps:
+        w.addCMap(encodingName)
+    w.save(fileName)
+
+_store = None, None
+
+def getMetricStore():
+    """the store named by rl_config.fontMetricStore, mapped once per
+    process, or None if there is none"""
+    global _store
+    from reportlab.rl_config import fontMetricStore as fileName
+    if not fileName: return None
+    if _store[0]!=fileName:
+        store = None
+        if os.path.isfile(fileName):
+            store = MetricStore(fileName)
+        _store = fileName, store
+    return _store[1]
@@ -18,7 +18,7 @@ import string, types, binascii, codecs
 from reportlab.pdfbase import pdfutils
 from reportlab.pdfbase.pdfutils import LINEEND # this constant needed in both
 from reportlab import rl_config
-from reportlab.lib.utils import import_zlib, open_for_read, fp_str, _digester
+from reportlab.lib.utils import import_zlib, open_for_read, fp_str, _digester, getStringIO
 from reportlab.pdfbase import pdfmetrics
 try:
     from hashlib import md5
@@ -146,13 +146,17 @@ class PDFDocument:
                  dummyoutline=0,
                  compression=rl_config.pageCompression,
                  invariant=rl_config.invariant,
-                 filename=None):
+                 filename=None,
+                 dedupStreams=None):
 
         # allow None value to be passed in to mean 'give system defaults'
         if invariant is None:
             self.invariant = rl_config.invariant
         else:
             self.invariant = invariant
+        if dedupStreams is None:
+            dedupStreams = rl_config.dedupStreams
+        self.dedupStreams = dedupStreams
         self.setCompression(compression)
         # signature for creating PDF ID
         sig = self.signature = md5()
@@ -366,6 +370,10 @@ class PDFDocument:
         encryptinfo = self.encrypt.info()
         if encryptinfo:
             encryptref = self.Reference(encryptinfo)
+        if self.dedupStreams:
+            preformatted = self._dedupStreams()
+        else:
+            preformatted = {}
         # make std fonts (this could be made optional
         counter = 0 # start at first object (object 1 after preincrement)
         ids = [] # the collection of object ids in object number order
@@ -382,7 +390,7 @@ class PDFDocument:
                 id = numbertoid[counter]
                 #printidToOb
                 obj = idToOb[id]
-                IO = PDFIndirectObject(id, obj)
+                IO = PDFIndirectObject(id, preformatted.get(id,obj))
                 # register object number and version
                 #encrypt.register(id,
                 IOf = IO.format(self)
@@ -421,6 +429,60 @@ class PDFDocument:
         # return string format for pdf file
         return File.format(self)
 
+    def _dedupStreams(self):
+        """collapse byte-identical stream objects (images, forms, font files,
+        CMaps etc) onto a single indirect object.
+
+        References to a duplicate are resolved to the number of the object
+        that is kept and the duplicate's own number is written as null.
+        Passes repeat until nothing more merges so that forms which differ
+        only by references to merged images are merged as well.  Returns a
+        dictionary of final formatted texts which can be written directly
+        when the document is not encrypted."""
+        numbertoid = self.numberToId
+        idToNV = self.idToObjectNumberAndVersion
+        idToOb = self.idToObject
+        encrypt = self.encrypt
+        self.encrypt = NoEncryption()   #keys must not depend on the object number
+        try:
+            merged = {}     #duplicate id -> its original object number
+            aliases = {}    #kept id -> ids of its duplicates
+            while 1:
+                seen = {}
+                formatted = {}
+                changed = 0
+                numbers = numbertoid.keys()
+                numbers.sort()
+                for n in numbers:
+                    id = numbertoid[n]
+                    obj = idToOb[id]
+                    if id in merged or not isinstance(obj,_streamClasses): continue
+                    f = format(obj, self, toplevel=1)
+                    key = md5(f).digest(), len(f)
+                    if seen.has_key(key):
+                        keep = seen[key]
+                        moved = [id]+aliases.pop(id,[])
+                        for other in moved:
+                            idToNV[other] = idToNV[keep]
+                        aliases.setdefault(keep,[]).extend(moved)
+                        merged[id] = n
+                        changed = 1
+                    else:
+                        seen[key] = id
+                        formatted[id] = f
+                if not changed: break
+        finally:
+            self.encrypt = encrypt
+        for id, n in merged.items():
+            #the duplicate's old number becomes an unused null object
+            null = 'Dedup.%s' % id
+            numbertoid[n] = null
+            idToNV[null] = (n, 0)
+            idToOb[null] = PDFnull
+        if not isinstance(encrypt, NoEncryption):
+            formatted = {}
+        return formatted
+
     def hasForm(self, name):
         """test for existence of named form"""
         internalname = xObjectName(name)
@@ -2027,17 +2089,66 @@ class PDFImageXObject:
             """
         self.mask = mask
 
-        if source is None:
-            pass # use the canned one.
-        elif hasattr(source,'jpeg_fh'):
+        if source is None: return   # use the canned one.
+        cache = pdfutils.imageXObjectCache
+        key = cache.getDir() and self._cacheKey(source)
+        state = key and cache.get(key)
+        if state:
+            self._setCacheState(state)
+            return
+        if hasattr(source,'jpeg_fh'):
             self.loadImageFromSRC(source)   #it is already a PIL Image
         else:
             # it is a filename
             import os
             ext = string.lower(os.path.splitext(source)[1])
             src = open_for_read(source)
-            if not(ext in ('.jpg', '.jpeg') and self.loadImageFromJPEG(src)):
+            if not(ext in ('.jpg', '.jpeg') and self.loadImageFromJPEG(src)
+                    or ext=='.png' and self.loadImageFromPNG(src)):
                 self.loadImageFromA85(src)
+        if key: cache.put(key,self._getCacheState())
+
+    def _cacheKey(self,source):
+        "the pdfutils.imageXObjectCache key for the content of source (or None)"
+        try:
+            if hasattr(source,'jpeg_fh'):
+                fp = source.jpeg_fh()
+                if fp:
+                    data = fp.read()
+                    fp.seek(0)
+                else:
+                    data = getattr(source,'png_data',None)
+                    data = data and data()
+                    if not data:
+                        data = source.getRGBData()
+                        data = '%s %s %s\0%s' % (source.getSize()+(source.mode,data))
+                        if self.mask=='auto' and source._dataA:
+                            data += source._dataA.getRGBData()
+            else:
+                data = open_for_read(source,'b').read()
+        except:
+            return None
+        return pdfutils.imageXObjectCache.makeKey(data,self.mask)
+
+    _cacheAttrs = ('width', 'height', 'bitsPerComponent', 'colorSpace', '_filters',
+                    'streamContent', 'mask', '_decode', '_decodeParms', '_dotrans')
+    def _getCacheState(self):
+        "return the encoded image as a dictionary of basic types"
+        D = {}
+        for a in self._cacheAttrs:
+            if a in self.__dict__: D[a] = self.__dict__[a]
+        if D.get('mask',None) is not None: D['mask'] = tuple(D['mask'])
+        smask = getattr(self,'_smask',None)
+        if smask: D['_smask'] = smask.name, smask._getCacheState()
+        return D
+
+    def _setCacheState(self,D):
+        D = D.copy()
+        smask = D.pop('_smask',None)
+        self.__dict__.update(D)
+        if smask:
+            self._smask = PDFImageXObject(smask[0])
+            self._smask._setCacheState(smask[1])
 
     def loadImageFromA85(self,source):
         IMG=[]
@@ -2073,6 +2184,72 @@ class PDFImageXObject:
         self.mask = None
         return True
 
+    def loadImageFromPNG(self,imageFile):
+        """Use the Flate data of a PNG directly, with a PNG predictor.
+
+        Returns False for the PNGs PDF cannot take as they are (interlaced,
+        16 bit, partial palette transparency); when there is no imaging
+        library the alpha channel of an RGBA or gray+alpha PNG is split off
+        here and becomes an SMask only if some pixel is not opaque.
+        """
+        try:
+            try:
+                info = pdfutils.readPNGInfo(imageFile)
+            finally:
+                imageFile.seek(0) #reset file pointer
+        except:
+            return False
+        ct, bpc = info['colorType'], info['bitDepth']
+        if info['interlace'] or bpc>8 or (ct!=0 and ct!=3 and bpc!=8): return False
+        mask = self.mask
+        if mask=='auto': mask = None
+        tRNS = info['tRNS']
+        if ct==3:
+            PLTE = info['PLTE']
+            if not PLTE or mask: return False   #an RGB key mask needs RGB samples
+            colorSpace = ('Indexed','DeviceRGB',len(PLTE)/3-1,PLTE)
+            if tRNS and self.mask=='auto':
+                if tRNS.strip('\000\377'): return False   #partial transparency
+                T = [i for i in xrange(len(tRNS)) if tRNS[i]=='\000']
+                if T:
+                    if T[-1]-T[0]+1!=len(T): return False   #a key mask can only hold one range
+                    mask = (T[0],T[-1])
+            colors = 1
+        elif ct in (4,6):
+            from reportlab.lib.utils import haveImages
+            if haveImages: return False     #let the imaging library separate the alpha
+            colorSpace, colors = ct==4 and ('DeviceGray',1) or ('DeviceRGB',3)
+        else:
+            colorSpace, colors = ct==0 and ('DeviceGray',1) or ('DeviceRGB',3)
+            if tRNS and self.mask=='auto':
+                import struct
+                mask = []
+                for v in struct.unpack('>%dH' % colors,tRNS[:2*colors]):
+                    mask.extend((v,v))
+        self.width, self.height = info['width'], info['height']
+        self.bitsPerComponent = bpc
+        self.colorSpace = colorSpace
+        self._filters = 'ASCII85Decode','FlateDecode' #'A85','Fl'
+        self._smask = None
+        if ct in (4,6):
+            zlib = import_zlib()
+            color, alpha = pdfutils.splitPNGAlpha(info)
+            self.streamContent = pdfutils._AsciiBase85Encode(zlib.compress(color))
+            if alpha and self.mask=='auto':
+                smask = self._smask = PDFImageXObject(_digester(alpha),None,mask=None)
+                smask.width, smask.height = self.width, self.height
+                smask.bitsPerComponent = 8
+                smask.colorSpace = 'DeviceGray'
+                smask._filters = self._filters
+                smask.streamContent = pdfutils._AsciiBase85Encode(zlib.compress(alpha))
+                smask._decode = [0,1]
+        else:
+            self.streamContent = pdfutils._AsciiBase85Encode(info['IDAT'])
+            self._decodeParms = dict(Predictor=15,Colors=colors,BitsPerComponent=bpc,Columns=self.width)
+        self.mask = mask
+        if hasattr(mask,'rgb'): self._checkTransparency(None)
+        return True
+
     def _checkTransparency(self,im):
         if self.mask=='auto':
             if im._dataA:
@@ -2092,8 +2269,12 @@ class PDFImageXObject:
     def loadImageFromSRC(self, im):
         "Extracts the stream, width and height"
         fp = im.jpeg_fh()
+        png = getattr(im,'png_data',None)
+        png = png and png()
         if fp:
             self.loadImageFromJPEG(fp)
+        elif png and self.loadImageFromPNG(getStringIO(png)):
+            pass
         else:
             zlib = import_zlib()
             if not zlib: return
@@ -2115,16 +2296,25 @@ class PDFImageXObject:
         dict["Width"] = self.width
         dict["Height"] = self.height
         dict["BitsPerComponent"] = self.bitsPerComponent
-        dict["ColorSpace"] = PDFName(self.colorSpace)
+        cs = self.colorSpace
+        if isinstance(cs,str):
+            dict["ColorSpace"] = PDFName(cs)
+        else:   #indexed colour spaces are held as (Indexed, base, hival, lookup)
+            dict["ColorSpace"] = PDFArray([PDFName(cs[0]),PDFName(cs[1]),cs[2],PDFText(cs[3])])
         if self.colorSpace=='DeviceCMYK' and getattr(self,'_dotrans',0):
             dict["Decode"] = PDFArray([1,0,1,0,1,0,1,0])
         elif getattr(self,'_decode',None):
             dict["Decode"] = PDFArray(self._decode)
         dict["Filter"] = PDFArray(map(PDFName,self._filters))
+        if getattr(self,'_decodeParms',None):
+            dict["DecodeParms"] = PDFArray([PDFnull]*(len(self._filters)-1)+[PDFDictionary(self._decodeParms)])
         dict["Length"] = len(self.streamContent)
         if self.mask: dict["Mask"] = PDFArray(self.mask)
         if getattr(self,'smask',None): dict["SMask"] = self.smask
         return S.format(document)
 
+#stream-like objects considered by PDFDocument.dedupStreams
+_streamClasses = (PDFStream, PDFFormXObject, PDFPostScriptXObject, PDFImageXObject)
+
 if __name__=="__main__":
     print "There is no script interpretation for pdfdoc."
@@ -50,11 +50,28 @@ def makeA85Image(filename,IMG=None):
     append('EI')
     return code
 
+def _inlineImageKey(filename):
+    "imageXObjectCache key for the inline image code of filename (None if the cache is off)"
+    if imageXObjectCache.getDir():
+        from reportlab.lib.utils import open_for_read
+        return imageXObjectCache.makeKey(open_for_read(filename,'b').read(),kind='inline')
+
 def cacheImageFile(filename, returnInMemory=0, IMG=None):
-    "Processes image as if for encoding, saves to a file with .a85 extension."
+    """Processes image as if for encoding, saves to a file with .a85 extension.
+
+    When rl_config.imageXObjectCacheDir is set the code is kept in the
+    persistent imageXObjectCache instead of a .a85 file next to the image."""
 
     cachedname = os.path.splitext(filename)[0] + '.a85'
-    if filename==cachedname:
+    key = filename!=cachedname and _inlineImageKey(filename)
+    if key:
+        code = imageXObjectCache.get(key)
+        if code is None:
+            code = imageXObjectCache.put(key,makeA85Image(filename,IMG))
+        elif IMG is not None:
+            IMG.append(ImageReader(filename))
+        if returnInMemory: return code
+    elif filename==cachedname:
         if cachedImageExists(filename):
             from reportlab.lib.utils import open_for_read
             if returnInMemory: return filter(None,open_for_read(cachedname).read().split(LINEEND))
@@ -99,8 +116,12 @@ def cachedImageExists(filename):
     """Determines if a cached image already exists for a given file.
 
     Determines if a cached image exists which has the same name
-    and equal or newer date to the given file."""
+    and equal or newer date to the given file (or, when the persistent
+    imageXObjectCache is in use, the same content)."""
     cachedname = os.path.splitext(filename)[0] + '.a85'
+    key = filename!=cachedname and _inlineImageKey(filename)
+    if key:
+        return imageXObjectCache.has_key(key)
     if os.path.isfile(cachedname):
         #see if it is newer
         original_date = os.stat(filename)[8]
@@ -113,6 +134,135 @@ def cachedImageExists(filename):
         return 0
 
 
+class ImageXObjectCache:
+    """Persistent cache of encoded image data shared between documents.
+
+    Entries live as one file each in a directory (None means use
+    rl_config.imageXObjectCacheDir; the cache is off when that is None too)
+    and are keyed on a digest of the image content and its mask, so several
+    processes may share a directory: entries are written to a temporary
+    file and renamed into place, unreadable entries count as misses and the
+    total size is held under maxSize (None means use
+    rl_config.imageXObjectCacheSize) by removing the least recently used.
+    """
+    _suffix = '.rlimg'
+    _version = 1    #bump when the stored format changes
+
+    def __init__(self,dir=None,maxSize=None):
+        self.dir = dir
+        self.maxSize = maxSize
+        self._size = None
+        self.hits = self.misses = 0
+
+    def getDir(self):
+        dir = self.dir
+        if dir is None:
+            from reportlab.rl_config import imageXObjectCacheDir as dir
+        return dir
+
+    def getMaxSize(self):
+        maxSize = self.maxSize
+        if maxSize is None:
+            from reportlab.rl_config import imageXObjectCacheSize as maxSize
+        return maxSize
+
+    def makeKey(self,data,mask=None,kind='xobject'):
+        "digest of the image data, its mask and what kind of entry it is"
+        from reportlab.lib.utils import md5
+        return md5('%s\0%s\0%d\0%r\0' % (kind,len(data),self._version,mask)+data).hexdigest()
+
+    def _path(self,key):
+        return os.path.join(self.getDir(),key+self._suffix)
+
+    def get(self,key):
+        "return the value stored under key or None"
+        if key is None or not self.getDir(): return None
+        import marshal
+        fn = self._path(key)
+        try:
+            f = open(fn,'rb')
+            try:
+                value = marshal.loads(f.read())
+            finally:
+                f.close()
+            os.utime(fn,None)   #mark as recently used
+        except:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def has_key(self,key):
+        return bool(key and self.getDir() and os.path.isfile(self._path(key)))
+
+    def put(self,key,value):
+        "store value (built from basic types) under key; returns value"
+        dir = self.getDir()
+        if key is None or not dir: return value
+        import marshal, tempfile
+        data = marshal.dumps(value)
+        if len(data)>self.getMaxSize(): return value
+        try:
+            if not os.path.isdir(dir): os.makedirs(dir)
+            fd, tfn = tempfile.mkstemp(self._suffix+'.tmp',key,dir)
+            try:
+                os.write(fd,data)
+            finally:
+                os.close(fd)
+            fn = self._path(key)
+            try:
+                os.rename(tfn,fn)
+            except OSError:
+                #windows can't rename over an existing file; another process got there first
+                os.remove(tfn)
+        except (IOError,OSError):
+            return value
+        if self._size is not None: self._size += len(data)
+        self.prune()
+        return value
+
+    def entries(self):
+        "return a list of (last use, size, path) for the stored entries"
+        dir = self.getDir()
+        E = []
+        if not dir or not os.path.isdir(dir): return E
+        for fn in os.listdir(dir):
+            if not fn.endswith(self._suffix): continue
+            fn = os.path.join(dir,fn)
+            try:
+                st = os.stat(fn)
+            except OSError:
+                continue    #removed by someone else
+            E.append((st.st_mtime,st.st_size,fn))
+        return E
+
+    def prune(self):
+        "remove least recently used entries until the total is below maxSize"
+        maxSize = self.getMaxSize()
+        if self._size is not None and self._size<=maxSize: return
+        E = self.entries()
+        E.sort()
+        self._size = size = sum([e[1] for e in E])
+        for t,n,fn in E:
+            if size<=maxSize: break
+            try:
+                os.remove(fn)
+            except OSError:
+                pass
+            size -= n
+        self._size = size
+
+    def clear(self):
+        "remove all entries"
+        for t,n,fn in self.entries():
+            try:
+                os.remove(fn)
+            except OSError:
+                pass
+        self._size = 0
+
+imageXObjectCache = ImageXObjectCache()
+
 ##############################################################
 #
 #            PDF Helper functions
@@ -423,6 +573,148 @@ def readJPEGInfo(image):
                 x = struct.unpack('BB', image.read(2))
                 image.seek( (x[0] << 8) + x[1] - 2, 1)
 
+def readImageInfo(image):
+    """Read (format, width, height) from the header of an open image file.
+
+    Only the first few bytes are read (the markers for a JPEG), no pixels are
+    decoded. Knows about JPEG, PNG, GIF, TIFF and BMP; raises PDFError for
+    anything else. The file is left at an arbitrary position.
+    """
+    import struct
+    from pdfdoc import PDFError
+    head = image.read(26)
+    if head[:2]=='\377\330':
+        image.seek(0)
+        w, h, c = readJPEGInfo(image)
+        return 'JPEG', w, h
+    elif head[:8]==_PNGSignature and head[12:16]=='IHDR':
+        return ('PNG',)+struct.unpack('>II',head[16:24])
+    elif head[:6] in ('GIF87a','GIF89a'):
+        return ('GIF',)+struct.unpack('<HH',head[6:10])
+    elif head[:2]=='BM':
+        if struct.unpack('<I',head[14:18])[0]==12:  #OS/2 BITMAPCOREHEADER
+            w, h = struct.unpack('<HH',head[18:22])
+        else:
+            w, h = struct.unpack('<ii',head[18:26])
+        return 'BMP', w, abs(h)
+    elif head[:4] in ('II*\000','MM\000*'):
+        e = head[0]=='I' and '<' or '>'
+        image.seek(struct.unpack(e+'I',head[4:8])[0])
+        n = struct.unpack(e+'H',image.read(2))[0]
+        size = {}
+        for i in xrange(n):
+            tag, typ, count = struct.unpack(e+'HHI',image.read(8))
+            v = image.read(4)
+            if tag in (256,257):
+                if typ==3: size[tag] = struct.unpack(e+'H',v[:2])[0]
+                else: size[tag] = struct.unpack(e+'I',v)[0]
+        if len(size)==2:
+            return 'TIFF', size[256], size[257]
+    raise PDFError('cannot read the image size')
+
+#########################################################################
+#
+#  PNG processing code
+#
+#########################################################################
+
+_PNGSignature = '\211PNG\r\n\032\n'
+def readPNGInfo(image):
+    """Read the header and image data chunks from an open PNG file.
+
+    Returns a dictionary with the IHDR fields width, height, bitDepth,
+    colorType and interlace; IDAT is the still compressed image data and
+    PLTE/tRNS are the raw palette and transparency chunks (or None).
+    """
+    import struct
+    from pdfdoc import PDFError
+    if image.read(8)!=_PNGSignature:
+        raise PDFError('not a PNG file')
+    info = {'PLTE':None, 'tRNS':None}
+    IDAT = []
+    while 1:
+        x = image.read(8)
+        if len(x)!=8:
+            raise PDFError('PNG file is truncated')
+        n, kind = struct.unpack('>I4s',x)
+        data = image.read(n)
+        image.read(4)   #skip the crc
+        if kind=='IHDR':
+            (info['width'], info['height'], info['bitDepth'], info['colorType'],
+                compression, filter, info['interlace']) = struct.unpack('>IIBBBBB',data)
+            if compression or filter:
+                raise PDFError('PNG has unknown compression or filter method')
+        elif kind=='IDAT':
+            IDAT.append(data)
+        elif kind in ('PLTE','tRNS'):
+            info[kind] = data
+        elif kind=='IEND':
+            break
+    if 'width' not in info:
+        raise PDFError('PNG has no IHDR chunk')
+    info['IDAT'] = ''.join(IDAT)
+    return info
+
+def _pngUnfilter(data, width, height, bpp):
+    "Undo the PNG row filters of 8 bit data with bpp bytes per pixel."
+    from array import array
+    from pdfdoc import PDFError
+    stride = width*bpp
+    prev = array('B',[0])*stride
+    out = []
+    p = 0
+    for y in xrange(height):
+        ft = ord(data[p])
+        row = array('B',data[p+1:p+1+stride])
+        p += stride+1
+        if ft==1:
+            for i in xrange(bpp,stride):
+                row[i] = (row[i]+row[i-bpp])&255
+        elif ft==2:
+            row = array('B',[(a+b)&255 for a,b in zip(row,prev)])
+        elif ft==3:
+            for i in xrange(stride):
+                if i<bpp: a = 0
+                else: a = row[i-bpp]
+                row[i] = (row[i]+((a+prev[i])>>1))&255
+        elif ft==4:
+            for i in xrange(stride):
+                b = prev[i]
+                if i<bpp:
+                    a = c = 0
+                else:
+                    a = row[i-bpp]
+                    c = prev[i-bpp]
+                q = a+b-c
+                pa, pb, pc = abs(q-a), abs(q-b), abs(q-c)
+                if pa<=pb and pa<=pc: q = a
+                elif pb<=pc: q = b
+                else: q = c
+                row[i] = (row[i]+q)&255
+        elif ft:
+            raise PDFError('PNG has unknown filter type %d' % ft)
+        out.append(row.tostring())
+        prev = row
+    return ''.join(out)
+
+def splitPNGAlpha(info):
+    """Decode an 8 bit gray+alpha or RGBA PNG (as returned by readPNGInfo)
+    into its colour and alpha planes; alpha is None if fully opaque."""
+    import zlib
+    from array import array
+    n = {4:2, 6:4}[info['colorType']]
+    raw = _pngUnfilter(zlib.decompress(info['IDAT']),info['width'],info['height'],n)
+    alpha = raw[n-1::n]
+    if n==2:
+        color = raw[0::2]
+    else:
+        color = array('B',[0])*(len(alpha)*3)
+        for i in 0, 1, 2:
+            color[i::3] = array('B',raw[i::4])
+        color = color.tostring()
+    if not alpha.strip('\377'): alpha = None
+    return color, alpha
+
 class _fusc:
     def __init__(self,k, n):
         assert k, 'Argument k should be a non empty string'
@@ -53,7 +53,7 @@ Canvas and TextObject have special support for dynamic fonts.
 """
 
 import string
-from types import StringType, UnicodeType
+from types import StringType, UnicodeType, DictType
 from struct import pack, unpack
 from cStringIO import StringIO
 from reportlab.pdfbase import pdfmetrics, pdfdoc
@@ -76,9 +76,25 @@ def latin1_to_utf8(text):
     "helper to convert when needed from latin input"
     return utf_8_encode(latin_1_decode(text)[0])[0]
 
-def makeToUnicodeCMap(fontname, subset):
+def makeToUnicodeCMap(fontname, subset, twoByte=0):
     """Creates a ToUnicode CMap for a given subset.  See Adobe
-    _PDF_Reference (ISBN 0-201-75839-3) for more information."""
+    _PDF_Reference (ISBN 0-201-75839-3) for more information.
+
+    If twoByte is set the codes are two bytes long, as with Identity-H,
+    and code 0 (.notdef) is left out."""
+    if twoByte:
+        codeSpace = "<0000> <FFFF>"
+        chars = ["<%04X> <%04X>" % (i,v) for i,v in enumerate(subset) if i]
+    else:
+        codeSpace = "<00> <%02X>" % (len(subset) - 1)
+        chars = ["<%02X> <%04X>" % (i,v) for i,v in enumerate(subset)]
+    #at most 100 entries are allowed in each bfchar block
+    bfchars = []
+    for i in xrange(0,len(chars),100):
+        block = chars[i:i+100]
+        bfchars.append("%d beginbfchar" % len(block))
+        bfchars.extend(block)
+        bfchars.append("endbfchar")
     cmap = [
         "/CIDInit /ProcSet findresource begin",
         "12 dict begin",
@@ -91,11 +107,9 @@ def makeToUnicodeCMap(fontname, subset):
         "/CMapName /%s def" % fontname,
         "/CMapType 2 def",
         "1 begincodespacerange",
-        "<00> <%02X>" % (len(subset) - 1),
+        codeSpace,
         "endcodespacerange",
-        "%d beginbfchar" % len(subset)
-        ] + ["<%02X> <%04X>" % (i,v) for i,v in enumerate(subset)] + [
-        "endbfchar",
+        ] + bfchars + [
         "endcmap",
         "CMapName currentdict /CMap defineresource pop",
         "end",
@@ -609,69 +623,83 @@ class TTFontFile(TTFontParser):
         if glyphDataFormat != 0:
             raise TTFError, 'Unknown glyph data format (%d)' % glyphDataFormat
 
-        # cmap - Character to glyph index mapping table
-        cmap_offset = self.seek_table("cmap")
-        self.skip(2)
-        cmapTableCount = self.read_ushort()
-        unicode_cmap_offset = None
-        for n in xrange(cmapTableCount):
-            platformID = self.read_ushort()
-            encodingID = self.read_ushort()
-            offset = self.read_ulong()
-            if platformID == 3 and encodingID == 1: # Microsoft, Unicode
-                format = self.get_ushort(cmap_offset + offset)
-                if format == 4:
-                    unicode_cmap_offset = cmap_offset + offset
-                    break
-            elif platformID == 0: # Unicode -- assume all encodings are compatible
-                format = self.get_ushort(cmap_offset + offset)
-                if format == 4:
-                    unicode_cmap_offset = cmap_offset + offset
-                    break
-        if unicode_cmap_offset is None:
-            raise TTFError, 'Font does not have cmap for Unicode (platform 3, encoding 1, format 4 or platform 0 any encoding format 4)'
-        self.seek(unicode_cmap_offset + 2)
-        length = self.read_ushort()
-        limit = unicode_cmap_offset + length
-        self.skip(2)
-        segCount = self.read_ushort() / 2
-        self.skip(6)
-        endCount = map(lambda x, self=self: self.read_ushort(), xrange(segCount))
-        self.skip(2)
-        startCount = map(lambda x, self=self: self.read_ushort(), xrange(segCount))
-        idDelta = map(lambda x, self=self: self.read_short(), xrange(segCount))
-        idRangeOffset_start = self._pos
-        idRangeOffset = map(lambda x, self=self: self.read_ushort(), xrange(segCount))
-
-        # Now it gets tricky.
-        glyphToChar = {}
-        charToGlyph = {}
-        for n in xrange(segCount):
-            for unichar in xrange(startCount[n], endCount[n] + 1):
-                if idRangeOffset[n] == 0:
-                    glyph = (unichar + idDelta[n]) & 0xFFFF
-                else:
-                    offset = (unichar - startCount[n]) * 2 + idRangeOffset[n]
-                    offset = idRangeOffset_start + 2 * n + offset
-                    if offset >= limit:
-                        # workaround for broken fonts (like Thryomanes)
-                        glyph = 0
+        # character tables compiled into a shared metric store are used
+        # directly rather than being rebuilt from the cmap and hmtx tables
+        from reportlab import rl_config
+        stored = None
+        if rl_config.fontMetricStore:
+            from reportlab.pdfbase.metricstore import getMetricStore
+            store = getMetricStore()
+            stored = store and store.getTTFCharInfo(self.filename, self.subfontNameX)
+        if stored:
+            self.charToGlyph, charWidths = stored
+            glyphToChar = {}
+        else:
+            # cmap - Character to glyph index mapping table
+            cmap_offset = self.seek_table("cmap")
+            self.skip(2)
+            cmapTableCount = self.read_ushort()
+            unicode_cmap_offset = None
+            for n in xrange(cmapTableCount):
+                platformID = self.read_ushort()
+                encodingID = self.read_ushort()
+                offset = self.read_ulong()
+                if platformID == 3 and encodingID == 1: # Microsoft, Unicode
+                    format = self.get_ushort(cmap_offset + offset)
+                    if format == 4:
+                        unicode_cmap_offset = cmap_offset + offset
+                        break
+                elif platformID == 0: # Unicode -- assume all encodings are compatible
+                    format = self.get_ushort(cmap_offset + offset)
+                    if format == 4:
+                        unicode_cmap_offset = cmap_offset + offset
+                        break
+            if unicode_cmap_offset is None:
+                raise TTFError, 'Font does not have cmap for Unicode (platform 3, encoding 1, format 4 or platform 0 any encoding format 4)'
+            self.seek(unicode_cmap_offset + 2)
+            length = self.read_ushort()
+            limit = unicode_cmap_offset + length
+            self.skip(2)
+            segCount = self.read_ushort() / 2
+            self.skip(6)
+            endCount = map(lambda x, self=self: self.read_ushort(), xrange(segCount))
+            self.skip(2)
+            startCount = map(lambda x, self=self: self.read_ushort(), xrange(segCount))
+            idDelta = map(lambda x, self=self: self.read_short(), xrange(segCount))
+            idRangeOffset_start = self._pos
+            idRangeOffset = map(lambda x, self=self: self.read_ushort(), xrange(segCount))
+
+            # Now it gets tricky.
+            glyphToChar = {}
+            charToGlyph = {}
+            for n in xrange(segCount):
+                for unichar in xrange(startCount[n], endCount[n] + 1):
+                    if idRangeOffset[n] == 0:
+                        glyph = (unichar + idDelta[n]) & 0xFFFF
                     else:
-                        glyph = self.get_ushort(offset)
-                        if glyph != 0:
-                            glyph = (glyph + idDelta[n]) & 0xFFFF
-                charToGlyph[unichar] = glyph
-                if glyphToChar.has_key(glyph):
-                    glyphToChar[glyph].append(unichar)
-                else:
-                    glyphToChar[glyph] = [unichar]
-        self.charToGlyph = charToGlyph
+                        offset = (unichar - startCount[n]) * 2 + idRangeOffset[n]
+                        offset = idRangeOffset_start + 2 * n + offset
+                        if offset >= limit:
+                            # workaround for broken fonts (like Thryomanes)
+                            glyph = 0
+                        else:
+                            glyph = self.get_ushort(offset)
+                            if glyph != 0:
+                                glyph = (glyph + idDelta[n]) & 0xFFFF
+                    charToGlyph[unichar] = glyph
+                    if glyphToChar.has_key(glyph):
+                        glyphToChar[glyph].append(unichar)
+                    else:
+                        glyphToChar[glyph] = [unichar]
+            self.charToGlyph = charToGlyph
 
         # hmtx - Horizontal metrics table
         # (needs data from hhea, maxp, and cmap tables)
         self.seek_table("hmtx")
         aw = None
-        self.charWidths = {}
+        if not stored:
+            charWidths = {}
+        self.charWidths = charWidths
         self.hmetrics = []
         for glyph in xrange(numberOfHMetrics):
             # advance width and left side bearing.  lsb is actually signed
@@ -707,8 +735,12 @@ class TTFontFile(TTFontParser):
 
     # Subsetting
 
-    def makeSubset(self, subset):
-        """Create a subset of a TrueType font"""
+    def makeSubset(self, subset, glyphs=None):
+        """Create a subset of a TrueType font
+
+        If glyphs, a list of glyph indices starting with 0, is given the
+        subset's first glyphs are those in that order (so a CIDToGIDMap of
+        /Identity can be used) and subset should be empty."""
         output = TTFontMaker()
 
         # Build a mapping of glyphs in the subset to glyph numbers in
@@ -716,8 +748,8 @@ class TTFontFile(TTFontParser):
         # glyph values in the new font.
 
         # Start with 0 -> 0: "missing character"
-        glyphMap = [0]                  # new glyph index -> old glyph index
-        glyphSet = {0:0}                # old glyph index -> new glyph index
+        glyphMap = glyphs and list(glyphs) or [0]   # new glyph index -> old glyph index
+        glyphSet = dict([(g,i) for i,g in enumerate(glyphMap)]) # old glyph index -> new glyph index
         codeToGlyph = {}                # unicode -> new glyph index
         for code in subset:
             if self.charToGlyph.has_key(code):
@@ -905,12 +937,12 @@ class TTFontFace(TTFontFile, pdfmetrics.TypeFace):
         "Returns the width of character U+<code>"
         return self.charWidths.get(code, self.defaultWidth)
 
-    def addSubsetObjects(self, doc, fontname, subset):
+    def addSubsetObjects(self, doc, fontname, subset, glyphs=None):
         """Generate a TrueType font subset and add it to the PDF document.
         Returns a PDFReference to the new FontDescriptor object."""
 
         fontFile = pdfdoc.PDFStream()
-        fontFile.content = self.makeSubset(subset)
+        fontFile.content = self.makeSubset(subset, glyphs)
         fontFile.dictionary['Length1'] = len(fontFile.content)
         if doc.compression:
             fontFile.filters = [pdfdoc.PDFZCompress]
@@ -961,13 +993,20 @@ class TTFont:
     """
     class State:
         namePrefix = 'F'
-        def __init__(self,asciiReadable=1):
+        def __init__(self,asciiReadable=1,identityH=0):
             self.assignments = {}
             self.nextCode = 0
             self.internalName = None
             self.frozen = 0
 
-            if asciiReadable:
+            if identityH:
+                # a single subset whose codes are the glyph indices of the
+                # embedded font; subsets[0] holds the character each code
+                # was first used for and glyphs the original glyph index
+                self.subsets = [[0]]
+                self.glyphs = [0]
+                self.glyphCodes = {0:0}
+            elif asciiReadable:
                 # Let's add the first 128 unicodes to the 0th subset, so ' '
                 # always has code 32 (for word spacing to work) and the ASCII
                 # output is readable
@@ -983,18 +1022,29 @@ class TTFont:
     _multiByte = 1      # We want our own stringwidth
     _dynamicFont = 1    # We want dynamic subsetting
 
-    def __init__(self, name, filename, validate=0, subfontIndex=0,asciiReadable=1):
+    def __init__(self, name, filename, validate=0, subfontIndex=0,asciiReadable=1,identityH=0):
         """Loads a TrueType font from filename.
 
         If validate is set to a false values, skips checksum validation.  This
         can save time, especially if the font is large.
+
+        If identityH is set the font is embedded in each document as a single
+        Type0 (CIDFontType2) subset with Identity-H encoding and two byte
+        codes, rather than as a series of 256 character TrueType subsets.
+        That suits documents using many distinct characters (eg CJK) best;
+        word spacing (Tw) does not apply to two byte codes so TextObject
+        spaces such text out explicitly.
         """
         self.fontName = name
         self.face = TTFontFace(filename, validate=validate, subfontIndex=subfontIndex)
+        if type(self.face.charWidths) is not DictType:
+            #widths from a metric store; the accelerated version needs a dict
+            self.stringWidth = self._store_stringWidth
         self.encoding = TTEncoding()
         from weakref import WeakKeyDictionary
         self.state = WeakKeyDictionary()
         self._asciiReadable = asciiReadable
+        self._identityH = identityH
 
     def _py_stringWidth(self, text, size, encoding='utf-8'):
         "Calculate text width"
@@ -1005,6 +1055,13 @@ class TTFont:
         return 0.001*size*sum([g(ord(u),dw) for u in text])
     stringWidth = _py_stringWidth
 
+    def _store_stringWidth(self, text, size, encoding='utf-8'):
+        "Calculate text width with widths from a metric store"
+        if type(text) is not UnicodeType:
+            text = unicode(text, encoding or 'utf-8')   # encoding defaults to utf-8
+        face = self.face
+        return 0.001*size*sum(face.charWidths.getValues(map(ord,text),face.defaultWidth))
+
     def _assignState(self,doc,asciiReadable=None,namePrefix=None):
         '''convenience function for those wishing to roll their own state properties'''
         if asciiReadable is None:
@@ -1012,7 +1069,7 @@ class TTFont:
         try:
             state = self.state[doc]
         except KeyError:
-            state = self.state[doc] = TTFont.State(asciiReadable)
+            state = self.state[doc] = TTFont.State(asciiReadable,self._identityH)
             if namePrefix is not None:
                 state.namePrefix = namePrefix
         return state
@@ -1022,9 +1079,7 @@ class TTFont:
         single subset.  Returns a list of tuples (subset, string).  Use subset
         numbers with getSubsetInternalName.  Doc is needed for distinguishing
         subsets when building different documents at the same time."""
-        asciiReadable = self._asciiReadable
-        try: state = self.state[doc]
-        except KeyError: state = self.state[doc] = TTFont.State(asciiReadable)
+        state = self._assignState(doc)
         curSet = -1
         cur = []
         results = []
@@ -1032,6 +1087,8 @@ class TTFont:
             text = unicode(text, encoding or 'utf-8')   # encoding defaults to utf-8
         assignments = state.assignments
         subsets = state.subsets
+        if self._identityH:
+            return [(0, self._identityHCodes(text, state))]
         for code in map(ord,text):
             if assignments.has_key(code):
                 n = assignments[code]
@@ -1061,12 +1118,34 @@ class TTFont:
             results.append((curSet,''.join(map(chr,cur))))
         return results
 
+    def _identityHCodes(self, text, state):
+        "two byte glyph codes for text in the single Identity-H subset"
+        charToGlyph = self.face.charToGlyph
+        assignments = state.assignments
+        glyphCodes = state.glyphCodes
+        codes = []
+        for code in map(ord,text):
+            try:
+                n = assignments[code]
+            except KeyError:
+                glyph = charToGlyph.get(code,0)
+                try:
+                    n = glyphCodes[glyph]
+                except KeyError:
+                    if state.frozen:
+                        raise pdfdoc.PDFError, "Font %s is already frozen, cannot add new character U+%04X" % (self.fontName, code)
+                    n = glyphCodes[glyph] = len(state.glyphs)
+                    state.glyphs.append(glyph)
+                    state.subsets[0].append(code)
+                assignments[code] = n
+            codes.append(n)
+        return pack('>%dH' % len(codes), *codes)
+
     def getSubsetInternalName(self, subset, doc):
         """Returns the name of a PDF Font object corresponding to a given
         subset of this dynamic font.  Use this function instead of
         PDFDocument.getInternalFontName."""
-        try: state = self.state[doc]
-        except KeyError: state = self.state[doc] = TTFont.State(self._asciiReadable)
+        state = self._assignState(doc)
         if subset < 0 or subset >= len(state.subsets):
             raise IndexError, 'Subset %d does not exist in font %s' % (subset, self.fontName)
         if state.internalName is None:
@@ -1083,9 +1162,12 @@ class TTFont:
         This method creates a number of Font and FontDescriptor objects.  Every
         FontDescriptor is a (no more than) 256 character subset of the original
         TrueType font."""
-        try: state = self.state[doc]
-        except KeyError: state = self.state[doc] = TTFont.State(self._asciiReadable)
+        state = self._assignState(doc)
         state.frozen = 1
+        if self._identityH:
+            self._addIdentityHObjects(doc, state)
+            del self.state[doc]
+            return
         for n,subset in enumerate(state.subsets):
             internalName = self.getSubsetInternalName(n, doc)[1:]
             baseFontName = "%s+%s%s" % (SUBSETN(n),self.face.name,self.face.subfontNameX)
@@ -1114,6 +1196,47 @@ class TTFont:
             fontDict = doc.idToObject['BasicFonts'].dict
             fontDict[internalName] = pdfFont
         del self.state[doc]
+
+    def _addIdentityHObjects(self, doc, state):
+        "makes the Type0 font, its CIDFont and one font program for the whole document"
+        face = self.face
+        internalName = self.getSubsetInternalName(0, doc)[1:]
+        baseFontName = "%s+%s%s" % (SUBSETN(0),face.name,face.subfontNameX)
+        chars = state.subsets[0]
+
+        cidFont = pdfdoc.PDFDictionary({
+            'Type': '/Font',
+            'Subtype': '/CIDFontType2',
+            'BaseFont': pdfdoc.PDFName(baseFontName),
+            'CIDSystemInfo': pdfdoc.PDFDictionary({
+                    'Registry': pdfdoc.PDFString('Adobe'),
+                    'Ordering': pdfdoc.PDFString('Identity'),
+                    'Supplement': 0,
+                    }),
+            'FontDescriptor': face.addSubsetObjects(doc, baseFontName, [], state.glyphs),
+            'DW': face.defaultWidth,
+            'W': pdfdoc.PDFArray([1, pdfdoc.PDFArray(map(face.getCharWidth, chars[1:]))]),
+            'CIDToGIDMap': '/Identity',
+            })
+
+        cmapStream = pdfdoc.PDFStream()
+        cmapStream.content = makeToUnicodeCMap(baseFontName, chars, twoByte=1)
+        if doc.compression:
+            cmapStream.filters = [pdfdoc.PDFZCompress]
+
+        pdfFont = pdfdoc.PDFDictionary({
+            'Type': '/Font',
+            'Subtype': '/Type0',
+            'BaseFont': pdfdoc.PDFName(baseFontName),
+            'Encoding': '/Identity-H',
+            'DescendantFonts': pdfdoc.PDFArray([doc.Reference(cidFont, 'cidFont:' + baseFontName)]),
+            'ToUnicode': doc.Reference(cmapStream, 'toUnicodeCMap:' + baseFontName),
+            })
+        pdfFont.__Comment__ = 'Font %s' % self.fontName
+
+        # link it in
+        fontDict = doc.idToObject['BasicFonts'].dict
+        fontDict[internalName] = doc.Reference(pdfFont, internalName)
 try:
     from _rl_accel import _instanceStringWidthTTF
     import new
@@ -15,7 +15,7 @@ import re
 from string import join, split, strip, atoi, replace, upper, digits
 import tempfile
 from types import *
-from math import sin, cos, tan, pi, ceil
+from math import sin, cos, tan, pi, ceil, hypot
 try:
     from hashlib import md5
 except ImportError:
@@ -26,7 +26,7 @@ from reportlab.pdfbase import pdfutils
 from reportlab.pdfbase import pdfdoc
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfgen  import pdfgeom, pathobject, textobject
-from reportlab.lib.utils import import_zlib, ImageReader, fp_str, _digester
+from reportlab.lib.utils import import_zlib, ImageReader, fp_str, fp_path, _digester, haveImages, decodedImageCache
 from reportlab.lib.boxstuff import aspectRatioFix
 
 digitPat = re.compile('\d')  #used in decimal alignment
@@ -129,12 +129,15 @@ class Canvas(textobject._PDFColorSetter):
                  pageCompression=None,
                  invariant = None,
                  verbosity=0,
-                 encrypt=None):
+                 encrypt=None,
+                 dedupStreams=None):
         """Create a canvas of a given size. etc.
 
         You may pass a file-like object to filename as an alternative to
         a string.
         For more information about the encrypt parameter refer to the setEncrypt method.
+        If dedupStreams is true identical images, forms, font files and CMaps
+        are written only once (default rl_config.dedupStreams).
         
         Most of the attributes are private - we will use set/get methods
         as the preferred interface.  Default page size is A4."""
@@ -143,7 +146,8 @@ class Canvas(textobject._PDFColorSetter):
         self._filename = filename
 
         self._doc = pdfdoc.PDFDocument(compression=pageCompression,
-                                       invariant=invariant, filename=filename)
+                                       invariant=invariant, filename=filename,
+                                       dedupStreams=dedupStreams)
 
 
         #this only controls whether it prints 'saved ...' - 0 disables
@@ -178,7 +182,9 @@ class Canvas(textobject._PDFColorSetter):
         #drawing coordinates.
         self.bottomup = bottomup
         self.imageCaching = rl_config.defaultImageCaching
+        self.setImageDownsampling(rl_config.imageMaxDPI)
         self.init_graphics_state()
+        self._pageStartOps()
         self._make_preamble()
         self.state_stack = []
 
@@ -237,6 +243,19 @@ class Canvas(textobject._PDFColorSetter):
 
         self._fillColorRGB = (0,0,0)
         self._strokeColorRGB = (0,0,0)
+        self._forgetOps()
+
+    def _forgetOps(self):
+        """the operators in force, used to leave out those which would change
+        nothing; None means unknown.  saveState and restoreState keep them in
+        step with the PDF graphics state stack"""
+        self._fillColorOp = self._strokeColorOp = self._fontOp = self._leadingOp = None
+        self._lineWidthOp = self._lineCapOp = self._lineJoinOp = self._dashOp = None
+
+    def _pageStartOps(self):
+        "a page, unlike a form, starts in the PDF default graphics state"
+        self._fillColorOp, self._strokeColorOp = '0 g', '0 G'
+        self._lineWidthOp, self._lineCapOp, self._lineJoinOp, self._dashOp = '1 w', '0 J', '0 j', '[] 0 d'
 
     def push_state_stack(self):
         state = {}
@@ -255,7 +274,8 @@ class Canvas(textobject._PDFColorSetter):
      _x _y _fontname _fontsize _textMode _leading _currentMatrix _fillMode
      _fillMode _charSpace _wordSpace _horizScale _textRenderMode _rise _textLineMatrix
      _textMatrix _lineCap _lineJoin _lineDash _lineWidth _mitreLimit _fillColorRGB
-     _strokeColorRGB""")
+     _strokeColorRGB _fillColorOp _strokeColorOp _fontOp _leadingOp _lineWidthOp
+     _lineCapOp _lineJoinOp _dashOp""")
     STATE_RANGE = range(len(STATE_ATTRIBUTES))
 
         #self._addStandardFonts()
@@ -425,6 +445,7 @@ class Canvas(textobject._PDFColorSetter):
         self._pageNumber += 1
         self._restartAccumulators()
         self.init_graphics_state()
+        self._pageStartOps()
         self.state_stack = []
 
     def setPageCallBack(self, func):
@@ -578,8 +599,49 @@ class Canvas(textobject._PDFColorSetter):
         #
         ######################################################
 
+    def setImageDownsampling(self, maxDPI=None, filter='antialias'):
+        """Set the default maxDPI for drawImage and drawInlineImage.
+
+        Images which would be shown at more than maxDPI pixels per inch (taking
+        account of the current transformation) are resampled with filter
+        ('nearest', 'bilinear', 'bicubic' or 'antialias') before embedding.
+        None turns this off; it needs the Python Imaging Library.  Resampled
+        images are kept in lib.utils.decodedImageCache, so they are shared
+        between canvases and limited by rl_config.decodedImageCacheSize."""
+        self._imageMaxDPI = maxDPI
+        self._imageResampleFilter = filter
+
+    def _downsampleImage(self, image, x, y, width, height, preserveAspectRatio, anchor, maxDPI):
+        """return None if image needn't be downsampled for maxDPI else the resampled
+        image, where to draw it and the original pixel size"""
+        if maxDPI is None: maxDPI = self._imageMaxDPI
+        if not maxDPI or not haveImages: return None
+        ir = ImageReader(image)
+        im = ir._image
+        if not hasattr(im,'resize'): return None    #not a PIL image
+        iw, ih = ir.getSize()
+        x, y, width, height, scaled = aspectRatioFix(preserveAspectRatio,anchor,x,y,width,height,iw,ih)
+        a, b, c, d = self._currentMatrix[:4]
+        tw = max(1,min(iw,int(ceil(abs(width)*hypot(a,b)*maxDPI/72.))))
+        th = max(1,min(ih,int(ceil(abs(height)*hypot(c,d)*maxDPI/72.))))
+        if (tw,th)==(iw,ih): return None    #keep the original (and any JPEG passthrough)
+        filter = self._imageResampleFilter
+        key = ir._cacheKey
+        if not key:
+            #an in memory PIL image, so name it by its pixels
+            key = (md5('%s%r%s' % (im.mode,im.size,im.tostring())).digest(),)
+        key = key+('resampled',tw,th,filter)
+        r = decodedImageCache.get(key)
+        if r is None:
+            import PIL.Image
+            if im.mode not in ('L','RGB','RGBA','CMYK'):
+                im = im.convert('transparency' in im.info and 'RGBA' or 'RGB')
+            r = im.resize((tw,th),getattr(PIL.Image,filter.upper()))
+            decodedImageCache.put(key,r,tw*th*len(r.getbands()))
+        return r, x, y, width, height, iw, ih
+
     def drawInlineImage(self, image, x,y, width=None,height=None,
-            preserveAspectRatio=False,anchor='c'):
+            preserveAspectRatio=False,anchor='c',maxDPI=None):
         """See drawImage, which should normally be used instead... 
         
         drawInlineImage behaves like drawImage, but stores the image content
@@ -594,15 +656,20 @@ class Canvas(textobject._PDFColorSetter):
         """
     
         self._currentPageHasImages = 1
+        ds = self._downsampleImage(image,x,y,width,height,preserveAspectRatio,anchor,maxDPI)
+        if ds:
+            image, x, y, width, height = ds[:5]
+            preserveAspectRatio = False
         from pdfimages import PDFImage
         img_obj = PDFImage(image, x,y, width, height)
         img_obj.drawInlineImage(self,
             preserveAspectRatio=preserveAspectRatio, 
             anchor=anchor)
+        if ds: return ds[5:]    #the size of the original image, as drawImage returns
         return (img_obj.width, img_obj.height)
 
     def drawImage(self, image, x, y, width=None, height=None, mask=None, 
-            preserveAspectRatio=False, anchor='c'):
+            preserveAspectRatio=False, anchor='c', maxDPI=None):
         """Draws the image (ImageReader object or filename) as specified.
 
 
@@ -662,21 +729,37 @@ class Canvas(textobject._PDFColorSetter):
         it tests whether the image content has changed before deciding
         whether to reuse it.
 
+        If maxDPI (or the canvas default, see setImageDownsampling) is given,
+        an image which would be shown at a higher resolution is resampled
+        to maxDPI before it is embedded; the returned size is still that of
+        the original image.
+
         In general you should use drawImage in preference to drawInlineImage
         unless you have read the PDF Spec and understand the tradeoffs."""        
        
         self._currentPageHasImages = 1
+        ds = self._downsampleImage(image,x,y,width,height,preserveAspectRatio,anchor,maxDPI)
+        if ds:
+            im, x, y, width, height = ds[:5]
+            image = ImageReader(im)
+            preserveAspectRatio = False
 
         # first, generate a unique name/signature for the image.  If ANYTHING
         # is different, even the mask, this should be different.
         if isinstance(image,ImageReader):
-            rawdata = image.getRGBData()
-            smask = image._dataA
-            if mask=='auto' and smask:
-                mdata = smask.getRGBData()
+            fp = image.jpeg_fh()
+            rawdata = fp and fp.read() or image.png_data()
+            if rawdata:
+                #JPEGs and PNGs are copied without decoding, so name by file content
+                name = _digester(rawdata+str(mask))
             else:
-                mdata = str(mask)
-            name = _digester(rawdata+mdata)
+                rawdata = image.getRGBData()
+                smask = image._dataA
+                if mask=='auto' and smask:
+                    mdata = smask.getRGBData()
+                else:
+                    mdata = str(mask)
+                name = _digester(rawdata+mdata)
         else:
             #filename, use it
             name = _digester('%s%s' % (image, mask))
@@ -716,6 +799,7 @@ class Canvas(textobject._PDFColorSetter):
         # track what's been used on this page
         self._formsinuse.append(name)
 
+        if ds: return ds[5:]
         return (imgObj.width, imgObj.height)
 
     def _restartAccumulators(self):
@@ -751,11 +835,11 @@ class Canvas(textobject._PDFColorSetter):
            that require the form."""
         self.push_state_stack()
         self.init_graphics_state()
-        if self._code or self._formData:
-            # save the code that is not in the formf
-            self._pushAccumulators()
-            #self._codeStack.append(self._code)
-            #self._code = []
+        # save the page (or outer form) accumulators even when no code has
+        # been emitted yet; they may already hold annotations or forms
+        self._pushAccumulators()
+        #self._codeStack.append(self._code)
+        #self._code = []
         self._formData = (name, lowerx, lowery, upperx, uppery)
         self._doc.inForm()
         #self._inForm0()
@@ -971,6 +1055,7 @@ class Canvas(textobject._PDFColorSetter):
         if escaped==0:
             s = self._escape(s) # convert to string for safety
         self._code.append(s)
+        self._forgetOps()   #we can't tell what s did
 
         ######################################################################
         #
@@ -1117,10 +1202,10 @@ class Canvas(textobject._PDFColorSetter):
              crosshairs = [(20,0,20,10), (20,30,20,40), (0,20,10,20), (30,20,40,20)]
              canvas.lines(crosshairs)
         """
-        self._code.append('n')
-        for (x1,y1,x2,y2) in linelist:
-            self._code.append('%s m %s l' % (fp_str(x1, y1), fp_str(x2, y2)))
-        self._code.append('S')
+        P = []
+        for l in linelist: P.extend(l)
+        if P: self._code.append('n %s S' % fp_path(P, 'ml'*(len(P)//4)))
+        else: self._code.append('n S')
 
     def grid(self, xlist, ylist):
         """Lays out a grid in current line style.  Supply list of
@@ -1378,7 +1463,8 @@ class Canvas(textobject._PDFColorSetter):
         font = pdfmetrics.getFont(self._fontname)
         if not font._dynamicFont:
             pdffontname = self._doc.getInternalFontName(psfontname)
-            self._code.append('BT %s %s Tf %s TL ET' % (pdffontname, fp_str(size), fp_str(leading)))
+            code = self._fontCode(pdffontname, size, leading)
+            if code: self._code.append('BT %s ET' % code)
 
     def setFontSize(self, size=None, leading=None):
         '''Sets font size or leading without knowing the font face'''
@@ -1395,19 +1481,22 @@ class Canvas(textobject._PDFColorSetter):
 
     def setLineWidth(self, width):
         self._lineWidth = width
-        self._code.append('%s w' % fp_str(width))
+        op = '%s w' % fp_str(width)
+        if self._newOp('_lineWidthOp', op): self._code.append(op)
 
     def setLineCap(self, mode):
         """0=butt,1=round,2=square"""
         assert mode in (0,1,2), "Line caps allowed: 0=butt,1=round,2=square"
         self._lineCap = mode
-        self._code.append('%d J' % mode)
+        op = '%d J' % mode
+        if self._newOp('_lineCapOp', op): self._code.append(op)
 
     def setLineJoin(self, mode):
         """0=mitre, 1=round, 2=bevel"""
         assert mode in (0,1,2), "Line Joins allowed: 0=mitre, 1=round, 2=bevel"
         self._lineJoin = mode
-        self._code.append('%d j' % mode)
+        op = '%d j' % mode
+        if self._newOp('_lineJoinOp', op): self._code.append(op)
 
     def setMiterLimit(self, limit):
         self._miterLimit = limit
@@ -1416,11 +1505,14 @@ class Canvas(textobject._PDFColorSetter):
     def setDash(self, array=[], phase=0):
         """Two notations.  pass two numbers, or an array and phase"""
         if type(array) == IntType or type(array) == FloatType:
-            self._code.append('[%s %s] 0 d' % (array, phase))
+            op = '[%s %s] 0 d' % (array, phase)
         elif type(array) == ListType or type(array) == TupleType:
             assert phase >= 0, "phase is a length in user space"
             textarray = ' '.join(map(str, array))
-            self._code.append('[%s] %s d' % (textarray, phase))
+            op = '[%s] %s d' % (textarray, phase)
+        else:
+            return
+        if self._newOp('_dashOp', op): self._code.append(op)
 
     # path stuff - the separate path object builds it
 
@@ -1454,6 +1546,10 @@ class Canvas(textobject._PDFColorSetter):
 
     def drawText(self, aTextObject):
         """Draws a text object"""
+        if hasattr(aTextObject, '_matchState'):
+            aTextObject._matchState(self)
+        else:
+            self._forgetOps()
         self._code.append(str(aTextObject.getCode()))
 
     def setPageCompression(self, pageCompression=1):
@@ -13,7 +13,7 @@ Progress Reports:
 
 import string
 from reportlab.pdfgen import pdfgeom
-from reportlab.lib.utils import fp_str
+from reportlab.lib.utils import fp_str, fp_path
 
 
 class PDFPathObject:
@@ -51,6 +51,19 @@ class PDFPathObject:
     def curveTo(self, x1, y1, x2, y2, x3, y3):
         self._code_append('%s c' % fp_str(x1, y1, x2, y2, x3, y3))
 
+    def addPoints(self, points, ops=None):
+        """Add many path segments in one call. points is a flat sequence
+        (eg a list or array.array) of coordinates and ops a string of single
+        character operators: m (moveTo), l (lineTo), c (curveTo), v, y and
+        h (close). The default is a moveTo followed by lineTos through
+        all the points."""
+        if self._code_append==self._init_code_append:
+            assert (ops or 'm')[0]=='m', 'path must start with a moveto or rect'
+            self._code.append('n')
+            self._code_append = self._code.append
+        if ops=='': return
+        self._code_append(fp_path(points, ops))
+
     def arc(self, x1,y1, x2,y2, startAng=0, extent=90):
         """Contributed to piddlePDF by Robert Kern, 28/7/99.
         Draw a partial ellipse inscribed within the rectangle x1,y1,x2,y2,
@@ -73,6 +73,9 @@ class PDFImage:
 
     def cache_imagedata(self):
         image = self.image
+        if pdfutils.imageXObjectCache.getDir():
+            if not haveImages: return
+            return pdfutils.cacheImageFile(image,returnInMemory=1)
         if not pdfutils.cachedImageExists(image):
             zlib = import_zlib()
             if not zlib: return
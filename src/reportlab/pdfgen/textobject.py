@@ -18,34 +18,76 @@ from reportlab.pdfbase import pdfmetrics
 
 _SeqTypes=(TupleType,ListType)
 
+_colorOpCacheSize = 1024
+_colorOpCache = {}
+def _colorOp(components, op):
+    """return the PDF code setting a colour; documents reuse few colours
+    so the formatted strings are remembered by their components"""
+    key = components, op
+    try:
+        return _colorOpCache[key]
+    except KeyError:
+        if len(_colorOpCache)>=_colorOpCacheSize: _colorOpCache.clear()
+        code = _colorOpCache[key] = '%s %s' % (fp_str(components), op)
+        return code
+
+#the attributes holding the operators known to be in force, None if unknown
+_textStateOps = ('_fillColorOp', '_strokeColorOp', '_fontOp', '_leadingOp')
+
 class _PDFColorSetter:
     '''Abstracts the color setting operations; used in Canvas and Textobject
     asseumes we have a _code object'''
+    def _newOp(self, name, op):
+        """true if op isn't known to be in force; it's then noted in the
+        attribute name as the one which will be"""
+        if op==getattr(self, name): return 0
+        setattr(self, name, op)
+        return 1
+
+    def _setFillColorOp(self, op):
+        "append a fill colour operator unless it is in force already"
+        if self._newOp('_fillColorOp', op): self._code.append(op)
+
+    def _setStrokeColorOp(self, op):
+        "append a stroke colour operator unless it is in force already"
+        if self._newOp('_strokeColorOp', op): self._code.append(op)
+
+    def _fontCode(self, pdffontname, size, leading=None):
+        """return the Tf (and TL if leading is given) operators for a font
+        leaving out any in force already"""
+        R = []
+        op = '%s %s Tf' % (pdffontname, fp_str(size))
+        if self._newOp('_fontOp', op): R.append(op)
+        if leading is not None:
+            op = '%s TL' % fp_str(leading)
+            if self._newOp('_leadingOp', op): R.append(op)
+        return ' '.join(R)
+
     def setFillColorCMYK(self, c, m, y, k):
          """set the fill color useing negative color values
          (cyan, magenta, yellow and darkness value).
          Takes 4 arguments between 0.0 and 1.0"""
          self._fillColorCMYK = (c, m, y, k)
-         self._code.append('%s k' % fp_str(c, m, y, k))
+         self._setFillColorOp(_colorOp((c, m, y, k), 'k'))
 
     def setStrokeColorCMYK(self, c, m, y, k):
          """set the stroke color useing negative color values
             (cyan, magenta, yellow and darkness value).
             Takes 4 arguments between 0.0 and 1.0"""
          self._strokeColorCMYK = (c, m, y, k)
-         self._code.append('%s K' % fp_str(c, m, y, k))
+         self._setStrokeColorOp(_colorOp((c, m, y, k), 'K'))
 
     def setFillColorRGB(self, r, g, b):
         """Set the fill color using positive color description
            (Red,Green,Blue).  Takes 3 arguments between 0.0 and 1.0"""
         self._fillColorRGB = (r, g, b)
-        self._code.append('%s rg' % fp_str(r,g,b))
+        self._setFillColorOp(_colorOp((r, g, b), 'rg'))
 
     def setStrokeColorRGB(self, r, g, b):
         """Set the stroke color using positive color description
            (Red,Green,Blue).  Takes 3 arguments between 0.0 and 1.0"""
         self._strokeColorRGB = (r, g, b)
-        self._code.append('%s RG' % fp_str(r,g,b))
+        self._setStrokeColorOp(_colorOp((r, g, b), 'RG'))
 
     def setFillColor(self, aColor):
         """Takes a color object, allowing colors to be referred to by name"""
@@ -53,16 +95,16 @@ class _PDFColorSetter:
             d = aColor.density
             c,m,y,k = (d*aColor.cyan, d*aColor.magenta, d*aColor.yellow, d*aColor.black)
             self._fillColorCMYK = (c, m, y, k)
-            self._code.append('%s k' % fp_str(c, m, y, k))
+            self._setFillColorOp(_colorOp((c, m, y, k), 'k'))
         elif isinstance(aColor, Color):
             rgb = (aColor.red, aColor.green, aColor.blue)
             self._fillColorRGB = rgb
-            self._code.append('%s rg' % fp_str(rgb) )
+            self._setFillColorOp(_colorOp(rgb, 'rg'))
         elif type(aColor) in _SeqTypes:
             l = len(aColor)
             if l==3:
                 self._fillColorRGB = aColor
-                self._code.append('%s rg' % fp_str(aColor) )
+                self._setFillColorOp(_colorOp(tuple(aColor), 'rg'))
             elif l==4:
                 self.setFillColorCMYK(aColor[0], aColor[1], aColor[2], aColor[3])
             else:
@@ -78,16 +120,16 @@ class _PDFColorSetter:
             d = aColor.density
             c,m,y,k = (d*aColor.cyan, d*aColor.magenta, d*aColor.yellow, d*aColor.black)
             self._strokeColorCMYK = (c, m, y, k)
-            self._code.append('%s K' % fp_str(c, m, y, k))
+            self._setStrokeColorOp(_colorOp((c, m, y, k), 'K'))
         elif isinstance(aColor, Color):
             rgb = (aColor.red, aColor.green, aColor.blue)
             self._strokeColorRGB = rgb
-            self._code.append('%s RG' % fp_str(rgb) )
+            self._setStrokeColorOp(_colorOp(rgb, 'RG'))
         elif type(aColor) in _SeqTypes:
             l = len(aColor)
             if l==3:
                 self._strokeColorRGB = aColor
-                self._code.append('%s RG' % fp_str(aColor) )
+                self._setStrokeColorOp(_colorOp(tuple(aColor), 'RG'))
             elif l==4:
                 self.setStrokeColorCMYK(aColor[0], aColor[1], aColor[2], aColor[3])
             else:
@@ -100,12 +142,12 @@ class _PDFColorSetter:
     def setFillGray(self, gray):
         """Sets the gray level; 0.0=black, 1.0=white"""
         self._fillColorRGB = (gray, gray, gray)
-        self._code.append('%s g' % fp_str(gray))
+        self._setFillColorOp(_colorOp((gray,), 'g'))
 
     def setStrokeGray(self, gray):
         """Sets the gray level; 0.0=black, 1.0=white"""
         self._strokeColorRGB = (gray, gray, gray)
-        self._code.append('%s G' % fp_str(gray))
+        self._setStrokeColorOp(_colorOp((gray,), 'G'))
 
 class PDFTextObject(_PDFColorSetter):
     """PDF logically separates text and graphics drawing; text
@@ -126,6 +168,15 @@ class PDFTextObject(_PDFColorSetter):
         self._leading = self._canvas._leading
         font = pdfmetrics.getFont(self._fontname)
         self._curSubset = -1
+        #the text state parameters persist between text objects, so start from the
+        #canvas's; a stand in canvas (eg pycanvas) doesn't know them
+        d = canvas.__dict__
+        self._inheritedOps = {}     #those we haven't set ourselves yet
+        self._assumedOps = {}       #those we left out because the canvas had them
+        for a in _textStateOps:
+            op = d.get(a)
+            setattr(self, a, op)
+            if op is not None: self._inheritedOps[a] = 1
         self.setTextOrigin(x, y)
 
     def getCode(self):
@@ -133,6 +184,30 @@ class PDFTextObject(_PDFColorSetter):
         self._code.append('ET')
         return string.join(self._code, ' ')
 
+    def _newOp(self, name, op):
+        if op==getattr(self, name):
+            if self._inheritedOps.has_key(name):
+                self._assumedOps[name] = op
+            return 0
+        setattr(self, name, op)
+        if self._inheritedOps.has_key(name):
+            del self._inheritedOps[name]
+        return 1
+
+    def _matchState(self, canvas):
+        """called as the canvas draws us; put back any operators we left out
+        which the canvas has changed since we were made and leave the canvas
+        with those our code ends with"""
+        fix = []
+        for a in _textStateOps:
+            op = self._assumedOps.get(a)
+            if op is not None and op!=getattr(canvas, a):
+                fix.append(op)
+            elif self._inheritedOps.has_key(a):
+                continue    #we didn't change it, the canvas's is still in force
+            setattr(canvas, a, getattr(self, a))
+        if fix: self._code.insert(1, ' '.join(fix))
+
     def setTextOrigin(self, x, y):
         if self._canvas.bottomup:
             self._code.append('1 0 0 1 %s Tm' % fp_str(x, y)) #bottom up
@@ -233,7 +308,8 @@ class PDFTextObject(_PDFColorSetter):
             self._curSubset = -1
         else:
             pdffontname = self._canvas._doc.getInternalFontName(psfontname)
-            self._code.append('%s %s Tf' % (pdffontname, fp_str(size)))
+            code = self._fontCode(pdffontname, size)
+            if code: self._code.append(code)
 
     def setFont(self, psfontname, size, leading = None):
         """Sets the font.  If leading not specified, defaults to 1.2 x
@@ -250,7 +326,8 @@ class PDFTextObject(_PDFColorSetter):
             self._curSubset = -1
         else:
             pdffontname = self._canvas._doc.getInternalFontName(psfontname)
-            self._code.append('%s %s Tf %s TL' % (pdffontname, fp_str(size), fp_str(leading)))
+            code = self._fontCode(pdffontname, size, leading)
+            if code: self._code.append(code)
 
     def setCharSpace(self, charSpace):
          """Adjusts inter-character spacing"""
@@ -272,7 +349,8 @@ class PDFTextObject(_PDFColorSetter):
     def setLeading(self, leading):
         "How far to move down at the end of a line."
         self._leading = leading
-        self._code.append('%s TL' % fp_str(leading))
+        op = '%s TL' % fp_str(leading)
+        if self._newOp('_leadingOp', op): self._code.append(op)
 
     def setTextRenderMode(self, mode):
         """Set the text rendering mode.
@@ -296,6 +374,22 @@ class PDFTextObject(_PDFColorSetter):
         self._y = self._y - rise    # + ?  _textLineMatrix?
         self._code.append('%s Ts' % fp_str(rise))
 
+    def _wordSpacedTJ(self, font, t):
+        """Word spacing (Tw) only applies to the single byte code 32, so
+        for two byte codes the words are spaced out with TJ adjustments"""
+        canv = self._canvas
+        space = font.splitString(' ', canv._doc)[0][1]
+        words = []
+        cur = []
+        for i in xrange(0,len(t),2):
+            c = t[i:i+2]
+            cur.append(c)
+            if c==space:
+                words.append('(%s)' % canv._escape(''.join(cur)))
+                cur = []
+        words.append('(%s)' % canv._escape(''.join(cur)))
+        return '[%s] TJ' % (' %s ' % fp_str(-1000.0*self._wordSpace/self._fontsize)).join(words)
+
     def _formatText(self, text):
         "Generates PDF text output operator(s)"
         canv = self._canvas
@@ -306,16 +400,17 @@ class PDFTextObject(_PDFColorSetter):
             for subset, t in font.splitString(text, canv._doc):
                 if subset!=self._curSubset:
                     pdffontname = font.getSubsetInternalName(subset, canv._doc)
-                    R.append("%s %s Tf %s TL" % (pdffontname, fp_str(self._fontsize), fp_str(self._leading)))
+                    code = self._fontCode(pdffontname, self._fontsize, self._leading)
+                    if code: R.append(code)
                     self._curSubset = subset
-                R.append("(%s) Tj" % canv._escape(t))
+                if getattr(font,'_identityH',0) and getattr(self,'_wordSpace',0):
+                    R.append(self._wordSpacedTJ(font, t))
+                else:
+                    R.append("(%s) Tj" % canv._escape(t))
         elif font._multiByte:
             #all the fonts should really work like this - let them know more about PDF...
-            R.append("%s %s Tf %s TL" % (
-                canv._doc.getInternalFontName(font.fontName),
-                fp_str(self._fontsize),
-                fp_str(self._leading)
-                ))
+            code = self._fontCode(canv._doc.getInternalFontName(font.fontName), self._fontsize, self._leading)
+            if code: R.append(code)
             R.append("(%s) Tj" % font.formatForPdf(text))
         else:
             #convert to T1  coding
@@ -329,11 +424,13 @@ class PDFTextObject(_PDFColorSetter):
 
             for f, t in pdfmetrics.unicode2T1(text,[font]+font.substitutionFonts):
                 if f!=fc:
-                    R.append("%s %s Tf %s TL" % (canv._doc.getInternalFontName(f.fontName), fp_str(self._fontsize), fp_str(self._leading)))
+                    code = self._fontCode(canv._doc.getInternalFontName(f.fontName), self._fontsize, self._leading)
+                    if code: R.append(code)
                     fc = f
                 R.append("(%s) Tj" % canv._escape(t))
             if font!=fc:
-                R.append("%s %s Tf %s TL" % (canv._doc.getInternalFontName(self._fontname), fp_str(self._fontsize), fp_str(self._leading)))
+                code = self._fontCode(canv._doc.getInternalFontName(self._fontname), self._fontsize, self._leading)
+                if code: R.append(code)
         return ' '.join(R)
 
     def _textOut(self, text, TStar=0):
@@ -39,6 +39,10 @@ try:
     set
 except NameError:
     from sets import Set as set
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5
 
 from types import *
 import sys
@@ -215,14 +219,60 @@ class NextPageTemplate(ActionFlowable):
     def __init__(self,pt):
         ActionFlowable.__init__(self,('nextPageTemplate',pt))
 
+def _drawDecoration(func, canv, doc):
+    """call a page decoration callback; if the operators it emits are
+    byte-identical to those of an earlier page they are moved into a shared
+    form XObject and the page gets a single Do instead of another copy"""
+    code = getattr(canv,'_code',None)
+    if code is None or canv._codeStack or canv._formData or not hasattr(canv,'beginForm'):
+        func(canv,doc)
+        return
+    n = len(code)
+    last = n and code[-1]
+    nForms = len(canv._formsinuse)
+    nAnnots = len(canv._annotationrefs)
+    func(canv,doc)
+    code = canv._code
+    ops = code[n:]
+    #only share self contained q ... Q blocks which leave the page state alone
+    if (not ops or ops[0]!='q' or ops[-1]!='Q' or (n and code[n-1] is not last)
+            or len(canv._annotationrefs)!=nAnnots):
+        return
+    depth = 0
+    for op in ops:
+        if op=='q': depth += 1
+        elif not depth: return
+        elif op=='Q': depth -= 1
+    if depth: return
+    forms = canv._formsinuse[nForms:]
+    digest = md5('\n'.join(ops+['%r %r' % (canv._pagesize,forms)])).hexdigest()
+    seen = doc.__dict__.setdefault('_decorationDigests',{})
+    name = 'PTDecoration'+digest
+    if not seen.has_key(digest):
+        seen[digest] = 1
+        return
+    if not canv.hasForm(name):
+        #the page still holds ops so beginForm will save its accumulators
+        canv.beginForm(name)
+        canv._code.extend(ops)
+        canv._formsinuse.extend(forms)
+        canv.endForm()
+    del code[n:], canv._formsinuse[nForms:]
+    canv.doForm(name)
+
 class PageTemplate:
     """
     essentially a list of Frames and an onPage routine to call at the start
     of a page when this is selected. onPageEnd gets called at the end.
     derived classes can also implement beforeDrawPage and afterDrawPage if they want
+
+    If cacheDecorations is true the onPage and onPageEnd output is compared
+    with that of earlier pages and, when it is byte-identical, shared between
+    pages as a single form XObject.  Only output wrapped in a balanced
+    saveState/restoreState pair and without links or annotations is shared.
     """
     def __init__(self,id=None,frames=[],onPage=_doNothing, onPageEnd=_doNothing,
-                 pagesize=None):
+                 pagesize=None, cacheDecorations=0):
         if type(frames) not in (ListType,TupleType): frames = [frames]
         assert filter(lambda x: not isinstance(x,Frame), frames)==[], "frames argument error"
         self.id = id
@@ -230,6 +280,21 @@ class PageTemplate:
         self.onPage = onPage
         self.onPageEnd = onPageEnd
         self.pagesize = pagesize
+        self.cacheDecorations = cacheDecorations
+
+    def drawOnPage(self,canv,doc):
+        "call onPage, sharing its output between pages if cacheDecorations is set"
+        if getattr(self,'cacheDecorations',0):
+            _drawDecoration(self.onPage,canv,doc)
+        else:
+            self.onPage(canv,doc)
+
+    def drawOnPageEnd(self,canv,doc):
+        "call onPageEnd, sharing its output between pages if cacheDecorations is set"
+        if getattr(self,'cacheDecorations',0):
+            _drawDecoration(self.onPageEnd,canv,doc)
+        else:
+            self.onPageEnd(canv,doc)
 
     def beforeDrawPage(self,canv,doc):
         """Override this if you want additional functionality or prefer
@@ -434,7 +499,7 @@ class BaseDocTemplate:
         if self._debug: logger.debug("beginning page %d" % self.page)
         self.pageTemplate.beforeDrawPage(self.canv,self)
         self.pageTemplate.checkPageSize(self.canv,self)
-        self.pageTemplate.onPage(self.canv,self)
+        self.pageTemplate.drawOnPage(self.canv,self)
         for f in self.pageTemplate.frames: f._reset()
         self.beforePage()
         #keep a count of flowables added to this page.  zero indicates bad stuff
@@ -467,7 +532,7 @@ class BaseDocTemplate:
             if self._onProgress:
                 self._onProgress('PAGE', self.canv.getPageNumber())
             self.pageTemplate.afterDrawPage(self.canv, self)
-            self.pageTemplate.onPageEnd(self.canv, self)
+            self.pageTemplate.drawOnPageEnd(self.canv, self)
             self.afterPage()
             if self._debug: logger.debug("ending page %d" % self.page)
             self.canv.setPageRotation(getattr(self.pageTemplate,'rotation',self.rotation))
@@ -731,6 +796,7 @@ class BaseDocTemplate:
 
         if self._onPage:
             self.canv.setPageCallBack(self._onPage)
+        self._decorationDigests = {}
         self.handle_documentBegin()
 
     def _endBuild(self):
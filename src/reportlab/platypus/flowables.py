@@ -309,37 +309,41 @@ class Image(Flowable):
        which could lead to file handle starvation.
        lazy=1 don't open image until required.
        lazy=2 open image when required then shut it.
+       maxDPI if set limits the resolution the image is embedded at (see Canvas.drawImage).
     """
     _fixedWidth = 1
     _fixedHeight = 1
-    def __init__(self, filename, width=None, height=None, kind='direct', mask="auto", lazy=1):
+    def __init__(self, filename, width=None, height=None, kind='direct', mask="auto", lazy=1, maxDPI=None):
         """If size to draw at not specified, get it from the image."""
         self.hAlign = 'CENTER'
         self._mask = mask
+        self.maxDPI = maxDPI
         fp = hasattr(filename,'read')
         if fp:
             self._file = filename
             self.filename = `filename`
         else:
             self._file = self.filename = filename
-        if not fp and os.path.splitext(filename)[1] in ['.jpg', '.JPG', '.jpeg', '.JPEG']:
-            # if it is a JPEG, will be inlined within the file -
-            # but we still need to know its size now
+        info = None
+        if not fp:
+            # read the size from the file header, so wrap needn't open the image
             from reportlab.lib.utils import open_for_read
-            f = open_for_read(filename, 'b')
             try:
+                f = open_for_read(filename, 'b')
                 try:
-                    info = pdfutils.readJPEGInfo(f)
-                except:
-                    #couldn't read as a JPEG, try like normal
-                    self._setup(width,height,kind,lazy)
-                    return
-            finally:
-                f.close()
-            self.imageWidth = info[0]
-            self.imageHeight = info[1]
-            self._img = None
-            self._setup(width,height,kind,0)
+                    info = pdfutils.readImageInfo(f)
+                finally:
+                    f.close()
+            except:
+                pass    #couldn't read the header, try like normal
+        if info:
+            fmt, self.imageWidth, self.imageHeight = info
+            ext = os.path.splitext(filename)[1].lower()
+            if fmt=='JPEG' and ext in ('.jpg','.jpeg') or fmt=='PNG' and ext=='.png':
+                # will be copied into the PDF from the file directly
+                self._img = None
+                lazy = 0
+            self._setup(width,height,kind,lazy)
         elif fp:
             self._setup(width,height,kind,0)
         else:
@@ -356,9 +360,10 @@ class Image(Flowable):
         width = self._width
         height = self._height
         kind = self._kind
-        img = self._img
-        if img: self.imageWidth, self.imageHeight = img.getSize()
-        if self._lazy>=2: del self._img
+        if 'imageWidth' not in self.__dict__:
+            img = self._img
+            if img: self.imageWidth, self.imageHeight = img.getSize()
+            if self._lazy>=2: del self._img
         if kind in ['direct','absolute']:
             self.drawWidth = width or self.imageWidth
             self.drawHeight = height or self.imageHeight
@@ -394,6 +399,7 @@ class Image(Flowable):
                                 self.drawWidth,
                                 self.drawHeight,
                                 mask=self._mask,
+                                maxDPI=self.maxDPI,
                                 )
         if lazy>=2:
             self._img = None
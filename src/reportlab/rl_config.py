@@ -38,6 +38,12 @@ imageReaderFlags=0                                  #attempt to convert images i
                                                     #if imageReaderFlags&2 then attempt autoclosing of those files
                                                     #if imageReaderFlags&4 then cache data 
                                                     #if imageReaderFlags==-1 then use Ralf Schmitt's re-opening approach
+dedupStreams=               0                       #if 1 identical images, forms, fonts files and CMaps are written only once
+decodedImageCacheSize=      33554432                #max bytes of decoded image pixels kept by lib.utils.decodedImageCache, 0 to disable
+imageXObjectCacheDir=       None                    #directory for the persistent cache of encoded images (pdfutils.imageXObjectCache), None to disable
+imageXObjectCacheSize=      268435456               #max bytes kept in imageXObjectCacheDir, oldest unused entries are removed first
+imageMaxDPI=                None                    #if set, canvas images shown above this resolution are downsampled (needs PIL)
+fontMetricStore=            None                    #file compiled by pdfbase.metricstore.compileMetricStore; font metric tables are mapped from it and shared between processes
 
 # places to look for T1Font information
 T1SearchPath =  (
@@ -163,7 +169,13 @@ odbc_driver
 platypus_link_underline
 canvas_basefontname
 allowShortTableRows
-imageReaderFlags'''.split()
+imageReaderFlags
+dedupStreams
+decodedImageCacheSize
+imageXObjectCacheDir
+imageXObjectCacheSize
+imageMaxDPI
+fontMetricStore'''.split()
     import os, sys
     global sys_version, _unset_
     sys_version = sys.version.split()[0]        #strip off the other garbage
@@ -13,7 +13,7 @@
 #endif
 
 
-#define VERSION "1.06"
+#define VERSION "1.09"
 #define MODULE "_renderPM"
 static PyObject *moduleError;
 static PyObject *_version;
@@ -29,7 +29,7 @@ Interface summary:\n\
 	import _render\n\
 	gstate(width,height[,depth=3,bg=0xffffff])		#create an initialised graphics state\n\
 	makeT1Font(fontName,pfbPath,names[,reader])		#make a T1 font\n\
-	delCache()										#delete all font info\n\
+	delCache()										#delete all font info (deferred while a gstate has a font)\n\
 	pil2pict(cols,rows,datastr,palette) return PICT version of im as a string\n"
 #ifdef	RENDERPM_FT
 "    ft_get_face(fontName) --> ft_face instance\n"
@@ -39,11 +39,20 @@ Interface summary:\n\
 	error			# alias for Error\n\
 	_libart_version	# base library version string\n\
 	_version		# module version string\n\
+\n\
+The path filling, stroking and image drawing methods release the GIL so\n\
+separate gstates may be rendered concurrently from several threads.\n\
 ";
 
 #if PY_VERSION_HEX < 0x01060000
 #	define PyObject_DEL(op) PyMem_DEL((op))
 #endif
+#if PY_VERSION_HEX < 0x02050000
+typedef int Py_ssize_t;
+#	define readbufferproc getreadbufferproc
+#	define segcountproc getsegcountproc
+#	define charbufferproc getcharbufferproc
+#endif
 
 
 typedef struct {
@@ -109,8 +118,11 @@ static PyObject *_get_pdfmetrics__fonts(void){
 	if(!_pdfmetrics__fonts){
 		PyObject *mod=PyImport_ImportModule("reportlab.pdfbase.pdfmetrics");
 		if(mod){
-			_pdfmetrics__fonts = PyObject_GetAttrString(mod,"_fonts");
+			/*the import may release the GIL so another thread can beat us here*/
+			PyObject *fonts = PyObject_GetAttrString(mod,"_fonts");
 			Py_DECREF(mod);
+			if(_pdfmetrics__fonts) Py_XDECREF(fonts);
+			else _pdfmetrics__fonts = fonts;
 			}
 		}
 	return _pdfmetrics__fonts;
@@ -228,49 +240,54 @@ statichere PyTypeObject py_FT_Font_Type = {
 	};
 #endif /*ifdef	RENDERPM_FT*/
 
+static void pixBufClear(pixBufT* p, gstateColorX bg)
+{
+	/*initialise the pixmap pixels*/
+	art_u8	*b, *lim = p->buf+p->rowstride*p->height;
+	size_t	stride = p->rowstride, i;
+	int		nchan = p->nchan;
+
+	/*set up the background*/
+	if(bg.stride==0){	/*simple color case*/
+		art_u32	bgv = (bg.buf[0]<<16) | (bg.buf[1]<<8) | bg.buf[2];
+		for(i=0;i<(size_t)nchan;i++){
+			art_u8 	c= (bgv>>(8*(nchan-i-1)))&0xff;
+			b = p->buf+i;
+			while(b<lim){
+				*b = c;
+				b += nchan;
+				}
+			}
+		}
+	else{	/*image case*/
+		size_t	j = 0;
+		art_u8	*r = bg.buf;
+		b = p->buf;
+		i = 0;
+		while(b<lim){
+			*b++ = r[j++ % bg.stride];
+			if(j==stride){
+				r += bg.stride;
+				j = 0;
+				i++;
+				if(i==bg.height) r = bg.buf;
+				}
+			}
+		}
+}
+
 static pixBufT* pixBufAlloc(int w, int h, int nchan, gstateColorX bg)
 {
 	pixBufT* p = PyMem_Malloc(sizeof(pixBufT));
 	if(p){
-		size_t	n;
 		p->format = 0; /* RGB */
-		p->buf = PyMem_Malloc(n=w*h*nchan); /* start with white background by default */
+		p->buf = PyMem_Malloc(w*h*nchan); /* start with white background by default */
 		if(p->buf){
-			/*initialise the pixmap pixels*/
-			art_u8	*b, *lim = p->buf+n;
-			size_t	stride = w*nchan, i;
 			p->width = w;
 			p->height = h;
 			p->nchan = nchan;
-			p->rowstride = stride;
-
-			/*set up the background*/
-			if(bg.stride==0){	/*simple color case*/
-				art_u32	bgv = (bg.buf[0]<<16) | (bg.buf[1]<<8) | bg.buf[2];
-				for(i=0;i<(size_t)nchan;i++){
-					art_u8 	c= (bgv>>(8*(nchan-i-1)))&0xff;
-					b = p->buf+i;
-					while(b<lim){
-						*b = c;
-						b += nchan;
-						}
-					}
-				}
-			else{	/*image case*/
-				size_t	j = 0;
-				art_u8	*r = bg.buf;
-				b = p->buf;
-				i = 0;
-				while(b<lim){
-					*b++ = r[j++ % bg.stride];
-					if(j==stride){
-						r += bg.stride;
-						j = 0;
-						i++;
-						if(i==bg.height) r = bg.buf;
-						}
-					}
-				}
+			p->rowstride = w*nchan;
+			pixBufClear(p,bg);
 			}
 		else {
 			PyMem_Free(p);
@@ -321,6 +338,42 @@ typedef struct {
 	ArtVpathDash	dash;			/*for doing dashes*/
 	Gt1EncodedFont*		font;		/*the currently set external font or NULL*/
 	} gstateObject;
+
+/*
+ * The rasterising methods release the GIL so several gstates can be rendered
+ * from different threads; a single gstate must only be used by one thread at
+ * a time. The gt1 font cache is shared, so delCache is deferred while any
+ * gstate still has a gt1 font set (which covers any running drawString);
+ * the cache is deleted when the last of those lets go.
+ * These counters are only touched while holding the GIL.
+ */
+static int _fontHolders = 0;	/*gstates with a gt1 font set*/
+static int _delCachePending = 0;
+
+#ifdef	RENDERPM_FT
+#	define _gstate_holdsGt1Font(self) ((self)->font && !(self)->ft_font)
+#else
+#	define _gstate_holdsGt1Font(self) ((self)->font!=NULL)
+#endif
+
+static void _fontCacheCheckPending(void)
+{
+	if(_delCachePending && !_fontHolders){
+		_delCachePending = 0;
+		gt1_del_cache();
+		}
+}
+
+static void _gstate_releaseFont(gstateObject* self)
+{
+	if(_gstate_holdsGt1Font(self)){
+		_fontHolders--;
+		self->font = NULL;
+		_fontCacheCheckPending();
+		}
+	else self->font = NULL;
+}
+
 static ArtBpath notdefPath[6]={
 		{ART_MOVETO,0.0,0.0,0.0,0.0,726.0,0.0},
 		{ART_LINETO,0.0,0.0,0.0,0.0,726.0,692.0},
@@ -596,6 +649,7 @@ static	PyObject* gstate_clipPathSet(gstateObject* self, PyObject* args)
 	if(!PyArg_ParseTuple(args,":clipPathSet")) return NULL;
 	gstate_pathEnd(self);
 	dump_path(self);
+	Py_BEGIN_ALLOW_THREADS
 	vpath = art_bez_path_to_vec(self->path, 0.25);
 	dump_vpath("after -->vec",vpath);
 	trVpath = art_vpath_affine_transform (vpath, self->ctm);
@@ -604,6 +658,7 @@ static	PyObject* gstate_clipPathSet(gstateObject* self, PyObject* args)
 	self->clipSVP = art_svp_from_vpath(trVpath);
 	art_free(trVpath);
 	art_free(vpath);
+	Py_END_ALLOW_THREADS
 	Py_INCREF(Py_None);
 	return Py_None;
 }
@@ -618,6 +673,8 @@ static void _gstate_pathFill(gstateObject* self,int endIt, int vpReverse)
 		double		a;
 		if(endIt) gstate_pathEnd(self);
 		dump_path(self);
+		/*pure libart from here on, let other threads run*/
+		Py_BEGIN_ALLOW_THREADS
 		vpath = art_bez_path_to_vec(self->path, 0.25);
 		if(0 && vpReverse) _vpath_reverse(vpath);
 		trVpath =  art_vpath_affine_transform(vpath, self->ctm);
@@ -652,6 +709,7 @@ static void _gstate_pathFill(gstateObject* self,int endIt, int vpReverse)
 			}
 		art_free(trVpath);
 		art_free(vpath);
+		Py_END_ALLOW_THREADS
 		}
 }
 
@@ -674,6 +732,7 @@ static PyObject* gstate_pathStroke(gstateObject* self, PyObject* args)
 	if(self->strokeColor.valid && self->strokeWidth>0){
 		gstate_pathEnd(self);
 		dump_path(self);
+		Py_BEGIN_ALLOW_THREADS
 		vpath = art_bez_path_to_vec(self->path, 0.25);
 
 		if(self->dash.dash){
@@ -705,6 +764,7 @@ static PyObject* gstate_pathStroke(gstateObject* self, PyObject* args)
 						 NULL);
 		art_svp_free(svp);
 		art_free(vpath);
+		Py_END_ALLOW_THREADS
 		}
 	Py_INCREF(Py_None);
 	return Py_None;
@@ -1062,6 +1122,11 @@ static PyObject* gstate_setFont(gstateObject* self, PyObject* args)
 		}
 #endif
 	if(f){
+		if(ft_font || f!=self->font){
+			/*hold the new font before letting go of the old, which may be pending deletion*/
+			if(!ft_font) _fontHolders++;
+			_gstate_releaseFont(self);
+			}
 		self->font = f;
 		self->fontSize = fontSize;
 		if(self->fontNameObj) Py_DECREF(self->fontNameObj);
@@ -1156,8 +1221,11 @@ static PyObject* gstate__aapixbuf(gstateObject* self, PyObject* args)
 	src.rowstride = src.width*src.n_channels;
 	src.has_alpha = src.n_channels==4;
 	src.bits_per_sample = 8;
+	/*src.pixels is kept alive by args*/
+	Py_BEGIN_ALLOW_THREADS
 	art_rgb_pixbuf_affine(self->pixBuf->buf,0,0,self->pixBuf->width,self->pixBuf->height,self->pixBuf->rowstride,
 			(const ArtPixBuf*)&src,ctm,ART_FILTER_NEAREST,NULL);
+	Py_END_ALLOW_THREADS
 	Py_INCREF(Py_None);
 	return Py_None;
 }
@@ -1344,7 +1412,39 @@ static PyObject* _get_gstateFontName(gstateObject *self)
 	return r;
 }
 
+static PyObject* gstate_clear(gstateObject* self, PyObject* args)
+{
+	PyObject		*pbg=NULL;
+	art_u32			v = 0xffffffff;
+	gstateColorX	bg = {1,1,0,NULL};
+	bg.buf = (art_u8*)&v;	/*default white background*/
+
+	if(!PyArg_ParseTuple(args,"|O:clear",&pbg)) return NULL;
+	if(pbg && pbg!=Py_None){
+		if(!_set_gstateColorX(pbg,&bg)){
+			PyErr_SetString(moduleError, "invalid value for bg");
+			return NULL;
+			}
+		}
+	pixBufClear(self->pixBuf,bg);
+	if(self->clipSVP){
+		art_svp_free(self->clipSVP);
+		self->clipSVP = NULL;
+		}
+	_dashFree(self);
+	self->dash.n_dash = 0;
+	self->ctm[0] = self->ctm[3] = 1.0;
+	self->ctm[1] = self->ctm[2] = self->ctm[4] = self->ctm[5] = 0.0;
+	self->strokeColor.valid = self->fillColor.valid = 0;
+	self->fillRule = self->lineCap = self->lineJoin = 0;
+	self->strokeOpacity = self->strokeWidth = self->fillOpacity = 1.0;
+	self->pathLen = 0;
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
 static struct PyMethodDef gstate_methods[] = {
+	{"clear", (PyCFunction)gstate_clear, METH_VARARGS, "clear([bg=0xffffff])"},
 	{"clipPathClear", (PyCFunction)gstate_clipPathClear, METH_VARARGS, "clipPathClear()"},
 	{"clipPathSet", (PyCFunction)gstate_clipPathSet, METH_VARARGS, "clipPathSet()"},
 	{"curveTo", (PyCFunction)gstate_curveTo, METH_VARARGS, "curveTo(x1,y1,x2,y2,x3,y3)"},
@@ -1447,10 +1547,51 @@ static	void gstateFree(gstateObject* self)
 	if(self->clipSVP){
 		art_free(self->clipSVP);
 		}
+	_gstate_releaseFont(self);
 	if(self->fontNameObj) Py_DECREF(self->fontNameObj);
 	PyObject_DEL(self);
 }
 
+/*the pixBuf memory is exported read only through the buffer interface;
+  rows are stored bottom up, each width*depth bytes long*/
+static Py_ssize_t gstate_getreadbuf(gstateObject *self, Py_ssize_t segment, void **ptr)
+{
+	if(segment!=0){
+		PyErr_SetString(PyExc_SystemError, "accessing non-existent gstate segment");
+		return -1;
+		}
+	*ptr = (void *)self->pixBuf->buf;
+	return (Py_ssize_t)(self->pixBuf->rowstride*self->pixBuf->height);
+}
+
+static Py_ssize_t gstate_getsegcount(gstateObject *self, Py_ssize_t *lenp)
+{
+	if(lenp) *lenp = (Py_ssize_t)(self->pixBuf->rowstride*self->pixBuf->height);
+	return 1;
+}
+
+#ifdef Py_TPFLAGS_HAVE_NEWBUFFER
+static int gstate_getbuffer(gstateObject *self, Py_buffer *view, int flags)
+{
+	pixBufT* p = self->pixBuf;
+	return PyBuffer_FillInfo(view, (PyObject *)self, (void *)p->buf, (Py_ssize_t)(p->rowstride*p->height), 1, flags);
+}
+#	define GSTATE_TPFLAGS (Py_TPFLAGS_DEFAULT|Py_TPFLAGS_HAVE_NEWBUFFER)
+#else
+#	define GSTATE_TPFLAGS Py_TPFLAGS_DEFAULT
+#endif
+
+static PyBufferProcs gstate_as_buffer = {
+	(readbufferproc)gstate_getreadbuf,		/*bf_getreadbuffer*/
+	0,										/*bf_getwritebuffer*/
+	(segcountproc)gstate_getsegcount,		/*bf_getsegcount*/
+	(charbufferproc)gstate_getreadbuf,		/*bf_getcharbuffer*/
+#ifdef Py_TPFLAGS_HAVE_NEWBUFFER
+	(getbufferproc)gstate_getbuffer,		/*bf_getbuffer*/
+	0,										/*bf_releasebuffer*/
+#endif
+};
+
 static PyTypeObject gstateType = {
 	PyObject_HEAD_INIT(0)
 	0,								/*ob_size*/
@@ -1470,13 +1611,15 @@ static PyTypeObject gstateType = {
 	(hashfunc)0,					/*tp_hash*/
 	(ternaryfunc)0,					/*tp_call*/
 	(reprfunc)0,					/*tp_str*/
-
-	/* Space for future expansion */
-	0L,0L,0L,0L,
+	0,								/*tp_getattro*/
+	0,								/*tp_setattro*/
+	&gstate_as_buffer,				/*tp_as_buffer*/
+	GSTATE_TPFLAGS,					/*tp_flags*/
 	/* Documentation string */
 	"gstate instance\n\
 \n\
 gstates have the following methods\n\
+ clear([bg]) reset the state and fill the pixBuf with bg for reuse\n\
  clipPathClear() clear clipPath\n\
  clipPathSet() move current path into clipPath\n\
  curveTo(x1,y1,x2,y2,x3,y3)  #add a curveTo type segment\n\
@@ -1514,18 +1657,20 @@ depth		int readonly pixBuf depth\n\
 path		readonly tuple describing the path\n\
 pathLen		int readonly number of path segments\n\
 pixBuf		str readonly the pixBuf\n\
+\n\
+gstates support the read only buffer interface; the buffer is the\n\
+pixBuf memory itself with rows stored bottom up\n\
 "
 };
 
 
-static  art_u32			bgv = 0xffffffff;
-
 static	gstateObject* gstate(PyObject* module, PyObject* args, PyObject* keywds)
 {
 	gstateObject*		self=NULL;
 	int					w, h, d=3, m=12;
 	char				*kwlist[] = {"w","h","depth","bg",NULL};
 	PyObject			*pbg=NULL;
+	art_u32				bgv = 0xffffffff;	/*local so a bg argument can't leak into later calls*/
 	gstateColorX		bg = {1,1,0,(art_u8*)&bgv};	/*default white background*/
 
 	if(!PyArg_ParseTupleAndKeywords(args,keywds,"ii|iO:gstate",kwlist,&w,&h,&d,&pbg)) return NULL;
@@ -1537,6 +1682,8 @@ static	gstateObject* gstate(PyObject* module, PyObject* args, PyObject* keywds)
 		}
 
 	if((self = PyObject_NEW(gstateObject, &gstateType))){
+		self->font = NULL;
+		self->fontNameObj = NULL;
 		self->pixBuf = pixBufAlloc(w,h,d,bg);
 		self->path = art_new(ArtBpath,m);
 		if(!self->pixBuf){
@@ -1553,8 +1700,6 @@ static	gstateObject* gstate(PyObject* module, PyObject* args, PyObject* keywds)
 			self->pathLen = 0;
 			self->pathMax = m;
 			self->clipSVP = NULL;
-			self->font = NULL;
-			self->fontNameObj = NULL;
 			self->fontSize = 10;
 			self->dash.n_dash = 0;
 			self->dash.dash = NULL;
@@ -1649,7 +1794,8 @@ static	PyObject*	makeT1Font(PyObject* self, PyObject *args, PyObject *kw)
 static PyObject* delCache(PyObject* self, PyObject* args)
 {
 	if(!PyArg_ParseTuple(args,":delCache")) return NULL;
-	gt1_del_cache();
+	_delCachePending = 1;	/*deleted now unless a gstate has a gt1 font set*/
+	_fontCacheCheckPending();
 	Py_INCREF(Py_None);
 	return Py_None;
 }
@@ -1894,7 +2040,7 @@ static PyObject* pil2pict(PyObject* self, PyObject* args)
 static struct PyMethodDef moduleMethods[] = {
 	{"gstate", (PyCFunction)gstate, METH_VARARGS|METH_KEYWORDS, "gstate(width,height[,depth=3][,bg=0xffffff]) create an initialised graphics state"},
 	{"makeT1Font", (PyCFunction)makeT1Font, METH_VARARGS|METH_KEYWORDS, "makeT1Font(fontName,pfbPath,names)"},
-	{"delCache", (PyCFunction)delCache, METH_VARARGS, "delCache()"},
+	{"delCache", (PyCFunction)delCache, METH_VARARGS, "delCache() delete the gt1 font cache; this is deferred until no gstate has a gt1 font set, so a PMCanvas kept for reuse (drawToPMCanvas(canvas=...)) keeps the cache alive until it is freed"},
 	{"pil2pict", (PyCFunction)pil2pict, METH_VARARGS, "pil2pict(cols,rows,datastr,palette) return PICT version of im as a string"},
 #ifdef	RENDERPM_FT
     {"ft_get_face", (PyCFunction)ft_get_face, METH_VARARGS|METH_KEYWORDS,"ft_get_face(fontName) --> ft_face instance"},
@@ -74,6 +74,103 @@ if  __name__=='__main__':
             traceback.print_exc()
             print g.path
 
+        try:
+            g=_renderPM.gstate(2,2,bg=0x102030)
+            g.fillColor = 0xff0000
+            g.pathBegin()
+            g.moveTo(0,0)
+            g.lineTo(2,0)
+            g.lineTo(2,1)
+            g.lineTo(0,1)
+            g.pathClose()
+            g.pathFill()
+            b = buffer(g)
+            assert len(b)==12, 'pixBuf buffer should have 12 bytes'
+            assert b[:6]=='\xff\x00\x00'*2, 'pixBuf buffer rows should be stored bottom up'
+            assert b[6:]+b[:6]==g.pixBuf, 'pixBuf buffer should match pixBuf'
+            if verbose: print 'pixBuf buffer obtained OK'
+        except:
+            print 'wrong handling of pixBuf buffer'
+            traceback.print_exc()
+
+        try:
+            g.ctm = (2,0,0,2,1,1)
+            g.dashArray = 0,(1,2)
+            g.clear(0x405060)
+            assert g.pixBuf=='\x40\x50\x60'*4, 'clear should fill the pixBuf with bg'
+            assert g.ctm==(1,0,0,1,0,0), 'clear should reset the ctm'
+            assert g.dashArray is None, 'clear should reset the dashArray'
+            g.clear()
+            assert g.pixBuf=='\xff'*12, 'clear should default to a white bg'
+            if verbose: print 'clear OK'
+        except:
+            print 'wrong handling of clear'
+            traceback.print_exc()
+
+        try:
+            _renderPM.gstate(2,2,bg=0)
+            assert _renderPM.gstate(2,2).pixBuf=='\xff'*12, 'a bg argument should not change the default'
+            if verbose: print 'default bg OK'
+        except:
+            print 'wrong handling of default bg'
+            traceback.print_exc()
+
+        try:
+            from reportlab.lib.utils import getStringIO
+            d = shapes.Drawing(20,30)
+            d.add(shapes.Rect(0,0,20,10,fillColor=None,strokeColor=None))
+            d.add(shapes.Rect(0,0,10,30,strokeColor=None))
+            ref = renderPM.drawToPMCanvas(d)._gs.pixBuf
+            for bandHeight, threads in ((7,0),(4,3),(100,0)):
+                f = getStringIO()
+                renderPM.drawToFileInBands(d,f,fmt='TIFF',bandHeight=bandHeight,threads=threads)
+                assert f.getvalue()[168:]==ref, 'banded TIFF rows should match the full render'
+            f = getStringIO()
+            renderPM.drawToFileInBands(d,f,fmt='PNG',bandHeight=7)
+            assert f.getvalue()[:8]=='\x89PNG\r\n\x1a\n', 'bad PNG signature'
+            if verbose: print 'drawToFileInBands OK'
+        except:
+            print 'wrong handling of drawToFileInBands'
+            traceback.print_exc()
+
+        try:
+            g = _renderPM.gstate(60,20)
+            renderPM._setFont(g,'DarkGardenMK',12)
+            _renderPM.delCache()
+            g.drawString(2,5,'Hello')
+            if verbose: print 'delCache with a font set OK'
+        except:
+            print 'wrong handling of delCache with a font set'
+            traceback.print_exc()
+
+        try:
+            import threading
+            def drawText(i):
+                g = _renderPM.gstate(120,40)
+                g.fillColor = 0
+                renderPM._setFont(g,'DarkGardenMK',10+i)
+                for n in xrange(10):
+                    g.drawString(2,5+n,'Thread text %d' % i)
+                return g.pixBuf
+            refs = [drawText(i) for i in xrange(6)]
+            bad = []
+            def worker(i):
+                try:
+                    for n in xrange(20):
+                        if drawText(i)!=refs[i]: bad.append(i)
+                except:
+                    bad.append(sys.exc_info()[1])
+            T = [threading.Thread(target=worker,args=(i,)) for i in xrange(6)]
+            for t in T: t.start()
+            while [t for t in T if t.isAlive()]:
+                _renderPM.delCache()
+            for t in T: t.join()
+            assert not bad, 'threaded text rendering with delCache went wrong %r' % bad[:3]
+            if verbose: print 'threaded delCache OK'
+        except:
+            print 'wrong handling of threaded delCache'
+            traceback.print_exc()
+
     if len(sys.argv)==1:
         test_base()
     else:
@@ -29,7 +29,7 @@ static __version__=" $Id$ "
 #ifndef min
 #	define min(a,b) ((a)<(b)?(a):(b))
 #endif
-#define VERSION "0.61"
+#define VERSION "0.63"
 #define MODULE "_rl_accel"
 
 static PyObject *moduleVersion;
@@ -481,20 +481,11 @@ PyObject *_a85_decode(PyObject *self, PyObject *args)
 }
 
 static	char* _fp_fmts[]={"%.0f", "%.1f", "%.2f", "%.3f", "%.4f", "%.5f", "%.6f"};
-static	char *_fp_one(PyObject *pD)
+static	char *_fp_fmt(double d, char *s)
 {
-	double	d, ad;
-	static	char s[30];
+	double	ad;
 	int l;
 	char*	dot;
-	if((pD=PyNumber_Float(pD))){
-		d = PyFloat_AS_DOUBLE(pD);
-		Py_DECREF(pD);
-		}
-	else {
-		PyErr_SetString(ErrorObject, "bad numeric value");
-		return NULL;
-		}
 	ad = fabs(d);
 	if(ad<=1.0e-7){
 		s[0]='0';
@@ -525,6 +516,21 @@ static	char *_fp_one(PyObject *pD)
 	return s;
 }
 
+static	char *_fp_one(PyObject *pD)
+{
+	double	d;
+	static	char s[30];
+	if((pD=PyNumber_Float(pD))){
+		d = PyFloat_AS_DOUBLE(pD);
+		Py_DECREF(pD);
+		}
+	else {
+		PyErr_SetString(ErrorObject, "bad numeric value");
+		return NULL;
+		}
+	return _fp_fmt(d,s);
+}
+
 PyObject *_fp_str(PyObject *self, PyObject *args)
 {
 	int				aL;
@@ -574,6 +580,94 @@ PyObject *_fp_str(PyObject *self, PyObject *args)
 		}
 }
 
+static int _fp_path_nargs(char op)
+{
+	switch(op){
+		case 'm': case 'l': return 2;
+		case 'c': return 6;
+		case 'v': case 'y': return 4;
+		case 'h': return 0;
+		}
+	return -1;
+}
+
+PyObject *_fp_path(PyObject *self, PyObject *args)
+{
+	PyObject	*points, *seq=NULL, *tc, *retVal=NULL;
+	char		*ops=NULL, *buf=NULL, *pB, *pD, op;
+	char		s[30];
+	int			opsLen=0, nOps, n=0, i, j, k, nArgs;
+	double		*dv=NULL;
+	float		*fv=NULL;
+	const void	*rb;
+#if PY_VERSION_HEX>=0x02050000
+	Py_ssize_t	rbLen;
+#else
+	int			rbLen;
+#endif
+
+	if(!PyArg_ParseTuple(args, "O|z#:fp_path", &points, &ops, &opsLen)) return NULL;
+
+	/*double and float array.arrays are read straight from their buffers*/
+	if((tc=PyObject_GetAttrString(points,"typecode"))){
+		if(PyString_Check(tc) && PyString_GET_SIZE(tc)==1 && !PyObject_AsReadBuffer(points,&rb,&rbLen)){
+			switch(PyString_AS_STRING(tc)[0]){
+				case 'd': dv = (double*)rb; n = rbLen/sizeof(double); break;
+				case 'f': fv = (float*)rb; n = rbLen/sizeof(float); break;
+				}
+			}
+		Py_DECREF(tc);
+		}
+	PyErr_Clear();
+	if(!dv && !fv){
+		if(!(seq=PySequence_Fast(points,"fp_path: points must be a sequence of numbers"))) return NULL;
+		n = PySequence_Fast_GET_SIZE(seq);
+		}
+	if(ops) nOps = opsLen;
+	else if(n<2 || n&1){
+		PyErr_SetString(PyExc_ValueError, "fp_path: need an even number of at least 2 coordinates");
+		goto L_exit;
+		}
+	else nOps = n/2;
+
+	pB = buf = PyMem_Malloc(31*n+2*nOps+1);
+	if(!buf){
+		PyErr_NoMemory();
+		goto L_exit;
+		}
+	for(i=j=0;i<nOps;i++){
+		op = ops ? ops[i] : (i ? 'l' : 'm');
+		if((nArgs=_fp_path_nargs(op))<0){
+			PyErr_Format(PyExc_ValueError, "fp_path: unknown path operator '%c'", op);
+			goto L_exit;
+			}
+		if(j+nArgs>n){
+			PyErr_SetString(PyExc_ValueError, "fp_path: not enough coordinates");
+			goto L_exit;
+			}
+		for(k=0;k<nArgs;k++,j++){
+			if(dv) pD = _fp_fmt(dv[j],s);
+			else if(fv) pD = _fp_fmt(fv[j],s);
+			else pD = _fp_one(PySequence_Fast_GET_ITEM(seq,j));
+			if(!pD) goto L_exit;
+			strcpy(pB,pD);
+			pB += strlen(pB);
+			*pB++ = ' ';
+			}
+		*pB++ = op;
+		*pB++ = ' ';
+		}
+	if(j!=n){
+		PyErr_SetString(PyExc_ValueError, "fp_path: too many coordinates");
+		goto L_exit;
+		}
+	retVal = PyString_FromStringAndSize(buf,pB>buf ? pB-buf-1 : 0);
+L_exit:
+	if(buf) PyMem_Free(buf);
+	Py_XDECREF(seq);
+	return retVal;
+}
+
 static PyObject *_escapePDF(unsigned char* text, int textlen)
 {
 	unsigned char*	out = PyMem_Malloc((textlen<<2)+1);
@@ -794,6 +888,39 @@ static PyObject *hex32(PyObject *self, PyObject* args)
 	return PyString_FromString(buf);
 }
 
+static PyObject *arciv(PyObject *self, PyObject* args)
+{
+	unsigned char	*key, *data, *out, sbox[256], t;
+	int				keyLen, dataLen, i, j, n;
+	PyObject		*r;
+
+	if(!PyArg_ParseTuple(args, "s#s#:arciv", &key, &keyLen, &data, &dataLen)) return NULL;
+	if(keyLen<=0){
+		PyErr_SetString(PyExc_ValueError, "arciv: key must not be empty");
+		return NULL;
+		}
+	if(!(r=PyString_FromStringAndSize(NULL,dataLen))) return NULL;
+	out = (unsigned char *)PyString_AS_STRING(r);
+
+	Py_BEGIN_ALLOW_THREADS
+	/*key schedule*/
+	for(i=0;i<256;i++) sbox[i] = (unsigned char)i;
+	for(i=j=0;i<256;i++){
+		j = (j+sbox[i]+key[i%keyLen])&255;
+		t = sbox[i]; sbox[i] = sbox[j]; sbox[j] = t;
+		}
+
+	/*xor the data with the key stream*/
+	for(i=j=n=0;n<dataLen;n++){
+		i = (i+1)&255;
+		j = (j+sbox[i])&255;
+		t = sbox[i]; sbox[i] = sbox[j]; sbox[j] = t;
+		out[n] = data[n]^sbox[(sbox[i]+sbox[j])&255];
+		}
+	Py_END_ALLOW_THREADS
+	return r;
+}
+
 #if PY_VERSION_HEX>=0x02030000
 static PyObject *_notdefFont=NULL;
 static PyObject *_notdefChar=NULL;
@@ -1663,12 +1790,14 @@ static char *__doc__=
 \t_AsciiBase85Encode does what is says\n\
 \t_AsciiBase85Decode does what is says\n\
 \n\
-\tfp_str converts numeric arguments to a single blank separated string\n"
+\tfp_str converts numeric arguments to a single blank separated string\n\
+\tfp_path converts a coordinate sequence and path operators to PDF path code\n"
 "\tcalcChecksum calculate checksums for TTFs (legacy)\n"
 "\tcalcChecksumL calculate checksums for TTFs (returns long)\n"
 "\tadd32 32 bit unsigned addition (legacy)\n"
 "\tadd32L 32 bit unsigned addition (returns long)\n"
 "\thex32 32 bit unsigned to 0X8.8X string\n"
+"\tarciv ArcIV (RC4) stream encryption of a string\n"
 #if PY_VERSION_HEX>=0x02030000
 "\tstringWidthU version2 stringWidth\n\
 \t_instanceStringWidthU version2 Font instance stringWidth\n\
@@ -1702,12 +1831,14 @@ static struct PyMethodDef _methods[] = {
 	{"escapePDF", escapePDF, METH_VARARGS, "escapePDF(s) return PDF safed string"},
 	{"_instanceEscapePDF", _instanceEscapePDF, METH_VARARGS, "_instanceEscapePDF(s) return PDF safed string"},
 	{"fp_str", _fp_str, METH_VARARGS, "fp_str(a0, a1,...) convert numerics to blank separated string"},
+	{"fp_path", _fp_path, METH_VARARGS, "fp_path(points[,ops]) return PDF path code for the coordinates in points using the single character operators in ops (m l c v y h); by default a moveto then linetos"},
 	{"_sameFrag", _sameFrag, 1, "_sameFrag(f,g) return 1 if fragments have same style"},
 	{"calcChecksum", ttfonts_calcChecksum, METH_VARARGS, "calcChecksum(string) calculate checksums for TTFs (legacy)"},
 	{"calcChecksumL", ttfonts_calcChecksumL, METH_VARARGS, "calcChecksumL(string) calculate checksums for TTFs (returns long)"},
 	{"add32", ttfonts_add32, METH_VARARGS, "add32(x,y)  32 bit unsigned x+y (legacy)"},
 	{"add32L", ttfonts_add32L, METH_VARARGS, "add32L(x,y)  32 bit unsigned x+y (returns long)"},
 	{"hex32", hex32, METH_VARARGS, "hex32(x)  32 bit unsigned-->0X8.8X string"},
+	{"arciv", arciv, METH_VARARGS, "arciv(key,data) return data ArcIV (RC4) encrypted with key from the initial cipher state"},
 #if PY_VERSION_HEX>=0x02030000
 	{"unicode2T1", (PyCFunction)unicode2T1, METH_VARARGS|METH_KEYWORDS, "return a list of (font,string) pairs representing the unicode text"},
 	{"getFontU", (PyCFunction)getFontU, METH_VARARGS|METH_KEYWORDS, "getFontU(name)-->Font instance"},
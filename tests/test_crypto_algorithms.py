@@ -19,7 +19,8 @@ setOutDir(__name__)
 from reportlab.pdfgen.canvas import Canvas
 from reportlab.lib.pdfencrypt import computeO, \
     computeU, hexText, unHexText, encryptionkey, encodePDF, \
-    encryptCanvas
+    encryptCanvas, objectKey, StandardEncryption
+from reportlab.lib.arciv import ArcIV
 
 VERBOSE = 0
 
@@ -79,6 +80,25 @@ class EncryptionAlgorithmTestCase(unittest.TestCase):
                                  'anonymous')
                        ) == '<27FB3E943FCF61878B>'
 
+    def checkObjectKey(self):
+        key = unHexText('<3C0C5EBE0122D8EB2BDDF8A09FA8E29E>')
+        assert len(objectKey(key[:5],9,0))==10
+        assert len(objectKey(key,9,0,revision=3))==16
+        assert ArcIV(objectKey(key,9,0)).encode('anonymous')==encodePDF(key,9,0,'anonymous')
+
+    def checkStandardEncryptionObjectKey(self):
+        "the per object key is computed once per object and reset on register"
+        enc = StandardEncryption('userpass',strength=128)
+        enc.prepare(None,overrideID='xxxxxxxxxxxxxxxx')
+        enc.register(9,0)
+        a = enc.encode('anonymous')
+        assert enc.encode('anonymous')==a
+        assert a==encodePDF(enc.key,9,0,'anonymous',revision=3)
+        enc.register(10,0)
+        assert enc.encode('anonymous')==encodePDF(enc.key,10,0,'anonymous',revision=3)
+        enc.register(9,0)
+        assert enc.encode('anonymous')==a
+
 class EyeballTestCase(unittest.TestCase):
     "This makes a gaxillion self-explanatory files"
     def check40BitOptions(self):
@@ -410,8 +410,142 @@ class ChartTestCase(unittest.TestCase):
         global FINISHED
         FINISHED = 1
 
+class FormCacheTestCase(unittest.TestCase):
+    "Test drawings shared between pages as forms."
+
+    def test0(self):
+        from reportlab.graphics import renderPDF
+        c = Canvas(outputfile('test_graphics_charts_formcache.pdf'))
+        drawings = [sample1bar(),sample1bar(),sample4pie()]
+        for d in drawings: d.formCache = 1
+        keys = [renderPDF.drawingKey(d,c) for d in drawings]
+        self.assertEqual(keys[0],keys[1])
+        self.assertNotEqual(keys[0],keys[2])
+        for i in xrange(4):
+            for j,d in enumerate(drawings):
+                d.drawOn(c,cm,j*250)
+            c.showPage()
+        c.save()
+        doc = c._doc
+        forms = [n for n in doc.idToObject.keys() if n.startswith('FormXob.Drawing.')]
+        self.assertEqual(len(forms),2)
+        for page in doc.Pages.pages:
+            self.assertEqual(page.stream.count(' Do'),3)
+
+class DecimationTestCase(unittest.TestCase):
+    "Test thinning of dense line and scatter plots."
+
+    def _lines(self,lp):
+        from reportlab.graphics.shapes import PolyLine
+        return [n for n in lp.makeLines().contents if isinstance(n,PolyLine)]
+
+    def test0(self):
+        from math import sin
+        from reportlab.graphics.charts.lineplots import LinePlot
+        from reportlab.graphics.charts.utils import decimateMinMax, decimateDouglasPeucker
+        lp = LinePlot()
+        lp.x, lp.y, lp.width, lp.height = 50, 50, 300, 125
+        lp.data = [[(i,sin(i*0.01)+(i%7)*0.001) for i in xrange(10000)]]
+        lp.lines[0].symbol = None
+        lp.xValueAxis.setPosition(lp.x,lp.y,lp.width)
+        lp.xValueAxis.configure(lp.data)
+        lp.yValueAxis.setPosition(lp.x,lp.y,lp.height)
+        lp.yValueAxis.configure(lp.data)
+        lp.calcPositions()
+        full = self._lines(lp)[0].points
+        for decimate in ('minmax','douglas-peucker'):
+            lp.decimate = decimate
+            points = self._lines(lp)[0].points
+            self.assert_(len(points)<len(full)/4,'%s kept %d of %d' % (decimate,len(points),len(full)))
+            self.assertEqual(points[:2],full[:2])
+            self.assertEqual(points[-2:],full[-2:])
+            if decimate=='minmax':
+                Y = points[1::2]
+                self.assertEqual((min(Y),max(Y)),(min(full[1::2]),max(full[1::2])))
+        P = [(0,0),(1,0.1),(2,-0.1),(3,5),(4,0)]
+        self.assertEqual(decimateDouglasPeucker(P,0.5),[0,2,3,4])
+        self.assertEqual(decimateMinMax([(0,0),(0.1,3),(0.2,-1),(0.3,1),(0.4,0),(1,2)],1),[0,1,2,4,5])
+
+    def test1(self):
+        from reportlab.graphics.charts.lineplots import ScatterPlot
+        sp = ScatterPlot()
+        sp.data = [[(i%10,i%10) for i in xrange(100)]]
+        sp.lineLabelFormat = None
+        sp.draw()
+        n = len(sp.makeLines().contents)
+        sp.decimate = 'minmax'
+        self.assertEqual(len(sp.makeLines().contents),n/10)
+
+class ScaleValuesTestCase(unittest.TestCase):
+    "Test batched axis scaling against the per value version."
+
+    def test0(self):
+        from reportlab.graphics.charts.axes import XValueAxis, YValueAxis
+        data = [[(i,i*i-7.5) for i in xrange(-5,20)]]
+        for klass in XValueAxis, YValueAxis:
+            a = klass()
+            a.setPosition(20,30,200)
+            a.configure(data)
+            V = [p[a._dataIndex] for p in data[0]]+[None]
+            self.assertEqual(a.scaleValues(V),map(a.scale,V))
+
+    def test1(self):
+        from reportlab.graphics.charts.lineplots import LinePlot
+        lp = LinePlot()
+        lp.data = [[(i,i*0.5) for i in xrange(50)],[(i,50-i) for i in xrange(40)]]
+        lp.draw()
+        xs, ys = lp.xValueAxis.scale, lp.yValueAxis.scale
+        self.assertEqual(lp._positions,[[(xs(x),ys(y)) for x,y in row] for row in lp.data])
+
+    def test2(self):
+        from reportlab.graphics.charts.barcharts import VerticalBarChart
+        bc = VerticalBarChart()
+        bc.data = [(13, 5, 20, None, 38), (14, -6, 5, 6, 13)]
+        for style in 'parallel','stacked':
+            bc.categoryAxis.style = style
+            bc.draw()
+            vs = bc.valueAxis.scale
+            self.assertEqual(len(bc._barPositions),2)
+            for row,B in zip(bc.data,bc._barPositions):
+                for colNo,(v,(x,y,w,h)) in enumerate(zip(row,B)):
+                    self.assertEqual(x,bc.categoryAxis.scale(colNo)[0]+bc._normFactor*(
+                        0.5*bc.groupSpacing+(style=='parallel' and B is bc._barPositions[1])*(bc.barWidth+bc.barSpacing)))
+                    if v is None:
+                        self.assertEqual(h,None)
+                    elif style=='parallel':
+                        self.assertAlmostEqual(y+h,vs(v))
+
+    def test3(self):
+        from reportlab.graphics.charts.axes import XCategoryAxis, YCategoryAxis
+        for klass in XCategoryAxis, YCategoryAxis:
+            for rev in 0,1:
+                a = klass()
+                a.setPosition(20,30,200)
+                a.reverseDirection = rev
+                a.configure([range(7)])
+                I = range(7)
+                self.assertEqual(a.scaleIndices(I),[a.scale(i)[0] for i in I])
+
+    def test4(self):
+        from reportlab.graphics.charts.linecharts import HorizontalLineChart
+        lc = HorizontalLineChart()
+        lc.data = [(13, 5, 20, None, 38), (14, -6, 5, 6, 13)]
+        lc.draw()
+        cs, vs = lc.categoryAxis.scale, lc.valueAxis.scale
+        xOffset = 0.5*lc.groupSpacing*cs(0)[1]/lc.groupSpacing
+        self.assertEqual(lc._positions,[[(cs(i)[0]+xOffset,vs(v)) for i,v in enumerate(row) if v is not None] for row in lc.data])
+
+    def test5(self):
+        from reportlab.graphics.charts.lineplots import AreaLinePlot
+        ap = AreaLinePlot()
+        ap.data = [(1,20,100,30),(2,11,50,15),(3,15,70,40)]
+        ap.draw()
+        xs, ys = ap.xValueAxis.scale, ap.yValueAxis.scale
+        self.assertEqual(ap._positions,[[(xs(p[0]),ys(sum(p[1:i+1]))) for p in ap.data] for i in xrange(1,4)])
+        self.failIf('_stacked' in ap.__dict__)
+
 def makeSuite():
-    return makeSuiteForClasses(ChartTestCase)
+    return makeSuiteForClasses(ChartTestCase,FormCacheTestCase,DecimationTestCase,ScaleValuesTestCase)
 
 
 #noruntests
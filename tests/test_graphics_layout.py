@@ -9,6 +9,7 @@ from reportlab.lib.testutils import setOutDir,makeSuiteForClasses, printLocation
 setOutDir(__name__)
 
 from reportlab.graphics import shapes
+from reportlab.lib import colors
 ##from reportlab.graphics.charts.barcharts import VerticalBarChart
 ##from reportlab.graphics.charts.linecharts import HorizontalLineChart
 ##from reportlab.graphics.charts.piecharts import Pie
@@ -72,8 +73,24 @@ class BoundsTestCase(unittest.TestCase):
         assert siz.getBounds()[0:2] <> (0,0)
 
 
+class RenderPDFPathTestCase(unittest.TestCase):
+    def testExtraPoints(self):
+        "points the operators don't use are ignored"
+        from reportlab.pdfgen.canvas import Canvas
+        from reportlab.graphics import renderPDF
+        from reportlab.lib.testutils import outputfile
+        p = shapes.Path([0,0,10,10,20,20],[shapes._MOVETO,shapes._LINETO],strokeColor=colors.black)
+        d = shapes.Drawing(50,50)
+        d.add(p)
+        c = Canvas(outputfile('test_graphics_layout_path.pdf'))
+        c.setPageCompression(0)
+        renderPDF.draw(d,c,0,0)
+        data = c.getpdfdata()
+        assert '0 0 m 10 10 l' in data
+        assert '20 20' not in data
+
 def makeSuite():
-    return makeSuiteForClasses(BoundsTestCase)
+    return makeSuiteForClasses(BoundsTestCase,RenderPDFPathTestCase)
 
 
 #noruntests
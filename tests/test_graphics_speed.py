@@ -60,6 +60,42 @@ class GraphicsSpeedTestCase(unittest.TestCase):
         "Same as test1(), but with shape checking turned on."
         self.test0(isFast)
 
+    def test2(self):
+        "Compare building charts with and without per thread shape checking."
+        from reportlab.lib.attrmap import setShapeChecking, getShapeChecking
+        from reportlab.graphics.charts.barcharts import VerticalBarChart
+        def build(num=200):
+            t0 = time.time()
+            for i in xrange(num):
+                d = Drawing(400, 200)
+                bc = VerticalBarChart()
+                bc.x = 50
+                bc.y = 50
+                bc.data = [range(12),range(12,0,-1)]
+                bc.bars[0].fillColor = colors.red
+                bc.categoryAxis.categoryNames = map(str,range(12))
+                d.add(bc)
+                d.getContents()
+                bc.draw()
+            return time.time() - t0
+        oShapeChecking = reportlab.rl_config.shapeChecking
+        reportlab.rl_config.shapeChecking = 1
+        try:
+            checked = build()
+            old = setShapeChecking(0)
+            try:
+                self.failIf(getShapeChecking())
+                r = Rect(0,0,10,10)
+                r.bogus = 1     #no validation so this is allowed
+                unchecked = build()
+            finally:
+                setShapeChecking(old)
+            self.assertRaises(AttributeError,setattr,r,'bogus',1)
+        finally:
+            reportlab.rl_config.shapeChecking = oShapeChecking
+        result = 'built 200 bar charts checked %0.4f unchecked %0.4f' % (checked, unchecked)
+        open(outputfile('test_graphics_speed_test2.log'), 'w').write(result)
+
     if False:
         def test2(self):
             "This is a profiled version of test1()."
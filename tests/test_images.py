@@ -5,7 +5,7 @@ __version__='''$Id$'''
 __doc__="""Tests to do with image handling.
 
 Most of them make use of test\pythonpowereed.gif."""
-from reportlab.lib.testutils import setOutDir,makeSuiteForClasses, printLocation
+from reportlab.lib.testutils import setOutDir,makeSuiteForClasses, printLocation, outputfile
 setOutDir(__name__)
 import os
 try:
@@ -42,8 +42,116 @@ class ReaderTestCase(unittest.TestCase):
         pixels = ir.getRGBData()
         assert md5(pixels).hexdigest() == '02e000bf3ffcefe9fc9660c95d7e27cf'
 
+def _xobjectWidths(c):
+    import re
+    return map(int,re.findall(r'/Width (\d+)',c.getpdfdata()))
+
+class DownsampleTestCase(unittest.TestCase):
+    "Test maxDPI resampling of images drawn small (needs PIL, see makeSuite)"
+
+    def test0(self):
+        from reportlab.pdfgen.canvas import Canvas
+        import PIL.Image
+        c = Canvas(outputfile('test_images_downsample.pdf'))
+        c.setPageCompression(0)
+        im = ImageReader(PIL.Image.new('RGB',(400,200),'red'))
+        self.assertEqual(c.drawImage(im,10,10,100,50,maxDPI=144),(400,200))
+        c.saveState()
+        c.scale(2,2)
+        c.drawImage(im,10,100,100,50,maxDPI=144)   #twice the size so twice the pixels
+        c.restoreState()
+        c.drawImage(im,10,300,maxDPI=300)           #already below maxDPI
+        self.assertEqual(sorted(_xobjectWidths(c)),[200,400])
+
+    def test1(self):
+        "drawInlineImage also returns the original size"
+        from reportlab.pdfgen.canvas import Canvas
+        import PIL.Image
+        c = Canvas(outputfile('test_images_downsample_inline.pdf'))
+        c.setPageCompression(0)
+        im = PIL.Image.new('RGB',(400,200),'red')
+        self.assertEqual(c.drawInlineImage(im,10,10,100,50,maxDPI=144),(400,200))
+        self.assertEqual(c.drawInlineImage(im,10,100,maxDPI=300),(400,200))
+        self.failUnless('BI /W 200 /H 100 ' in c.getpdfdata())
+
+    def test2(self):
+        "resampled images are kept in the bounded decodedImageCache"
+        from reportlab.pdfgen.canvas import Canvas
+        from reportlab.lib.utils import decodedImageCache
+        import PIL.Image
+        oMaxSize = decodedImageCache.maxSize
+        try:
+            decodedImageCache.clear()
+            decodedImageCache.maxSize = 2*200*100*3
+            c = Canvas(outputfile('test_images_downsample_cache.pdf'))
+            for colour in 'red','green','blue','red':
+                im = PIL.Image.new('RGB',(400,200),colour)  #in memory, so no file key
+                c.drawImage(ImageReader(im),10,10,100,50,maxDPI=144)
+            S = decodedImageCache.getStats()
+            self.assertEqual(S['entries'],2)
+            self.failUnless(S['size']<=decodedImageCache.maxSize)
+            self.assertEqual(S['evictions'],2)
+            c.drawImage(ImageReader(PIL.Image.new('RGB',(400,200),'red')),10,10,100,50,maxDPI=144)
+            self.assertEqual(decodedImageCache.getStats()['evictions'],2)   #red was reused
+        finally:
+            decodedImageCache.maxSize = oMaxSize
+            decodedImageCache.clear()
+
+class NoPILDownsampleTestCase(unittest.TestCase):
+    "Test maxDPI is ignored when PIL is missing (see makeSuite)"
+
+    def test0(self):
+        from reportlab.pdfgen.canvas import Canvas
+        from reportlab.graphics.shapes import Image, Drawing
+        fn = outputfile('test_images_downsample.png')
+        open(fn,'wb').write(samplePNG)
+        c = Canvas(outputfile('test_images_downsample.pdf'))
+        c.setPageCompression(0)
+        c.setImageDownsampling(1)
+        self.assertEqual(c.drawImage(fn,10,10,100,100),(5,5))
+        self.assertEqual(_xobjectWidths(c),[5])
+        d = Drawing(100,100)
+        d.add(Image(0,0,10,10,fn,maxDPI=1))
+        self.assertEqual(d.contents[0].maxDPI,1)
+
+class LazySizeTestCase(unittest.TestCase):
+    "Test image flowables get their size without opening the image"
+
+    def test0(self):
+        from reportlab.lib.testutils import testsFolder
+        from reportlab.platypus.flowables import Image
+        im = Image(os.path.join(testsFolder,'pythonpowered.gif'),lazy=2)
+        self.assertEqual(im.wrap(500,500),(110,44))
+        self.failIf('_img' in im.__dict__)
+
+    def test1(self):
+        from reportlab.platypus.flowables import Image
+        from reportlab.pdfgen.canvas import Canvas
+        fn = outputfile('test_images_lazy.png')
+        open(fn,'wb').write(samplePNG)
+        im = Image(fn,width=50,height=50)
+        self.assertEqual((im.imageWidth,im.imageHeight,im.wrap(500,500)),(5,5,(50,50)))
+        c = Canvas(outputfile('test_images_lazy.pdf'))
+        im.drawOn(c,10,10)
+        c.save()
+
+    def test2(self):
+        from reportlab.lib.utils import haveImages
+        if not haveImages: return
+        fn = outputfile('test_images_lazy.png')
+        open(fn,'wb').write(samplePNG)
+        ir = ImageReader(fn)
+        self.assertEqual(ir.getSize(),(5,5))
+        self.failIf('_image' in ir.__dict__)
+        self.assertEqual(ir.getRGBData(),sampleRAW)
+
 def makeSuite():
-    return makeSuiteForClasses(ReaderTestCase)
+    from reportlab.lib.utils import haveImages
+    if haveImages:
+        downsample = DownsampleTestCase
+    else:
+        downsample = NoPILDownsampleTestCase
+    return makeSuiteForClasses(ReaderTestCase,downsample,LazySizeTestCase)
 
 #noruntests
 if __name__ == "__main__":
@@ -61,6 +61,38 @@ class ColorTestCase(unittest.TestCase):
             assert colors.toColor(thing) == colors.red
 
 
+    def test2a(self):
+        "Test toColor and HexColor share their results and keep them unchanged."
+
+        import copy
+        c = colors.toColor('#123456')
+        assert colors.toColor('#123456') is c
+        assert colors.HexColor(0x123456) is colors.HexColor(0x123456)
+        assert colors.toColor((0.1, 0.2, 0.3, 0.4)) is colors.toColor((0.1, 0.2, 0.3, 0.4))
+        assert colors.isInterned(c) and colors.isInterned(colors.red)
+        self.assertRaises(AttributeError, setattr, c, 'red', 0)
+        self.assertRaises(AttributeError, setattr, colors.red, 'green', 1)
+        d = copy.copy(c)
+        d.red = 0
+        assert not colors.isInterned(d) and c.red != 0
+        assert colors.toColor([1, 0, 0]) is not colors.toColor([1, 0, 0])
+        assert colors.toColor('notAColor', colors.blue) is colors.blue
+        self.assertRaises(ValueError, colors.toColor, 'notAColor')
+
+    def test2b(self):
+        "Test colour operators are the same whether remembered or not."
+
+        from reportlab.pdfgen.textobject import _colorOp
+        canv = Canvas(outputfile('test_lib_colors_ops.pdf'))
+        for i in range(2):
+            canv._code = []
+            canv.setFillColor(colors.toColor('#336699'))
+            canv.setStrokeColor((0.2, 0.4, 0.6))
+            canv.setFillColor(colors.CMYKColor(0.1, 0.2, 0.3, 0.4, density=0.5))
+            canv.setStrokeColorRGB(1, 0.5, 0)
+            self.assertEquals(canv._code, ['.2 .4 .6 rg', '.2 .4 .6 RG', '.05 .1 .15 .2 k', '1 .5 0 RG'])
+        assert _colorOp((0.2, 0.4, 0.6), 'rg') is _colorOp((0.2, 0.4, 0.6), 'rg')
+
     def test3(self):
         "Test roundtrip RGB to CMYK conversion."
 
@@ -3,7 +3,7 @@
 """Tests for reportlab.lib.utils
 """
 __version__=''' $Id$ '''
-from reportlab.lib.testutils import setOutDir,makeSuiteForClasses, printLocation
+from reportlab.lib.testutils import setOutDir,makeSuiteForClasses, printLocation, outputfile
 setOutDir(__name__)
 import os
 import reportlab
@@ -119,8 +119,48 @@ class ImporterTestCase(unittest.TestCase):
         b = getStringIO(_rel_open_and_read('../docs/images/Edit_Prefs.gif'))
         b = open_and_read(b)
 
+class DecodedImageCacheTestCase(unittest.TestCase):
+    "Test the LRU cache of decoded image data"
+
+    def test0(self):
+        "entries are evicted least recently used first"
+        from reportlab.lib.utils import DecodedImageCache
+        c = DecodedImageCache(maxSize=10)
+        c.put('a','aaaa',4)
+        c.put('b','bbbb',4)
+        self.assertEqual(c.get('a'),'aaaa')
+        c.put('c','cccc',4)
+        self.assertEqual(c.get('b'),None)
+        self.assertEqual(c.get('a'),'aaaa')
+        self.assertEqual(c.get('c'),'cccc')
+        self.assertEqual(c.getStats(),dict(hits=3,misses=1,evictions=1,entries=2,size=8,maxSize=10))
+
+    def test1(self):
+        "oversized values and None keys are not cached"
+        from reportlab.lib.utils import DecodedImageCache
+        c = DecodedImageCache(maxSize=10)
+        self.assertEqual(c.put('a','x'*11,11),'x'*11)
+        self.assertEqual(c.put(None,'x',1),'x')
+        self.assertEqual(len(c),0)
+        c.put('a','aa',2)
+        c.put('a','aaa',3)
+        self.assertEqual(c.size,3)
+        c.clear()
+        self.assertEqual((len(c),c.size,c.hits),(0,0,0))
+
+    def test2(self):
+        "file keys change when the file does"
+        from reportlab.lib.utils import _imageFileKey
+        fn = outputfile('test_lib_utils_imagekey.dat')
+        open(fn,'wb').write('abc')
+        k = _imageFileKey(fn)
+        self.assertEqual(k,_imageFileKey(fn))
+        open(fn,'wb').write('abcd')
+        self.assertNotEqual(k,_imageFileKey(fn))
+        self.assertEqual(_imageFileKey(fn+'.missing'),None)
+
 def makeSuite():
-    return makeSuiteForClasses(ImporterTestCase)
+    return makeSuiteForClasses(ImporterTestCase,DecodedImageCacheTestCase)
 
 if __name__ == "__main__": #noruntests
     unittest.TextTestRunner().run(makeSuite())
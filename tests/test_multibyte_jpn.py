@@ -448,8 +448,109 @@ class JapaneseFontTests(unittest.TestCase):
             print 'saved '+outputfile('test_multibyte_jpn.pdf')
 
 
+_testBaseCMap = """%!PS-Adobe-3.0 Resource-CMap
+/CIDInit /ProcSet findresource begin
+2 begincodespacerange
+<00> <80>
+<8140> <9FFC>
+endcodespacerange
+1 beginnotdefrange
+<00> <1f> 1
+endnotdefrange
+3 begincidrange
+<20> <7e> 231
+<8140> <817e> 633
+<8180> <81ac> 696
+endcidrange
+1 begincidchar
+<8200> 5000
+endcidchar
+endcmap
+"""
+
+_testCMap = """%!PS-Adobe-3.0 Resource-CMap
+/CIDInit /ProcSet findresource begin
+/TestBase-H usecmap
+2 begincidrange
+<8150> <8152> 9000
+<8170> <8185> 9100
+endcidrange
+endcmap
+"""
+
+class CMapTests(unittest.TestCase):
+    "parsing of CMAP files into range tables"
+
+    def setUp(self):
+        import tempfile
+        from reportlab.pdfbase import cidfonts
+        self.dirname = tempfile.mkdtemp()
+        open(os.path.join(self.dirname,'TestBase-H'),'w').write(_testBaseCMap)
+        open(os.path.join(self.dirname,'Test-H'),'w').write(_testCMap)
+        self._searchPath = cidfonts.CMapSearchPath
+        cidfonts.CMapSearchPath = (self.dirname,)
+
+    def tearDown(self):
+        import shutil
+        from reportlab.pdfbase import cidfonts
+        cidfonts.CMapSearchPath = self._searchPath
+        shutil.rmtree(self.dirname)
+
+    def _expected(self):
+        "the mapping as a dictionary, expanded in file order"
+        cmap = {}
+        for start, end, value in ((0x20,0x7e,231),(0x8140,0x817e,633),(0x8180,0x81ac,696),
+                (0x8200,0x8200,5000),(0x8150,0x8152,9000),(0x8170,0x8185,9100)):
+            for code in range(start, end+1):
+                cmap[code] = value + code - start
+        return cmap
+
+    def testParse(self):
+        from reportlab.pdfbase.cidfonts import CIDEncoding
+        enc = CIDEncoding('Test-H', useCache=0)
+        enc.parseCMAPFile('Test-H')
+        expected = self._expected()
+        self.assertEquals(dict(enc.items()), expected)
+        self.assertEquals(len(enc.items()), len(expected))
+        for code in range(0x8130, 0x8210):
+            self.assertEquals(enc.lookup(code), expected.get(code))
+        self.assertEquals(enc._codeSpaceRanges, [(0,0x80),(0x8140,0x9ffc)])
+        self.assertEquals(enc.translate('A\x05\x81\x51\x81\x80\x81\xd0'), [264, 1, 9001, 9116, 0])
+
+    def testFastMap(self):
+        from reportlab.pdfbase.cidfonts import CIDEncoding
+        enc = CIDEncoding('Test-H', useCache=0)
+        enc.parseCMAPFile('Test-H')
+        enc.fastSave(self.dirname)
+        enc2 = CIDEncoding('Test-H', useCache=0)
+        enc2.fastLoad(self.dirname)
+        self.assertEquals(enc2.getData(), enc.getData())
+        text = '\x81\x40\x81\x71 abc\x81\xac'
+        self.assertEquals(enc2.translate(text), enc.translate(text))
+
+    def testMetricStore(self):
+        from reportlab import rl_config
+        from reportlab.pdfbase import cidfonts
+        from reportlab.pdfbase.metricstore import compileMetricStore
+        enc = cidfonts.CIDEncoding('Test-H', useCache=0)
+        enc.parseCMAPFile('Test-H')
+        storeName = os.path.join(self.dirname,'cmaps.rlms')
+        compileMetricStore(storeName,cidFaces=[],cmaps=['Test-H'])
+        fontMetricStore, disableCMap = rl_config.fontMetricStore, cidfonts.DISABLE_CMAP
+        try:
+            rl_config.fontMetricStore = storeName
+            cidfonts.DISABLE_CMAP = False
+            enc2 = cidfonts.CIDEncoding('Test-H')
+        finally:
+            rl_config.fontMetricStore, cidfonts.DISABLE_CMAP = fontMetricStore, disableCMap
+        self.assertEquals(enc2.source, storeName)
+        self.assertEquals(enc2.getData(), enc.getData())
+        self.assertEquals(enc2.items(), enc.items())
+        text = '\x81\x40\x81\x71 abc\x81\xac\x05'
+        self.assertEquals(enc2.translate(text), enc.translate(text))
+
 def makeSuite():
-    return makeSuiteForClasses(JapaneseFontTests)
+    return makeSuiteForClasses(JapaneseFontTests,CMapTests)
 
 
 #noruntests
@@ -38,8 +38,173 @@ class PdfEncodingTestCase(unittest.TestCase):
             plain = plain + chr(i)
 
 
+def _makePNG(w, h, colorType, raw, filters=(0,), PLTE=None, tRNS=None):
+    "return a PNG file, filtering row y of raw with filters[y%len(filters)]"
+    import struct, zlib
+    bpp = {0:1, 2:3, 3:1, 4:2, 6:4}[colorType]
+    stride = w*bpp
+    rows = []
+    prev = [0]*stride
+    for y in xrange(h):
+        row = map(ord,raw[y*stride:(y+1)*stride])
+        ft = filters[y%len(filters)]
+        out = []
+        for i in xrange(stride):
+            a = i>=bpp and row[i-bpp] or 0
+            b = prev[i]
+            c = i>=bpp and prev[i-bpp] or 0
+            if ft==1: p = a
+            elif ft==2: p = b
+            elif ft==3: p = (a+b)>>1
+            elif ft==4:
+                q = a+b-c
+                pa, pb, pc = abs(q-a), abs(q-b), abs(q-c)
+                if pa<=pb and pa<=pc: p = a
+                elif pb<=pc: p = b
+                else: p = c
+            else: p = 0
+            out.append(chr((row[i]-p)&255))
+        rows.append(chr(ft)+''.join(out))
+        prev = row
+    def chunk(kind,data):
+        return struct.pack('>I',len(data))+kind+data+struct.pack('>i',zlib.crc32(kind+data))
+    C = [chunk('IHDR',struct.pack('>IIBBBBB',w,h,8,colorType,0,0,0))]
+    if PLTE: C.append(chunk('PLTE',PLTE))
+    if tRNS: C.append(chunk('tRNS',tRNS))
+    C.append(chunk('IDAT',zlib.compress(''.join(rows))))
+    C.append(chunk('IEND',''))
+    return '\x89PNG\r\n\x1a\n'+''.join(C)
+
+class PNGTestCase(unittest.TestCase):
+    "Test reading PNG files for passthrough into PDF."
+
+    def testUnfilter(self):
+        from StringIO import StringIO
+        from reportlab.pdfbase.pdfutils import readPNGInfo, _pngUnfilter, splitPNGAlpha
+        import zlib
+        w, h = 7, 10
+        raw = ''.join([chr((x*37+y*11+c*101)&255) for y in xrange(h) for x in xrange(w) for c in xrange(4)])
+        info = readPNGInfo(StringIO(_makePNG(w,h,6,raw,filters=(0,1,2,3,4))))
+        self.assertEqual((info['width'],info['height'],info['bitDepth'],info['colorType'],info['interlace']),(w,h,8,6,0))
+        self.assertEqual(_pngUnfilter(zlib.decompress(info['IDAT']),w,h,4),raw)
+        color, alpha = splitPNGAlpha(info)
+        self.assertEqual(alpha,raw[3::4])
+        self.assertEqual(color,''.join([raw[i:i+3] for i in xrange(0,len(raw),4)]))
+        opaque = ''.join([raw[i:i+3]+'\xff' for i in xrange(0,len(raw),4)])
+        self.assertEqual(splitPNGAlpha(readPNGInfo(StringIO(_makePNG(w,h,6,opaque,filters=(4,3))))),(color,None))
+
+    def testPassthrough(self):
+        from reportlab.pdfgen.canvas import Canvas
+        from reportlab.lib.testutils import outputfile
+        w, h = 5, 4
+        rgb = ''.join([chr(x*50)+chr(y*60)+'\x80' for y in xrange(h) for x in xrange(w)])
+        rgba = ''.join([rgb[i:i+3]+chr(i) for i in xrange(0,len(rgb),3)])
+        specs = [
+            ('rgb',_makePNG(w,h,2,rgb,filters=(1,4)),'/Predictor 15'),
+            ('key',_makePNG(w,h,2,rgb,tRNS='\x00\x00\x00\x3c\x00\x80'),'/Mask [ 0 0 60 60 128 128 ]'),
+            ('pal',_makePNG(w,h,3,'\x00\x01\x02\x01'*5,PLTE='\xff\x00\x00\x00\xff\x00\x00\x00\xff',tRNS='\xff\x00'),'/Mask [ 1 1 ]'),
+            ]
+        from reportlab.lib.utils import haveImages
+        if not haveImages: specs.append(('rgba',_makePNG(w,h,6,rgba,filters=(2,)),'/SMask'))
+        for name, data, expected in specs:
+            fn = outputfile('test_pdfbase_pdfutils_%s.png' % name)
+            open(fn,'wb').write(data)
+            c = Canvas(outputfile('test_pdfbase_pdfutils_%s.pdf' % name))
+            c.setPageCompression(0)
+            c.drawImage(fn,10,10,mask='auto')
+            pdf = ' '.join(c.getpdfdata().split())
+            self.assert_(expected in pdf,'%s: %s not in output' % (name,expected))
+            self.assertEqual(pdf.count('/Predictor 15'),name!='rgba')
+
+class ImageInfoTestCase(unittest.TestCase):
+    "Test reading image sizes from file headers."
+
+    def test0(self):
+        import struct
+        from StringIO import StringIO
+        from reportlab.pdfbase.pdfutils import readImageInfo
+        from reportlab.pdfbase.pdfdoc import PDFError
+        def tiff(e,typ):
+            head = (e=='<' and 'II*\000' or 'MM\000*')+struct.pack(e+'I',8)
+            ifd = struct.pack(e+'H',3)
+            for tag,v in (254,0),(256,321),(257,123):
+                ifd += struct.pack(e+'HHI',tag,typ,1)+(typ==3 and struct.pack(e+'HH',v,0) or struct.pack(e+'I',v))
+            return head+ifd+struct.pack(e+'I',0)
+        for data, expected in (
+                (_makePNG(7,3,0,'\x00'*21),('PNG',7,3)),
+                ('GIF89a'+struct.pack('<HH',321,123)+'\0'*20,('GIF',321,123)),
+                ('BM'+'\0'*12+struct.pack('<Iii',40,321,-123)+'\0'*40,('BMP',321,123)),
+                ('BM'+'\0'*12+struct.pack('<IHH',12,321,123)+'\0'*40,('BMP',321,123)),
+                (tiff('<',3),('TIFF',321,123)),
+                (tiff('>',4),('TIFF',321,123)),
+                ('\xff\xd8\xff\xc0\x00\x11\x08'+struct.pack('>HH',123,321)+'\x03'+'\0'*20,('JPEG',321,123)),
+                ):
+            self.assertEqual(readImageInfo(StringIO(data)),expected)
+        self.assertRaises(PDFError,readImageInfo,StringIO('not an image at all, no'))
+
+class ImageXObjectCacheTestCase(unittest.TestCase):
+    "Test the persistent cache of encoded images."
+
+    def setUp(self):
+        import tempfile
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.dir,True)
+
+    def testCache(self):
+        from reportlab.pdfbase.pdfutils import ImageXObjectCache
+        cache = ImageXObjectCache(self.dir,maxSize=3000)
+        k = cache.makeKey('abc')
+        self.assertEqual(cache.get(k),None)
+        self.assertNotEqual(k,cache.makeKey('abc',mask='auto'))
+        self.assertNotEqual(k,cache.makeKey('abc',kind='inline'))
+        v = dict(width=1,streamContent='x'*1000,mask=(1,1))
+        cache.put(k,v)
+        self.assertEqual(cache.get(k),v)
+        self.assert_(cache.has_key(k))
+        for i in xrange(5):
+            cache.put(cache.makeKey(str(i)),v)
+        E = cache.entries()
+        self.assert_(len(E)<=3 and sum([e[1] for e in E])<=3000,E)
+        self.assert_(cache.has_key(cache.makeKey('4')))
+        self.assertEqual(len(os.listdir(self.dir)),len(E))
+        open(os.path.join(self.dir,cache.makeKey('4')+cache._suffix),'wb').write('junk')
+        self.assertEqual(cache.get(cache.makeKey('4')),None)
+        cache.clear()
+        self.assertEqual(cache.entries(),[])
+
+    def testDocuments(self):
+        from reportlab import rl_config
+        from reportlab.pdfbase.pdfutils import imageXObjectCache
+        from reportlab.pdfgen.canvas import Canvas
+        from reportlab.lib.testutils import outputfile
+        w, h = 5, 4
+        rgba = ''.join([chr(x*50)+chr(y*60)+'\x80'+chr(x*y*10) for y in xrange(h) for x in xrange(w)])
+        specs = [('rgb',_makePNG(w,h,2,''.join([rgba[i:i+3] for i in xrange(0,len(rgba),4)]),filters=(1,)))]
+        from reportlab.lib.utils import haveImages
+        if not haveImages: specs.append(('rgba',_makePNG(w,h,6,rgba)))
+        saved = rl_config.imageXObjectCacheDir
+        rl_config.imageXObjectCacheDir = self.dir
+        try:
+            for name, data in specs:
+                fn = outputfile('test_pdfbase_pdfutils_cache_%s.png' % name)
+                open(fn,'wb').write(data)
+                P = []
+                for i in 0, 1:
+                    hits = imageXObjectCache.hits
+                    c = Canvas(outputfile('test_pdfbase_pdfutils_cache_%s.pdf' % name),invariant=1)
+                    c.drawImage(fn,10,10,mask='auto')
+                    P.append(c.getpdfdata())
+                    self.assertEqual(imageXObjectCache.hits-hits,i)
+                self.assertEqual(P[0],P[1])
+                self.assertEqual('/SMask' in P[1],name=='rgba')
+        finally:
+            rl_config.imageXObjectCacheDir = saved
+
 def makeSuite():
-    return makeSuiteForClasses(PdfEncodingTestCase)
+    return makeSuiteForClasses(PdfEncodingTestCase,PNGTestCase,ImageInfoTestCase,ImageXObjectCacheTestCase)
 
 
 #noruntests
@@ -6,8 +6,9 @@ Serif Regular and is covered under the license in ../fonts/bitstream-vera-licens
 """
 from reportlab.lib.testutils import setOutDir,makeSuiteForClasses, outputfile, printLocation, NearTestCase
 setOutDir(__name__)
-import string
+import string, os
 from cStringIO import StringIO
+from struct import unpack
 import unittest
 from reportlab.pdfgen.canvas import Canvas
 from reportlab.pdfbase import pdfmetrics
@@ -346,6 +347,64 @@ class TTFontTestCase(NearTestCase):
         fontDescriptor = doc.idToObject[pdfFont.FontDescriptor.name]
         self.assertEquals(fontDescriptor.dict['Type'], '/FontDescriptor')
 
+    def testIdentityHSplitString(self):
+        "Tests TTFont.splitString with identityH"
+        doc = PDFDocument()
+        font = TTFont("Vera", "Vera.ttf", identityH=1)
+        self.assertEquals(font.splitString(u'abca', doc), [(0, '\0\1\0\2\0\3\0\1')])
+        # characters without a glyph use .notdef
+        self.assertEquals(font.splitString(u'b\u4e00', doc), [(0, '\0\2\0\0')])
+        state = font.state[doc]
+        charToGlyph = font.face.charToGlyph
+        self.assertEquals(state.subsets[0], [0, 97, 98, 99])
+        self.assertEquals(state.glyphs, [0]+[charToGlyph[c] for c in (97, 98, 99)])
+        font.addObjects(doc)
+        self.assertRaises(KeyError, lambda: font.state[doc])
+
+    def testIdentityHAddObjects(self):
+        "Test TTFont.addObjects with identityH"
+        doc = PDFDocument()
+        font = TTFont("Vera", "Vera.ttf", identityH=1)
+        text = string.join(map(utf8, xrange(32, 600)), "")
+        codes = font.splitString(text, doc)[0][1]
+        nCodes = max(unpack('>%dH' % (len(codes)/2), codes))
+        internalName = font.getSubsetInternalName(0, doc)[1:]
+        font.addObjects(doc)
+        pdfFont = doc.idToObject[internalName]
+        self.assertEquals(doc.idToObject['BasicFonts'].dict[internalName].name, internalName)
+        self.assertEquals(pdfFont.dict['Subtype'], '/Type0')
+        self.assertEquals(pdfFont.dict['Encoding'], '/Identity-H')
+        cidFont = doc.idToObject[pdfFont.dict['DescendantFonts'].sequence[0].name]
+        self.assertEquals(cidFont.dict['Subtype'], '/CIDFontType2')
+        self.assertEquals(cidFont.dict['CIDToGIDMap'], '/Identity')
+        W = cidFont.dict['W'].sequence
+        self.assertEquals(W[0], 1)
+        self.assertEquals(len(W[1].sequence), nCodes)
+        toUnicode = doc.idToObject[pdfFont.dict['ToUnicode'].name].content
+        self.assertEquals(toUnicode.count('> <'), 1+nCodes)
+        self.assertEquals(toUnicode.count('beginbfchar'), (nCodes+99)/100)
+        fontDescriptor = doc.idToObject[cidFont.dict['FontDescriptor'].name]
+        fontFile = doc.idToObject[fontDescriptor.dict['FontFile2'].name]
+        # one font program, its glyphs numbered by code
+        subset = TTFontFile(StringIO(fontFile.content), charInfo=0)
+        numGlyphs = unpack('>H', subset.get_table('maxp')[4:6])[0]
+        self.assert_(numGlyphs >= nCodes+1, numGlyphs)
+
+    def testIdentityHWordSpace(self):
+        "word spacing is done explicitly for two byte codes"
+        pdfmetrics.registerFont(TTFont("VeraIdentityH", "Vera.ttf", identityH=1))
+        c = Canvas(outputfile('test_pdfbase_ttfonts_identityh.pdf'))
+        t = c.beginText(100, 700)
+        t.setFont("VeraIdentityH", 10)
+        t.textOut(u'a b')
+        t.setWordSpace(2)
+        t.textOut(u'a b')
+        code = t.getCode()
+        self.assert_("(\\000\\001\\000\\002\\000\\003) Tj" in code, code)
+        self.assert_("[(\\000\\001\\000\\002) -200 (\\000\\003)] TJ" in code, code)
+        c.drawText(t)
+        c.save()
+
     def testMakeToUnicodeCMap(self):
         "Test makeToUnicodeCMap"
         self.assertEquals(makeToUnicodeCMap("TestFont", [ 0x1234, 0x4321, 0x4242 ]),
@@ -371,14 +430,78 @@ endcmap
 CMapName currentdict /CMap defineresource pop
 end
 end""")
-
+        cmap = makeToUnicodeCMap("TestFont", [0]+range(0x4e00,0x4e00+150), twoByte=1)
+        self.assert_("<0000> <FFFF>" in cmap)
+        self.assert_("100 beginbfchar\n<0001> <4E00>\n" in cmap)
+        self.assert_("<0096> <4E95>\nendbfchar" in cmap)
+        self.assert_("50 beginbfchar" in cmap)
+
+
+class MetricStoreTestCase(unittest.TestCase):
+    "Font metric tables shared through a mapped file"
+
+    def setUp(self):
+        import tempfile, shutil
+        from reportlab import rl_config
+        self.dirname = tempfile.mkdtemp()
+        self.ttfName = os.path.join(self.dirname,'Vera.ttf')
+        shutil.copyfile(TTFOpenFile('Vera.ttf')[0],self.ttfName)
+        self.storeName = os.path.join(self.dirname,'fonts.rlms')
+        self._fontMetricStore = rl_config.fontMetricStore
+
+    def tearDown(self):
+        import shutil
+        from reportlab import rl_config
+        rl_config.fontMetricStore = self._fontMetricStore
+        shutil.rmtree(self.dirname)
+
+    def testStore(self):
+        from reportlab.pdfbase.metricstore import compileMetricStore, MetricStore
+        from reportlab.pdfbase.cidfonts import CIDTypeFace
+        compileMetricStore(self.storeName,ttfFiles=[self.ttfName],cidFaces=['HeiseiMin-W3'])
+        store = MetricStore(self.storeName)
+        ttf = TTFontFile(self.ttfName)
+        charToGlyph, charWidths = store.getTTFCharInfo(self.ttfName)
+        self.assertEquals(charWidths.items(), sorted(ttf.charWidths.items()))
+        self.assertEquals(dict(charToGlyph.items()), ttf.charToGlyph)
+        self.assertEquals(charWidths.get(ord('A')), ttf.charWidths[ord('A')])
+        self.assertEquals(charWidths.get(0x4e00,-1),-1)
+        self.assertRaises(KeyError,lambda:charWidths[0x4e00])
+        self.assertEquals(charWidths.getValues([ord('A'),0x4e00,ord('A')],-1),[ttf.charWidths[ord('A')],-1,ttf.charWidths[ord('A')]])
+        assert charToGlyph.has_key(ord('A')) and 0x4e00 not in charToGlyph
+        widths = store.getCIDWidths('HeiseiMin-W3')
+        self.assertEquals(dict(widths.items()),CIDTypeFace('HeiseiMin-W3')._explicitWidths)
+        assert store.getCIDWidths('HeiseiKakuGo-W5') is None
+        assert store.getTTFCharInfo(TTFOpenFile('Vera.ttf')[0]) is None
+
+        #a changed file is not used
+        st = os.stat(self.ttfName)
+        os.utime(self.ttfName,(st.st_atime,st.st_mtime-10))
+        assert store.getTTFCharInfo(self.ttfName) is None
+
+    def testFontsUseStore(self):
+        from reportlab import rl_config
+        from reportlab.pdfbase.metricstore import compileMetricStore
+        text = u'Hello W\xf6rld \u2022 \u4e00'
+        plain = TTFont('VeraStore',self.ttfName)
+        compileMetricStore(self.storeName,ttfFiles=[self.ttfName],cidFaces=[])
+        rl_config.fontMetricStore = self.storeName
+        font = TTFont('VeraStore',self.ttfName)
+        assert type(font.face.charWidths) is not type({})
+        self.assertEquals(font.stringWidth(text,10),plain.stringWidth(text,10))
+        pdfmetrics.registerFont(font)
+        c = Canvas(outputfile('test_pdfbase_ttfonts_metricstore.pdf'))
+        c.setFont('VeraStore',10)
+        c.drawString(100,700,text)
+        c.save()
 
 def makeSuite():
     suite = makeSuiteForClasses(
         TTFontsTestCase,
         TTFontFileTestCase,
         TTFontFaceTestCase,
-        TTFontTestCase)
+        TTFontTestCase,
+        MetricStoreTestCase)
     return suite
 
 
@@ -6,7 +6,7 @@ __version__=''' $Id$ '''
 #tests and documents new low-level canvas
 from reportlab.lib.testutils import setOutDir,makeSuiteForClasses, outputfile, printLocation
 setOutDir(__name__)
-import os, string
+import os, string, re
 import unittest
 from reportlab.pdfgen import canvas   # gmcm 2000/10/13, pdfgen now a package
 from reportlab.lib.units import inch, cm
@@ -929,7 +929,92 @@ class PdfgenTestCase(unittest.TestCase):
             c.showPage()
 
         # Output the PDF
-        c.save()    
+        c.save()
+
+    def test2(self):
+        "identical forms are written once with dedupStreams"
+        def makeDoc(dedupStreams):
+            c=canvas.Canvas(outputfile('test_pdfgen_dedup.pdf'),dedupStreams=dedupStreams)
+            for name in ('inner1','inner2'):
+                c.beginForm(name)
+                c.rect(inch,inch,2*inch,inch,fill=1)
+                c.endForm()
+            for outer, inner in (('outer1','inner1'),('outer2','inner2')):
+                c.beginForm(outer)
+                c.doForm(inner)
+                c.endForm()
+            c.doForm('outer1')
+            c.translate(0,3*inch)
+            c.doForm('outer2')
+            c.showPage()
+            c.save()
+            return c.getpdfdata()
+        self.assertEqual(makeDoc(0).count('/Subtype /Form'),4)
+        data = makeDoc(1)
+        #the outer forms differ in the resource names they use
+        self.assertEqual(data.count('/Subtype /Form'),3)
+        self.assertEqual(len(re.findall(r'obj\s+null\s+endobj',data)),1)
+
+    def test3(self):
+        "operators which change nothing are left out, across saveState/restoreState too"
+        c=canvas.Canvas(outputfile('test_pdfgen_redundant.pdf'))
+        c._code = []
+        c.setLineWidth(1)       #the page default
+        c.setFillColor(colors.red)
+        c.setFont('Helvetica', 10)
+        c.saveState()
+        c.setFillColor(colors.red)
+        c.setFont('Helvetica', 10)
+        c.setFillColor(colors.blue)
+        c.setLineWidth(2)
+        c.setDash([2,1])
+        c.restoreState()
+        c.setFillColor(colors.red)
+        c.setLineWidth(2)
+        c.setLineWidth(2)
+        c.setDash([2,1])
+        self.assertEqual(c._code, ['1 0 0 rg', 'BT /F1 10 Tf 12 TL ET', 'q', '0 0 1 rg', '2 w', '[2 1] 0 d', 'Q', '2 w', '[2 1] 0 d'])
+
+        #forms don't know the state they'll be drawn in
+        c.beginForm('form')
+        c.setFillColor(colors.red)
+        c.setLineWidth(1)
+        self.assertEqual(c._code, ['1 0 0 rg', '1 w'])
+        c.endForm()
+        c.addLiteral('0 0 1 rg')
+        c._code = []
+        c.setFillColor(colors.red)
+        self.assertEqual(c._code, ['1 0 0 rg'])
+
+    def test4(self):
+        "text objects start from the canvas state and leave it with theirs"
+        c=canvas.Canvas(outputfile('test_pdfgen_redundant.pdf'))
+        c.setFont('Helvetica', 10)
+        c.setFillColor(colors.red)
+        c._code = []
+        t = c.beginText(0,0)
+        t.setFont('Helvetica', 10)
+        t.setFillColor(colors.red)
+        t.textOut('a')
+        t.setFillColor(colors.green)
+        c.drawText(t)
+        self.assertEqual(c._code, ['BT 1 0 0 1 0 0 Tm (a) Tj 0 .501961 0 rg ET'])
+        c.setFillColor(colors.green)
+        c.drawString(0, 0, 'b')
+        self.assertEqual(len(c._code), 2)
+
+        #what a text object left out is put back if the canvas changed meanwhile
+        c._code = []
+        t = c.beginText(0,0)
+        t.setFillColor(colors.green)
+        t.textOut('c')
+        c.setFillColor(colors.blue)
+        c.setFont('Times-Roman', 12)
+        c.drawText(t)
+        self.assertEqual(c._code[-1], 'BT 0 .501961 0 rg 1 0 0 1 0 0 Tm (c) Tj ET')
+        c.setFillColor(colors.green)
+        c.setFont('Times-Roman', 12)
+        self.assertEqual(len(c._code), 3)
 
 def makeSuite():
     return makeSuiteForClasses(PdfgenTestCase)
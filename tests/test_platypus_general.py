@@ -582,6 +582,35 @@ class PlatypusTestCase(unittest.TestCase):
         doc = SimpleDocTemplate(outputfile('test_drawing_keepwithnext.pdf'))
         doc.build(story)
 
+    def test2(self):
+        "shared page decorations"
+        from reportlab.platypus.frames import Frame
+        def letterhead(canv,doc):
+            canv.saveState()
+            canv.setFont('Helvetica-Bold',18)
+            canv.drawString(inch,defaultPageSize[1]-inch,'ReportLab Letterhead')
+            canv.line(inch,defaultPageSize[1]-1.1*inch,defaultPageSize[0]-inch,defaultPageSize[1]-1.1*inch)
+            canv.restoreState()
+        def pageNumber(canv,doc):
+            canv.saveState()
+            canv.drawString(inch,0.5*inch,'Page %d' % doc.page)
+            canv.restoreState()
+        frame = Frame(inch,inch,defaultPageSize[0]-2*inch,defaultPageSize[1]-2.5*inch)
+        pt = PageTemplate('decorated',[frame],onPage=letterhead,onPageEnd=pageNumber,cacheDecorations=1)
+        doc = BaseDocTemplate(outputfile('test_platypus_decorations.pdf'),pageTemplates=[pt])
+        style = getSampleStyleSheet()['Normal']
+        doc.build([Paragraph('Paragraph %d' % i,style) for i in xrange(200)])
+        canv = doc.canv
+        forms = [n for n in canv._doc.idToObject.keys() if n.startswith('FormXob.PTDecoration')]
+        self.assertEqual(len(forms),1)
+        pages = canv._doc.Pages.pages
+        self.assert_(len(pages)>2)
+        for i,page in enumerate(pages):
+            strm = page.stream
+            self.assertEqual('ReportLab Letterhead' in strm, i==0)
+            self.assert_('Page %d' % (i+1) in strm)
+            if i: self.assert_('/%s Do' % forms[0] in strm)
+
 def makeSuite():
     return makeSuiteForClasses(PlatypusTestCase)
 
@@ -7,6 +7,7 @@ from xml.sax._exceptions import SAXReaderNotAvailable
 import unittest
 from reportlab.graphics.shapes import *
 from reportlab.graphics import renderSVG
+from reportlab.lib import colors
 
 def warnIgnoredRestofTest():
     "Raise a warning (if possible) about a not fully completed test."
@@ -130,8 +131,126 @@ class RenderSvgAxesTestCase(unittest.TestCase):
         d = XCategoryAxis().demo()
         renderSVG.drawToFile(d, path)
 
+class RenderSvgBatchTestCase(unittest.TestCase):
+    "Testing columnar batch shapes."
+
+    def _drawing(self):
+        d = Drawing(400, 200)
+        d.add(RectBatch(range(0,400,4), [10]*100, 3, range(100),
+                        fillColor=colors.red, strokeColor=None))
+        d.add(CircleBatch([50,150,250], [150,150,150], [5,10,15],
+                          fillColor=None, strokeColor=colors.blue))
+        return d
+
+    def test0(self):
+        "Test batch bounds and copies."
+
+        d = self._drawing()
+        rb, cb = d.contents
+        assert rb.getBounds() == (0, 10, 399, 109), rb.getBounds()
+        assert cb.getBounds() == (45, 135, 265, 165), cb.getBounds()
+        assert len(list(rb.getRects())) == 100
+        assert list(cb.getCircles())[1] == (150, 150, 10)
+        c = rb.copy()
+        assert list(c.getRects()) == list(rb.getRects())
+        assert c.fillColor == colors.red and c.strokeColor is None
+        assert RectBatch([], [], 1, 1).getBounds() is None
+
+    def test1(self):
+        "Test batch shapes render to SVG and PDF."
+
+        from reportlab.graphics import renderPDF
+        d = self._drawing()
+        path = outputfile("test_renderSVG_batch_test1.svg")
+        renderSVG.drawToFile(d, path)
+        renderPDF.drawToFile(d, outputfile("test_renderSVG_batch_test1.pdf"))
+
+        if not HAVE_XML_PARSER:
+            warnIgnoredRestofTest()
+            return
+
+        svg = load(path)
+        assert len(svg.getElementsByTagName('rect')) >= 100
+        assert len(svg.getElementsByTagName('circle')) == 3
+
+class RenderSvgStateTestCase(unittest.TestCase):
+    "Testing the renderer state tracking."
+
+    def test0(self):
+        "Test the tracker reports only real changes."
+
+        from reportlab.graphics.renderbase import StateTracker
+        st = StateTracker()
+        red = colors.Color(1,0,0)
+        assert st.push({'strokeColor':colors.black, 'strokeWidth':1}) == {}
+        assert st.push({'strokeColor':red, 'strokeWidth':1}) == {'strokeColor':red}
+        assert st.push({'transform':(1,0,0,1,0,0)}) == {}
+        assert st.push({'transform':(2,0,0,2,0,0)}) == {'transform':(2,0,0,2,0,0)}
+        assert st.getCTM() == (2,0,0,2,0,0)
+        assert st.pop() == {'transform':(0.5,0,0,0.5,0,0)}
+        assert st.pop() == {}
+        assert st.pop() == {'strokeColor':colors.black}
+        assert st.pop() == {}
+        assert st['strokeColor'] is colors.black
+        #Color comparison is a partial ordering so check distinct colours stay distinct
+        st.push({'fillColor':colors.Color(0.5,0,0)})
+        assert st.push({'fillColor':colors.Color(0,1,0)})
+
+    def test1(self):
+        "Test siblings get the group style back after a changed child."
+
+        d = Drawing(100, 100)
+        d.add(Group(Rect(0,0,10,10,strokeColor=colors.red,strokeWidth=3,strokeDashArray=[2,2]),
+                    Rect(20,0,10,10)))
+        s = renderSVG.drawToString(d)
+        rects = s.split('<rect')[1:]
+        assert 'stroke-width: 3' in rects[1] and 'stroke-dasharray' in rects[1]
+        assert 'stroke-width: 1' in rects[2] and 'stroke-dasharray' not in rects[2]
+        assert 'rgb(0%,0%,0%)' in rects[2]
+
+class RenderSvgStreamTestCase(unittest.TestCase):
+    "Testing the streaming SVG writer."
+
+    def test0(self):
+        "Test compact output has the same elements and escapes text."
+
+        d = Drawing(200, 100)
+        g = Group(String(10, 10, "a<b & c"), Circle(50, 50, 5))
+        g.translate(10, 20)
+        d.add(g)
+        pretty = renderSVG.drawToString(d)
+        compact = renderSVG.drawToString(d, compact=1)
+        assert len(compact) < len(pretty)
+        assert '\n    <' in pretty and '\n    <' not in compact
+
+        if not HAVE_XML_PARSER:
+            warnIgnoredRestofTest()
+            return
+
+        for text in pretty, compact:
+            svg = minidom.parseString(text).documentElement
+            assert len(svg.getElementsByTagName('circle')) == 1
+            g = svg.getElementsByTagName('g')[2]
+            assert string.find(g.getAttribute('transform'), 'matrix') == 0
+            t = svg.getElementsByTagName('text')[0]
+            assert t.childNodes[0].nodeValue == 'a<b & c'
+
+    def test1(self):
+        "Test writing to a file object while drawing."
+
+        from reportlab.lib.utils import getStringIO
+        d = Drawing(200, 100)
+        d.add(Rect(10, 10, 20, 20))
+        f = getStringIO()
+        c = renderSVG.SVGCanvas((d.width, d.height), out=f)
+        renderSVG.draw(d, c, 0, 0)
+        assert string.find(f.getvalue(), '<rect') > 0
+        assert string.find(f.getvalue(), '</svg>') < 0
+        c.save()
+        assert string.strip(f.getvalue())[-6:] == '</svg>'
+
 def makeSuite():
-    return makeSuiteForClasses(RenderSvgSimpleTestCase, RenderSvgAxesTestCase)
+    return makeSuiteForClasses(RenderSvgSimpleTestCase, RenderSvgAxesTestCase, RenderSvgBatchTestCase, RenderSvgStateTestCase, RenderSvgStreamTestCase)
 
 #noruntests
 if __name__ == "__main__":
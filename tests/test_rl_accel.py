@@ -44,6 +44,28 @@ class RlAccelTestCase(unittest.TestCase):
         assert fp_str(59.5275574) == '59.52756'
         assert fp_str(5.95275574) == '5.952756'
 
+    def testArciv(self):
+        from _rl_accel import arciv
+        from reportlab.lib.arciv import ArcIV, _TESTS
+        for t in _TESTS:
+            assert arciv(t['key'],t['input'])==t['output']
+        import random
+        r = random.Random(0)
+        key = ''.join([chr(r.randint(0,255)) for i in xrange(16)])
+        data = ''.join([chr(r.randint(0,255)) for i in xrange(5000)])
+        assert arciv(key,data)==ArcIV(key).encode(data)
+        assert arciv(key,'')==''
+        self.assertRaises(ValueError,arciv,'',data)
+
+    def testFpPath(self):
+        from _rl_accel import fp_path
+        from array import array
+        assert fp_path([1,2,3.5,4])=='1 2 m 3.5 4 l'
+        assert fp_path(array('d',[1,2,3.5,4]))=='1 2 m 3.5 4 l'
+        assert fp_path((0,0,1,1,2,2,3,3),'mch')=='0 0 m 1 1 2 2 3 3 c h'
+        self.assertRaises(ValueError,fp_path,[1,2,3])
+        self.assertRaises(ValueError,fp_path,[1,2],'l?')
+
     def test_AsciiBase85Encode(self):
         from _rl_accel import _AsciiBase85Encode
         assert _AsciiBase85Encode('Dragan Andric')=='6ul^K@;[2RDIdd%@f~>'